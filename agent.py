@@ -1,159 +1,108 @@
-from langgraph.graph import StateGraph, START,END
-from utils.state import AgentState
-from utils.tools import tool_node
-from langchain_core.messages import SystemMessage
 from utils.logger import ExperimentLogger
-from utils.llm import host_llm, player_llm
-from utils.tools import host_tools, player_tools
-from utils.node import GameAgentNode
-import copy
+from utils.metrics import GameMetrics, process_metrics
+from utils.runtime import GameRuntime, is_correct_guess
+from utils.validation import NodeOrderValidator
+from utils.streaming import SECRET_TOOLS
+import time
 
 class Game:
-    def __init__(self, system_prompt, game_id):
-        self.logger = ExperimentLogger(game_id=game_id)
+    def __init__(self, system_prompt, game_id, verbose=True, runtime=None, host_mode="llm",
+                 player_mode="tools", player_context="full", context_window=4,
+                 digest_questions=20, log_level="info", log_format="text", seed=None, checkpointer=None,
+                 player_speculation=False, player_knowledge=None, topic=None, stream_sink=None):
+        start = time.perf_counter()
+        self.game_id = game_id
+        self.logger = ExperimentLogger(game_id=game_id, level=log_level, log_format=log_format)
         self.max_questions = 20
+        # "llm": the host LLM picks the tool, "direct": the tool call is built from task_for_host
+        self.host_mode = host_mode
+        # "tools": the player LLM picks a tool which writes the text, "fused": one structured call does both,
+        # "human": the player's moves come from outside, turn by turn through aplay_turn (see server.py)
+        if player_mode == "human" and checkpointer is None:
+            raise ValueError("player_mode='human' needs a checkpointer to pause the game between the moves")
+        self.player_mode = player_mode
+        # generate the fused player's next action for both answers YES and NO while the host is answering
+        if player_speculation and player_mode != "fused":
+            raise ValueError("player_speculation needs player_mode='fused'")
+        self.player_speculation = player_speculation
+        # path of a knowledge base (utils/knowledge.py) picking the player's questions and guesses without the LLM
+        # while the topic can be one of its concepts
+        self.player_knowledge = player_knowledge
+        # a preset topic, e.g. from a utils.topics.TopicScheduler: the host doesn't generate one and the player starts
+        self.topic = topic
+        # "full": the player sees the whole chat history, "digest": the last digest_questions questions with
+        # their answers, the wrong guesses and the last context_window messages
+        self.player_context = player_context
+        self.context_window = context_window
+        self.digest_questions = digest_questions
+        # a seeded game sends the same prompts every time it is played, so that it can be replayed from a cassette
+        self.seed = seed
+        # with a checkpointer (utils/checkpoint.py) the state is saved after every step, and a game_id
+        # with a saved state continues from it
+        self.checkpointer = checkpointer
+        self.resumed = False
+        self.verbose = verbose
+        # a utils.streaming.StreamSink receiving the tokens of the LLM calls as they arrive, it replaces the
+        # printing of verbose
+        self.stream_sink = stream_sink
+        # the role and tool of the tool call running, the source of the streamed tokens of the tool node
+        self._tool_call = None
+        self._turn_start = None
+        self._first_token = None
         self.dialogs = []
-        self.updated_nodes = []
+        self.node_validator = NodeOrderValidator(self.logger)
+        self.state = {}
+        # the player's turn a human game is waiting for, see aplay_turn
+        self.pending = None
+        self.app = None
+        self.metrics = GameMetrics()
+        self.wall_time = 0.0
 
         self.host_system_prompt = system_prompt["host"]
         self.player_system_prompt = system_prompt["player"]
-        
-    def _create_app(self):
-        # create agent node
-        host_node = GameAgentNode(
-            llm=host_llm,
-            tools=host_tools,
-            role="host", 
-            system_prompt=self.host_system_prompt, 
-            logger=self.logger
-        ).create_node()
-        
-        player_node = GameAgentNode(
-            llm=player_llm,
-            tools=player_tools,
-            role="player", 
-            system_prompt=self.player_system_prompt, 
-            logger=self.logger
-        ).create_node()
-
-        # Create the graph  
-        workflow = StateGraph(AgentState)
-
-       # Add nodes to the graph
-        workflow.add_node("host", host_node)
-        workflow.add_node("player", player_node)
-        workflow.add_node("call_tool", tool_node)
-
-        # add conditional edges for host, player and call_tool
-        workflow.add_conditional_edges(
-            "host", 
-            self._router, 
-            {"continue": "player", "call_tool": "call_tool", "end": END}
-        )
-
-        workflow.add_conditional_edges(
-            "player", 
-            self._router, 
-            {"continue": "host", "call_tool": "call_tool", "end": END}
-        )
-
-        workflow.add_conditional_edges(
-            "call_tool",
-            lambda x: x["sender"],
-            {
-                "host": "host",
-                "player": "player",
-                },
-            ) 
-        
-        # Set the entry point
-        workflow.add_edge(START, "host")
-
-        # Compile the graph
-        self.app = workflow.compile()
-        self.app.get_graph().draw_mermaid_png(output_file_path="agent.png")
-
-    def _correct_tool_call(self, state):
-        """
-        This function is used to call the correct tool with the correct arguments.
-
-        -- arguments:
-            state: the state of the agent
-
-        """
 
-        # if there are multiple tool calls, only keep the first one
-        if len(state["messages"][-1].tool_calls) > 1:
-            self.logger.log(f"multiple tool calls: {state['messages'][-1].tool_calls}")
-            state["messages"][-1].tool_calls = [state["messages"][-1].tool_calls[0]]
-
-        # fix host tool call
-        last_tool_call = copy.deepcopy(state["messages"][-1].tool_calls[0])
-        task_for_host = state["task_for_host"]
-
-        # fix the host's tool call if the host called the wrong tool for "answer_question" and "check_guess"
-        if last_tool_call["name"] == "check_guess" and \
-                task_for_host == "answer_question":
-            
-            state["messages"][-1].tool_calls[0]["name"] = task_for_host
-            state["messages"][-1].tool_calls[0]["args"] = {
-                "topic": state["topic"],
-                "question": state["most_recent_question"],
-                "task_for_host": task_for_host,
-            }
-            self.logger.log(f"fixed tool call: {state['messages'][-1].tool_calls[0]}")
-        
-        # fix the host's tool call if the host uses the wrong argument for "check_guess"
-        elif last_tool_call["name"] == "check_guess" and \
-                task_for_host == "check_guess":
-            if last_tool_call["args"]["topic"] != state["topic"] or \
-                    last_tool_call["args"]["guess"] != state["guess"]:
-                
-                state["messages"][-1].tool_calls[0]["args"]["topic"] = state["topic"]
-                state["messages"][-1].tool_calls[0]["args"]["guess"] = state["guess"]
-                self.logger.log(f"fixed tool call args from {last_tool_call['args']} to {state['messages'][-1].tool_calls[0]['args']} for check_guess")
-        
-        # fix the host's tool call if the host uses the wrong argument for "answer_question"
-        elif last_tool_call["name"] == "answer_question":
-            if last_tool_call["args"]["topic"] != state["topic"]:
-                state["messages"][-1].tool_calls[0]["args"]["topic"] = state["topic"]
-                self.logger.log(f"fixed tool call args from {last_tool_call['args']} to {state['messages'][-1].tool_calls[0]['args']} for answer_question")
-        else:
-            pass
+        # games share a runtime, so the graph, agents and LLM clients are not rebuilt per game
+        self.runtime = runtime
+        self.setup_time = time.perf_counter() - start
 
-    def _router(self, state):
-        """
-        The router function is used to route the state to the correct agent node and tool node.
+    def _create_app(self):
+        start = time.perf_counter()
+        if self.runtime is None:
+            self.runtime = GameRuntime.get({
+                "host": self.host_system_prompt,
+                "player": self.player_system_prompt,
+            })
+        self.app = self.runtime.app if self.checkpointer is None else self.runtime.checkpointed_app(self.checkpointer)
+        self.setup_time += time.perf_counter() - start
+        self.logger.event("game_setup", setup_time_ms=round(self.setup_time * 1000, 3))
 
-        -- arguments:
-            state: the state of the agent
-        """
+    def _config(self):
+        return {
+            "recursion_limit": 200,
+            "callbacks": [self.metrics],
+            "configurable": {
+                "game_id": str(self.game_id),
+                # the checkpoints of a game are saved under its game_id
+                "thread_id": str(self.game_id),
+                "logger": self.logger,
+                "max_questions": self.max_questions,
+                "host_mode": self.host_mode,
+                "player_mode": self.player_mode,
+                "player_speculation": self.player_speculation,
+                "player_knowledge": self.player_knowledge,
+                "player_context": self.player_context,
+                "context_window": self.context_window,
+                "digest_questions": self.digest_questions,
+                "seed": self.seed,
+            },
+        }
 
-        # if the player has asked 20 questions and the host has answered 20 questions, go to end
-        if state["num_questions_asked"] >= self.max_questions and state["num_questions_answered"] >= self.max_questions:
-            self.logger.log("="*100)
-            self.logger.log(f"Questions asked and answered: {self.max_questions} and game ends for topic: {state['topic']}")
-            return "end"
-
-        # if there is a tool call, correct the tool call with the accurate tool name and arguments before calling the tool
-        last_message = state["messages"][-1]
-        if last_message.tool_calls:
-            self.logger.log(f"tool call: {last_message.tool_calls}")
-            self._correct_tool_call(state)
-            return "call_tool"
-        
-        # if the player's guess matches the topic, go to end
-        if state["guess"].lower() == state["topic"].lower():
-            self.logger.log("="*100)
-            self.logger.log(f"Guess matches topic: {state['topic']} and game ends")
-            return "end"
-        
-        return "continue"
+    def _initial_state(self):
+        # imported with the first game, importing the module stays cheap for the CLIs
+        from langchain_core.messages import SystemMessage, AIMessage
+        from utils.node import TOPIC_SET_MESSAGE
 
-    def run(self):
-        self._create_app()
-        events = self.app.stream(
-        {
+        state = {
             "messages": [
                 SystemMessage(
                     content="Let's play a game of 20 questions"
@@ -165,33 +114,289 @@ class Game:
             "guess": "",
             "task_for_host": "generate_topic",
             "most_recent_question": "",
-        },
-        {"recursion_limit": 200},
-            stream_mode="updates"
-        )
-        for event in events:
-            self.logger.log("*"*100) 
-            for node, values in event.items():
-                self.logger.log(f"update node: {node} and update: {values}")
-                self.updated_nodes.append(node)
-
-                # simply print the player's and host's messages for demo
-                if node == "player" or node == "host":
-                    if len(values["messages"][-1].content) > 0:
-                        print (f"{node}: {values['messages'][-1].content}")
-                        self.dialogs.append(f"{node}: {values['messages'][-1].content}")
-            
-            self.logger.validate_updated_nodes(self.updated_nodes)
+            "player_response": "",
+        }
+        if self.topic:
+            # the state after the host's first turn, the graph goes straight to the player
+            state["messages"].append(AIMessage(content=TOPIC_SET_MESSAGE, name="host"))
+            state.update(topic=self.topic, task_for_host="answer_question", sender="host")
+            self.state.update({k: v for k, v in state.items() if k != "messages"})
+            self.dialogs.append(f"host: {TOPIC_SET_MESSAGE}")
+            self.node_validator.resume("player")
+        return state
+
+    def _input(self, snapshot):
+        """
+        The input of the graph: the initial state, or None to continue from the saved state of a resumed game.
+
+        -- arguments:
+            snapshot: the saved state of the game from get_state, None without a checkpointer
+        """
+        if snapshot is None:
+            return self._initial_state()
+        self.checkpointer.start_game(str(self.game_id), self.seed)
+        if not snapshot.values:
+            return self._initial_state()
+
+        self.resumed = True
+        self.state.update({k: v for k, v in snapshot.values.items() if k != "messages"})
+        self.dialogs = [f"{m.name}: {m.content}" for m in snapshot.values["messages"]
+                        if m.name in ("host", "player") and m.content]
+        if snapshot.next:
+            self.node_validator.resume(snapshot.next[0])
+        self.logger.event("game_resumed", turns=self.state.get("num_questions_asked", 0), next=list(snapshot.next))
+        return None
+
+    def _save_outcome(self, error, abandoned=False):
+        if self.checkpointer is None:
+            return
+        if abandoned:
+            self.checkpointer.abandon_game(str(self.game_id), error)
+        elif error is None:
+            self.checkpointer.finish_game(str(self.game_id), self.result())
+        else:
+            self.checkpointer.fail_game(str(self.game_id), error)
+
+    def _stream_mode(self):
+        return ["updates", "messages"] if self.stream_sink else "updates"
+
+    def _handle_event(self, event):
+        if self.stream_sink:
+            mode, event = event
+            if mode == "messages":
+                self._handle_token(*event)
+                return
+
+        self.logger.log("*"*100)
+        for node, values in event.items():
+            if node == "__interrupt__":
+                # the human player's turn, the run stops here until aplay_turn resumes it
+                self.pending = values[0].value
+                continue
+            self.logger.log("update node: %s and update: %s", node, values)
+            self.node_validator.update(node)
+            self.state.update({k: v for k, v in values.items() if k != "messages"})
+
+            # simply print the player's and host's messages for demo
+            if node == "player" or node == "host":
+                last_message = values["messages"][-1]
+                self._tool_call = (node, last_message.tool_calls[0]["name"]) if last_message.tool_calls else None
+                if len(last_message.content) > 0:
+                    if self.stream_sink:
+                        self._streamed_message(node, last_message.content)
+                    elif self.verbose:
+                        print (f"{node}: {last_message.content}")
+                    self.dialogs.append(f"{node}: {last_message.content}")
+
+    def _handle_token(self, chunk, metadata):
+        """
+        Send a streamed chunk of an LLM call to the sink. The whole messages are sent with the updates of
+        the nodes, and the tokens of the speculations and of the secret tools are not shown.
+        """
+        if chunk.type != "AIMessageChunk" or not isinstance(chunk.content, str) or not chunk.content:
+            return
+        if metadata.get("metrics_source") == "speculation":
+            return
+        node = metadata.get("langgraph_node")
+        if node == "call_tool":
+            if self._tool_call is None or self._tool_call[1] in SECRET_TOOLS:
+                return
+            role, source = self._tool_call
+        else:
+            role, source = node, node
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+        self.stream_sink.token(role, source, chunk.content)
 
+    def _streamed_message(self, role, content):
+        now = time.perf_counter()
+        if self._turn_start is not None:
+            first_token = self._first_token or now
+            self.logger.event("streamed_message", role=role,
+                              first_token_ms=round((first_token - self._turn_start) * 1000, 3),
+                              message_ms=round((now - self._turn_start) * 1000, 3))
+        self._turn_start = now
+        self._first_token = None
+        self.stream_sink.message(role, content)
+
+    def _log_dialogs(self):
         self.logger.log("="*100)
         for dialog in self.dialogs:
             self.logger.log(dialog)
 
+    def result(self):
+        """
+        Summary of the game used by the tournament runner.
+        """
+        topic = self.state.get("topic", "")
+        return {
+            "game_id": str(self.game_id),
+            "topic": topic,
+            "seed": self.seed,
+            "win": bool(topic) and is_correct_guess(self.state.get("guess", ""), topic),
+            "turns": self.state.get("num_questions_asked", 0),
+            "llm_calls": self.metrics.llm_calls,
+            "wall_time": self.wall_time,
+            "setup_time": self.setup_time,
+            "node_order_violations": self.node_validator.violations,
+            "resumed": self.resumed,
+            "metrics": self.metrics.snapshot(),
+        }
+
+    def _finish(self, error, abandoned=False):
+        self.runtime.release_game(str(self.game_id))
+        self.node_validator.finish()
+        process_metrics.record_game(str(self.game_id), self.metrics.snapshot())
+        self.logger.event("game_result", **self.result())
+        self._save_outcome(error, abandoned)
+        self.logger.close()
+
+    def _check_not_human(self):
+        if self.player_mode == "human":
+            raise ValueError("a game with a human player is played turn by turn with aplay_turn")
+
+    def run(self):
+        self._check_not_human()
+        start = time.perf_counter()
+        self._create_app()
+        config = self._config()
+        snapshot = self.app.get_state(config) if self.checkpointer else None
+        self._turn_start = time.perf_counter()
+        events = self.app.stream(
+            self._input(snapshot),
+            config,
+            stream_mode=self._stream_mode()
+        )
+        error = None
+        try:
+            for event in events:
+                self._handle_event(event)
+            self._log_dialogs()
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            self.wall_time = time.perf_counter() - start
+            self._finish(error)
+
+        return self.result()
+
+    async def arun(self):
+        """
+        Async version of run. The graph is driven by astream, so the node callables and tools
+        run their async implementations and every LLM round-trip awaits ainvoke instead of
+        blocking a thread.
+        """
+        self._check_not_human()
+        start = time.perf_counter()
+        self._create_app()
+        config = self._config()
+        snapshot = await self.app.aget_state(config) if self.checkpointer else None
+        self._turn_start = time.perf_counter()
+        events = self.app.astream(
+            self._input(snapshot),
+            config,
+            stream_mode=self._stream_mode()
+        )
+        error = None
+        try:
+            async for event in events:
+                self._handle_event(event)
+            self._log_dialogs()
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            self.wall_time = time.perf_counter() - start
+            self._finish(error)
+
+        return self.result()
+
+    async def aplay_turn(self, move=None):
+        """
+        Play a game with player_mode "human" up to the player's next turn or the end of the game. The first
+        call starts the game, every next call resumes it with the player's move. wall_time only counts the
+        time spent in the graph, not the time the game waited for the player.
+
+        -- arguments:
+            move: {"action": "generate_question" or "make_guess", "content": the question or the guess}
+
+        -- returns:
+            the player's turn the game waits for (see GameAgentNode.handle_human_message), None once it is over
+        """
+        from langgraph.types import Command
+
+        start = time.perf_counter()
+        if self.app is None:
+            self._create_app()
+            config = self._config()
+            graph_input = self._input(await self.app.aget_state(config))
+        elif self.pending is None:
+            raise ValueError("the game is over")
+        else:
+            config = self._config()
+            graph_input = Command(resume=move)
+
+        self.pending = None
+        error = None
+        try:
+            async for event in self.app.astream(graph_input, config, stream_mode=self._stream_mode()):
+                self._handle_event(event)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            self.wall_time += time.perf_counter() - start
+            if error is not None or self.pending is None:
+                self._log_dialogs()
+                self._finish(error)
+        return self.pending
+
+    def suspend(self):
+        """
+        Drop what the process keeps for a human game waiting for its player, e.g. a parked session of the
+        server. Its state stays in the checkpointer: a new Game with the same game_id continues it.
+        """
+        if self.runtime is not None:
+            self.runtime.release_game(str(self.game_id))
+        self.logger.close()
+
+    def abandon(self, reason="abandoned"):
+        """ End a human game which is not played to the end, e.g. an idle session of the server, and drop its saved state """
+        if self.app is None:
+            self.logger.close()
+            return
+        self.pending = None
+        self._finish(reason, abandoned=True)
+
 
 if __name__ == "__main__":
+    import argparse
     import uuid
     import yaml
+    from utils.checkpoint import SQLiteCheckpointer
+    from utils.streaming import ConsoleSink
+
+    parser = argparse.ArgumentParser(description="Play a game of 20 questions")
+    parser.add_argument("--draw", action="store_true", help="render the graph to agent.png")
+    parser.add_argument("--seed", default=None, help="seed of the game, to record it to a cassette and replay it")
+    parser.add_argument("--checkpoint", default=None, help="SQLite file saving the game after every step")
+    parser.add_argument("--game-id", default=None, help="id of the game, give the id of an unfinished game to resume it")
+    parser.add_argument("--stream", action="store_true", help="print the host's and the player's text as it is generated")
+    args = parser.parse_args()
+
     system_prompt = yaml.safe_load(open("system_prompts.yaml"))
-    game_id  = uuid.uuid4()
-    game = Game(system_prompt, game_id)
-    game.run()
\ No newline at end of file
+    if args.draw:
+        GameRuntime.get(system_prompt).draw_graph("agent.png")
+    game_id = args.game_id or uuid.uuid4()
+    checkpointer = SQLiteCheckpointer(args.checkpoint) if args.checkpoint else None
+    game = Game(system_prompt, game_id, seed=args.seed, checkpointer=checkpointer,
+                stream_sink=ConsoleSink() if args.stream else None)
+    try:
+        if checkpointer and checkpointer.game_status(str(game_id))[0] == "finished":
+            print(f"game {game_id} is already finished")
+        else:
+            game.run()
+    finally:
+        if checkpointer:
+            checkpointer.close()
@@ -0,0 +1,491 @@
+"""
+Local game server: many concurrent 20 questions sessions in one process, all played on one shared
+GameRuntime. A person or an external bot plays the player over HTTP: the graph is interrupted at every
+player's turn (player_mode "human") and resumed with the next move, while the host is played by the LLM.
+
+    python -m server --port 8080
+
+    POST   /sessions                 {"player": "human"}                                    -> 201 the session
+    GET    /sessions/<id>                                                                  -> the session
+    POST   /sessions/<id>/moves      {"action": "generate_question", "content": "Is it alive?"} -> the session
+    POST   /sessions/<id>/moves      {"action": "make_guess", "content": "horse"}          -> the session
+    DELETE /sessions/<id>                                                                  -> 204
+    GET    /stats
+
+A session is a JSON object with its status ("playing", "finished" or "failed"), the messages of the host
+and the player, the number of questions left and, once finished, the result. "player" can also be "tools"
+or "fused" for a self-play session: it is played in the background, the client polls GET /sessions/<id>
+until it is finished. "topic" presets the topic.
+
+After park_after seconds without a request, a session waiting for its player is parked: the checkpointer
+writes its state to the SQLite file, and the session drops its Game and the views the nodes keep for it,
+only its id stays in memory. The next request rebuilds the Game from the file. After idle_timeout
+seconds the sessions are abandoned. The server answers 503 when max_sessions sessions are open or more than
+max_waiting moves wait for one of the max_running turns played at the same time.
+"""
+from collections import OrderedDict
+from http import HTTPStatus
+import asyncio
+import json
+import time
+import uuid
+
+from agent import Game
+from utils.runtime import GameRuntime
+
+PLAYER_MODES = ("human", "tools", "fused")
+PLAYER_ACTIONS = ("generate_question", "make_guess")
+
+
+class ServerError(Exception):
+    """ An error answered to the client with its HTTP status """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Session:
+    """ A game played through the server, with the bookkeeping of the session store """
+    __slots__ = ("id", "game", "task", "error", "last_used", "busy")
+
+    def __init__(self, session_id, game):
+        self.id = session_id
+        # None while the session is parked
+        self.game = game
+        # the background task playing a self-play session, and the error it failed with
+        self.task = None
+        self.error = None
+        self.last_used = time.monotonic()
+        # a move is being played, the next one has to wait for its answer
+        self.busy = False
+
+    @property
+    def parked(self):
+        # the game's state is only in the checkpointer's file
+        return self.game is None
+
+    @property
+    def finished(self):
+        return (not self.busy and self.error is None and self.game is not None
+                and self.game.app is not None and self.game.pending is None)
+
+    def view(self):
+        game = self.game
+        messages = []
+        for dialog in game.dialogs:
+            role, _, content = dialog.partition(": ")
+            messages.append({"role": role, "content": content})
+        asked = game.state.get("num_questions_asked", 0)
+        view = {
+            "session_id": self.id,
+            "status": "failed" if self.error else "finished" if self.finished else "playing",
+            "player": game.player_mode,
+            "messages": messages,
+            "questions_asked": asked,
+            "questions_left": game.max_questions - asked,
+        }
+        if self.finished:
+            result = game.result()
+            view["result"] = {"win": result["win"], "topic": result["topic"], "turns": result["turns"]}
+        if self.error:
+            view["error"] = self.error
+        return view
+
+
+class GameServer:
+    """
+    The sessions of one process and the HTTP server playing them.
+
+    -- arguments:
+        system_prompt: the system prompts of the host and the player
+        checkpointer: the SQLiteCheckpointer keeping the games between the moves
+        max_sessions: the maximum number of open sessions, new sessions are refused beyond
+        idle_timeout: seconds without a request after which a session is abandoned
+        park_after: seconds without a request after which a session's state is moved to the checkpointer's file
+        max_running: the maximum number of turns played at the same time
+        max_waiting: the maximum number of moves waiting for a turn, further moves are refused
+        sweep_interval: seconds between two sweeps of the idle sessions
+        game_options: keyword arguments of Game, {"host_mode": "direct", "log_level": "warning"} by default
+    """
+
+    def __init__(self, system_prompt, checkpointer, max_sessions=10_000, idle_timeout=600.0, park_after=30.0,
+                 max_running=64, max_waiting=1024, sweep_interval=5.0, game_options=None):
+        self.system_prompt = system_prompt
+        self.runtime = GameRuntime.get(system_prompt)
+        self.checkpointer = checkpointer
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.park_after = park_after
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.sweep_interval = sweep_interval
+        self.game_options = {"host_mode": "direct", "log_level": "warning", **(game_options or {})}
+        # max size of a request's body in bytes
+        self.max_body = 64 * 1024
+
+        # session_id -> Session, the least recently used first
+        self.sessions = OrderedDict()
+        self.counts = dict.fromkeys(("created", "finished", "failed", "abandoned", "evicted", "parked", "rejected"), 0)
+        self._running = None
+        self._active = 0
+        self._waiting = 0
+        self._server = None
+        self._sweeper = None
+        self.port = None
+
+    # ---- sessions
+
+    async def create_session(self, options):
+        if not isinstance(options, dict):
+            raise ServerError(400, "the body must be a JSON object")
+        player = options.get("player", "human")
+        if player not in PLAYER_MODES:
+            raise ServerError(400, f"player must be one of {', '.join(PLAYER_MODES)}")
+        topic = options.get("topic")
+        if topic is not None and (not isinstance(topic, str) or not topic.strip()):
+            raise ServerError(400, "topic must be a non-empty string")
+        if len(self.sessions) >= self.max_sessions:
+            self.counts["rejected"] += 1
+            raise ServerError(503, "too many open sessions, retry later")
+
+        session_id = uuid.uuid4().hex
+        game = self._new_game(session_id, player, topic and topic.strip())
+        session = Session(session_id, game)
+        try:
+            self._reserve(session)
+        except ServerError:
+            # refused before the game started
+            game.abandon("refused")
+            raise
+        self.sessions[session_id] = session
+        self.counts["created"] += 1
+        if player == "human":
+            await self._play_reserved(session)
+        else:
+            session.task = asyncio.create_task(self._self_play(session))
+        return session
+
+    def _new_game(self, session_id, player="human", topic=None):
+        """ The Game of a session, a human game with the id of a parked session continues from the checkpointer """
+        return Game(self.system_prompt, session_id, verbose=False, runtime=self.runtime, checkpointer=self.checkpointer,
+                    player_mode=player, topic=topic, **self.game_options)
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ServerError(404, f"no session {session_id}")
+        session.last_used = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    async def open_session(self, session_id):
+        """ The session, with its Game rebuilt from the checkpointer if it was parked """
+        session = self.get_session(session_id)
+        if session.parked:
+            session.game = self._new_game(session_id)
+            try:
+                # the graph continues from the saved state and stops at the player's turn again, without an LLM call
+                await self._play(session)
+            except BaseException:
+                # not resumed, e.g. refused with a 503: the session stays parked so that the next request resumes it
+                game, session.game = session.game, None
+                game.suspend()
+                raise
+        return session
+
+    async def play_move(self, session_id, move):
+        session = await self.open_session(session_id)
+        if session.error or session.finished:
+            raise ServerError(409, "the game is over")
+        if session.busy:
+            raise ServerError(409, "the previous move is still being played")
+        if not isinstance(move, dict) or move.get("action") not in PLAYER_ACTIONS:
+            raise ServerError(400, f"action must be one of {', '.join(PLAYER_ACTIONS)}")
+        content = move.get("content")
+        if not isinstance(content, str) or not content.strip() or len(content) > 500:
+            raise ServerError(400, "content must be the question or the guess, at most 500 characters")
+        await self._play(session, {"action": move["action"], "content": content.strip()})
+        return session
+
+    def end_session(self, session_id, reason="ended by the client"):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise ServerError(404, f"no session {session_id}")
+        self._close_session(session, reason)
+
+    def _close_session(self, session, reason):
+        if session.error:
+            self.counts["failed"] += 1
+        elif session.finished:
+            self.counts["finished"] += 1
+        elif session.parked:
+            self.checkpointer.abandon_game(session.id, reason)
+            self.counts["abandoned"] += 1
+        else:
+            session.game.abandon(reason)
+            self.counts["abandoned"] += 1
+
+    def _reserve(self, session):
+        """ Queue the session's next turn for one of the max_running turns, or refuse it when the queue is full """
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_running)
+        if self._running.locked() and self._waiting >= self.max_waiting:
+            self.counts["rejected"] += 1
+            raise ServerError(503, "the server is busy, retry later")
+        session.busy = True
+        self._waiting += 1
+
+    async def _play(self, session, move=None):
+        """ Play the session's next turn once one of the max_running turns is free """
+        self._reserve(session)
+        await self._play_reserved(session, move)
+
+    async def _play_reserved(self, session, move=None):
+        """ Play the turn queued by _reserve, a game that fails ends its session """
+        try:
+            await self._run_turn(session, move)
+        except Exception as e:
+            # the game has failed and saved its state, the session is gone
+            self.sessions.pop(session.id, None)
+            raise ServerError(500, f"the game failed: {e!r}")
+
+    async def _self_play(self, session):
+        """ Play a self-play session to the end, its client polls the session meanwhile """
+        try:
+            await self._run_turn(session)
+        except asyncio.CancelledError:
+            session.error = "the server closed"
+            raise
+        except Exception as e:
+            # the game has failed and saved its state, the session shows the error until it is swept
+            session.error = f"the game failed: {e!r}"
+
+    async def _run_turn(self, session, move=None):
+        """ Play the session's turn queued by _reserve once one of the max_running turns is free """
+        try:
+            await self._running.acquire()
+        except BaseException:
+            session.busy = False
+            raise
+        finally:
+            self._waiting -= 1
+        self._active += 1
+        try:
+            await session.game.aplay_turn(move)
+        finally:
+            self._active -= 1
+            self._running.release()
+            session.busy = False
+            session.last_used = time.monotonic()
+            if session.id in self.sessions:
+                self.sessions.move_to_end(session.id)
+
+    def sweep(self, now=None):
+        """
+        Close the sessions idle for idle_timeout seconds and the finished ones idle for park_after seconds,
+        and return the sessions to park: those waiting for their player for park_after seconds
+        """
+        now = time.monotonic() if now is None else now
+        expired, idle = [], []
+        for session in self.sessions.values():
+            idle_time = now - session.last_used
+            if idle_time < self.park_after:
+                break
+            if session.busy:
+                continue
+            if idle_time >= self.idle_timeout or session.finished or session.error:
+                expired.append(session)
+            elif not session.parked:
+                idle.append(session)
+
+        for session in expired:
+            del self.sessions[session.id]
+            if not (session.finished or session.error):
+                self.counts["evicted"] += 1
+            self._close_session(session, "idle timeout")
+        return idle
+
+    async def park(self, sessions):
+        """ Move the state of the sessions to the checkpointer's file, in one write, and drop their games """
+        if not sessions:
+            return
+        await asyncio.to_thread(self.checkpointer.unload, [session.id for session in sessions])
+        for session in sessions:
+            # a session playing a move, or closed, while the file was written keeps its game
+            if session.busy or session.parked or session.id not in self.sessions:
+                continue
+            session.game.suspend()
+            session.game = None
+            self.counts["parked"] += 1
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.park(self.sweep())
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "parked": sum(session.parked for session in self.sessions.values()),
+            "running": self._active,
+            "waiting": self._waiting,
+            **self.counts,
+        }
+
+    # ---- HTTP
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """ Stop serving and abandon the open sessions """
+        if self._sweeper:
+            self._sweeper.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        tasks = [session.task for session in self.sessions.values() if session.task and not session.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while self.sessions:
+            _, session = self.sessions.popitem(last=False)
+            self._close_session(session, "server closed")
+        self.runtime.close()
+
+    async def _read_request(self, reader):
+        """ The next (method, path, headers, body) of the connection, None once the client closes it """
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, path, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise ServerError(400, "bad request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= 100:
+                raise ServerError(431, "too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get("content-length") or "0"
+        if not (length.isascii() and length.isdigit()):
+            raise ServerError(400, "Content-Length must be a non-negative integer")
+        length = int(length)
+        if length > self.max_body:
+            raise ServerError(413, "the body is too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, headers, body
+
+    async def _dispatch(self, method, path, body):
+        """ Route a request, return (status, JSON payload or None) """
+        parts = path.split("?", 1)[0].strip("/").split("/")
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise ServerError(400, "the body is not valid JSON")
+
+        if parts == ["sessions"] and method == "POST":
+            return 201, (await self.create_session(data)).view()
+        if parts == ["stats"] and method == "GET":
+            return 200, self.stats()
+        if len(parts) == 2 and parts[0] == "sessions":
+            if method == "GET":
+                return 200, (await self.open_session(parts[1])).view()
+            if method == "DELETE":
+                self.end_session(parts[1])
+                return 204, None
+            raise ServerError(405, f"{method} is not allowed on a session")
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "moves":
+            if method != "POST":
+                raise ServerError(405, "moves are posted")
+            return 200, (await self.play_move(parts[1], data)).view()
+        raise ServerError(404, f"no route {method} {path}")
+
+    @staticmethod
+    def _response(status, payload, keep_alive):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Length: {len(body)}",
+                "Connection: " + ("keep-alive" if keep_alive else "close")]
+        if payload is not None:
+            head.append("Content-Type: application/json")
+        if status == 503:
+            head.append("Retry-After: 1")
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = await self._dispatch(method, path, body)
+                except ServerError as e:
+                    status, payload = e.status, {"error": e.message}
+                writer.write(self._response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(system_prompt, checkpointer, host="127.0.0.1", port=8080, **options):
+    server = GameServer(system_prompt, checkpointer, **options)
+    await server.start(host, port)
+    print(f"serving 20 questions sessions on http://{host}:{server.port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+    from utils.checkpoint import SQLiteCheckpointer
+
+    parser = argparse.ArgumentParser(description="Serve 20 questions sessions with a human or bot player over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--prompts", default="system_prompts.yaml", help="path to the system prompts")
+    parser.add_argument("--checkpoint", default="checkpoints/sessions.sqlite",
+                        help="SQLite file keeping the games between the moves")
+    parser.add_argument("--max-sessions", type=int, default=10_000, help="maximum number of open sessions")
+    parser.add_argument("--idle-timeout", type=float, default=600, help="seconds after which an idle session is abandoned")
+    parser.add_argument("--park-after", type=float, default=30,
+                        help="seconds after which an idle session's state is moved from memory to the SQLite file")
+    parser.add_argument("--max-running", type=int, default=64, help="maximum number of turns played at the same time")
+    parser.add_argument("--max-waiting", type=int, default=1024, help="maximum number of moves waiting for a turn")
+    parser.add_argument("--host-mode", choices=["llm", "direct"], default="direct",
+                        help="direct builds the host's tool call from the game state instead of asking the host LLM")
+    parser.add_argument("--log-level", choices=["debug", "info", "warning", "error"], default="warning",
+                        help="level of the game logs")
+    args = parser.parse_args()
+
+    system_prompt = yaml.safe_load(open(args.prompts))
+    with SQLiteCheckpointer(args.checkpoint) as checkpointer:
+        try:
+            asyncio.run(serve(
+                system_prompt, checkpointer, args.host, args.port, max_sessions=args.max_sessions,
+                idle_timeout=args.idle_timeout, park_after=args.park_after, max_running=args.max_running,
+                max_waiting=args.max_waiting, game_options={"host_mode": args.host_mode, "log_level": args.log_level},
+            ))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,162 @@
+import unittest
+import sys
+import os
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import gc
+import weakref
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.prompts import PromptTemplate
+from utils.batching import BatchingExecutor, enable_batching, disable_batching, aclose_batching, invoke_chain, ainvoke_chain
+from utils.fake_llm import FakeChatModel
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ANSWER_PROMPT = PromptTemplate.from_template("You are a host of 20 questions game. You already come up with a secret "
+                                             "topic given as {topic}.\nThe question is given as {question}.\n")
+
+
+class EchoLLM:
+    """ Answers every prompt with its upper case and records the batch sizes """
+    def __init__(self):
+        self.batch_sizes = []
+
+    def batch(self, inputs, configs=None, return_exceptions=False):
+        self.batch_sizes.append(len(inputs))
+        return [ValueError(p) if p == "fail" else p.upper() for p in inputs]
+
+    async def abatch(self, inputs, configs=None, return_exceptions=False):
+        return self.batch(inputs, configs, return_exceptions)
+
+
+class TestBatchingExecutor(unittest.TestCase):
+
+    def test_threads_are_batched(self):
+        llm = EchoLLM()
+        executor = BatchingExecutor(llm, max_batch_size=4, max_wait=0.2)
+        results = {}
+
+        def call(i):
+            results[i] = executor.invoke(f"prompt {i}")
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: f"PROMPT {i}" for i in range(8)})
+        self.assertLess(len(llm.batch_sizes), 8)
+        self.assertTrue(all(size <= 4 for size in llm.batch_sizes))
+        stats = executor.stats()
+        self.assertEqual(stats["requests"], 8)
+        self.assertEqual(sum(size * n for size, n in stats["batch_sizes"].items()), 8)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_async_calls_are_batched(self):
+        llm = EchoLLM()
+        executor = BatchingExecutor(llm, max_batch_size=16, max_wait=0.05)
+
+        async def main():
+            return await asyncio.gather(*(executor.ainvoke(f"prompt {i}") for i in range(10)))
+
+        self.assertEqual(asyncio.run(main()), [f"PROMPT {i}" for i in range(10)])
+        self.assertEqual(llm.batch_sizes, [10])
+
+    def test_errors_go_to_their_caller(self):
+        executor = BatchingExecutor(EchoLLM(), max_batch_size=2, max_wait=0.05)
+
+        async def main():
+            return await asyncio.gather(executor.ainvoke("ok"), executor.ainvoke("fail"), return_exceptions=True)
+
+        ok, failed = asyncio.run(main())
+        self.assertEqual(ok, "OK")
+        self.assertIsInstance(failed, ValueError)
+
+    def test_finished_loops_are_let_go(self):
+        executor = BatchingExecutor(EchoLLM(), max_batch_size=4, max_wait=0.01)
+        loops = []
+
+        async def main():
+            loops.append(weakref.ref(asyncio.get_running_loop()))
+            return await executor.ainvoke("prompt")
+
+        for _ in range(3):
+            self.assertEqual(asyncio.run(main()), "PROMPT")
+        gc.collect()
+        self.assertEqual(executor._async_collectors, {})
+        self.assertEqual([loop() for loop in loops], [None] * 3)
+
+
+class TestBatchedChain(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = FakeChatModel()
+        self.chain = ANSWER_PROMPT | self.llm
+        self.inputs = [{"topic": topic, "question": "Does it bark?"} for topic in ["dog", "cat", "piano", "horse"] * 2]
+        self.expected = [self.chain.invoke(inputs).content for inputs in self.inputs]
+        self.executor, = enable_batching([self.llm], max_batch_size=4, max_wait=0.2)
+
+    def tearDown(self):
+        disable_batching()
+
+    def test_threads_share_batches_then_close(self):
+        results = {}
+
+        def call(i):
+            results[i] = invoke_chain(self.chain, self.inputs[i]).content
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(self.inputs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([results[i] for i in range(len(self.inputs))], self.expected)
+        stats = self.executor.stats()
+        self.assertEqual(stats["requests"], 8)
+        self.assertLess(stats["batches"], 8)
+
+        collector = self.executor._collector
+        disable_batching()
+        self.assertFalse(collector.is_alive())
+        with self.assertRaises(RuntimeError):
+            self.executor.invoke(ANSWER_PROMPT.invoke(self.inputs[0]))
+        # the chain is sent straight to the chat model again
+        self.assertEqual(invoke_chain(self.chain, self.inputs[0]).content, self.expected[0])
+
+    def test_event_loop_collector_is_closed(self):
+        async def main():
+            results = await asyncio.gather(*(ainvoke_chain(self.chain, inputs) for inputs in self.inputs))
+            _, task, batches = self.executor._async_collectors[asyncio.get_running_loop()]
+            await aclose_batching()
+            return [r.content for r in results], task, batches
+
+        results, task, batches = asyncio.run(main())
+        self.assertEqual(results, self.expected)
+        self.assertTrue(task.done() and not task.cancelled())
+        self.assertEqual(batches, set())
+        self.assertEqual(len(self.executor._async_collectors), 0)
+
+    def test_worker_exports_the_batching_stats(self):
+        from tournament import run_worker
+        output_dir = tempfile.mkdtemp()
+        try:
+            run_worker(0, 4, os.path.join(ROOT, "system_prompts.yaml"), output_dir, 4, {"log_level": "critical"},
+                       batch_size=4, batch_wait=0.05)
+            with open(os.path.join(output_dir, "metrics_worker_0.json")) as f:
+                batching = json.load(f)["batching"]
+        finally:
+            shutil.rmtree(output_dir)
+        self.assertEqual(set(batching), {"host", "player"})
+        self.assertGreater(batching["host"]["requests"], 0)
+        self.assertEqual(batching["host"]["queue_depth"], 0)
+        self.assertEqual(sum(int(size) * n for size, n in batching["host"]["batch_sizes"].items()),
+                         batching["host"]["requests"])
+
+
+if __name__ == "__main__":
+    unittest.main()
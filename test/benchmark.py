@@ -0,0 +1,318 @@
+"""
+Benchmarks of the game engine's hot paths, run against the offline fake LLM backend so they measure
+the engine itself rather than the provider:
+
+    python test/benchmark.py --output benchmark.json
+    python test/benchmark.py --compare benchmark.json --threshold 0.2
+
+With --compare, every result more than --threshold slower than in the baseline file is reported as a
+regression and the script exits with status 1. Use --quick for a smoke run and --latency to give the
+fake LLM a simulated round-trip time in the full-game benchmarks.
+"""
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# the benchmarks never call the real provider
+os.environ["LLM_BACKEND"] = "fake"
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CWD = os.getcwd()
+
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import yaml
+from langchain_core.messages import SystemMessage, AIMessage, ToolMessage
+
+from agent import Game
+from tournament import run_tournament_async
+from utils.logger import ExperimentLogger
+from utils import logger as experiment_logger
+from utils.runtime import GameRuntime
+from utils.knowledge import KnowledgeBase
+
+
+def measure(func, number, repeat=5):
+    """ Best time of repeat runs of number calls, in microseconds per call """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return min(times) * 1e6
+
+
+def game_state(num_turns):
+    """ The state of a game after num_turns questions, as the nodes see it """
+    messages = [SystemMessage(content="Let's play a game of 20 questions")]
+    messages += [AIMessage(content="", tool_calls=[{"name": "generate_topic", "args": {"task_for_host": "generate_topic"}, "id": "t"}], name="host"),
+                 ToolMessage(content="dog", name="generate_topic", tool_call_id="t"),
+                 AIMessage(content="I have a secret topic for you to guess. Let's start the game.", name="host")]
+    for i in range(num_turns):
+        messages += [
+            AIMessage(content="", tool_calls=[{"name": "generate_question", "args": {"messages": ""}, "id": f"q{i}"}], name="player"),
+            ToolMessage(content=f"Question {i}?", name="generate_question", tool_call_id=f"q{i}"),
+            AIMessage(content=f"Question {i}?", name="player"),
+            AIMessage(content="", tool_calls=[{"name": "answer_question", "args": {}, "id": f"a{i}"}], name="host"),
+            ToolMessage(content="NO", name="answer_question", tool_call_id=f"a{i}"),
+            AIMessage(content="NO", name="host"),
+        ]
+    return {
+        "messages": messages,
+        "sender": "host",
+        "topic": "dog",
+        "num_questions_asked": num_turns,
+        "num_questions_answered": num_turns,
+        "guess": "",
+        "task_for_host": "answer_question",
+        "most_recent_question": f"Question {num_turns - 1}?",
+        "player_response": "",
+    }
+
+
+class NullLogger:
+    def log(self, *args, **kwargs):
+        pass
+
+    def event(self, *args, **kwargs):
+        pass
+
+
+def bench_setup(system_prompt, number):
+    runtime = GameRuntime.get(system_prompt)
+
+    def setup():
+        game = Game(system_prompt, "bench", verbose=False, runtime=runtime, log_level="critical")
+        game._create_app()
+        game.logger.close()
+
+    return {
+        "game_setup_us": measure(setup, number),
+        # a cold build of the graph, agents and chains, done once per process and set of prompts
+        "runtime_build_us": measure(lambda: GameRuntime(system_prompt), 1, repeat=3),
+    }
+
+
+def bench_turns(system_prompt, number, num_turns=10):
+    runtime = GameRuntime.get(system_prompt)
+    state = game_state(num_turns)
+    config = {"configurable": {"logger": NullLogger(), "max_questions": 20}}
+    messages = state["messages"]
+    results = {}
+
+    # a new game for every call: the projection is built from scratch
+    results["format_chat_history_cold_us"] = measure(
+        lambda: runtime.player_agent.format_chat_history(messages, {"configurable": {"game_id": str(uuid.uuid4())}}), number)
+    # the same game: only the messages appended since the previous call are projected
+    game_config = {"configurable": {"game_id": "bench"}}
+    runtime.player_agent.format_chat_history(messages, game_config)
+    results["format_chat_history_incremental_us"] = measure(
+        lambda: runtime.player_agent.format_chat_history(messages, game_config), number)
+    runtime.player_agent.release("bench")
+
+    tool_message = ToolMessage(content="Is it alive?", name="generate_question", tool_call_id="x")
+    results["handle_tool_message_us"] = measure(
+        lambda: runtime.player_agent.handle_tool_message(tool_message, state, config), number)
+
+    player_state = {**state, "messages": messages + [AIMessage(content="Is it alive?", name="host")]}
+    results["call_agent_player_us"] = measure(
+        lambda: runtime.player_agent.call_agent(player_state, {"configurable": {**config["configurable"], "game_id": "bench"}}), number)
+    runtime.player_agent.release("bench")
+    return results
+
+
+def bench_router(system_prompt, number, num_turns=10):
+    runtime = GameRuntime.get(system_prompt)
+    config = {"configurable": {"logger": NullLogger(), "max_questions": 20}}
+    state = game_state(num_turns)
+
+    def route_with_correction():
+        # the host called check_guess while it should answer the question, so the tool node corrects the call
+        wrong_call = AIMessage(content="", name="host", tool_calls=[
+            {"name": "check_guess", "args": {"topic": "cat", "guess": "", "task_for_host": "check_guess"}, "id": "c"}])
+        wrong_state = {**state, "messages": state["messages"] + [wrong_call]}
+        runtime._router(wrong_state, config)
+        runtime._tool_input(wrong_state, config)
+
+    def route_plain():
+        runtime._router({**state, "messages": state["messages"] + [AIMessage(content="NO", name="host")]}, config)
+
+    return {
+        "router_correct_tool_call_us": measure(route_with_correction, number),
+        "router_continue_us": measure(route_plain, number),
+    }
+
+
+def bench_logger(number):
+    log_dir = tempfile.mkdtemp()
+    # a typical node update
+    values = {"messages": [AIMessage(content="Is it alive?", name="player")], "sender": "player", "num_questions_asked": 1}
+    try:
+        logger = ExperimentLogger(log_dir, game_id="bench")
+        results = {"logger_log_us": measure(lambda: logger.log("update node: %s and update: %s", "host", values), number)}
+        results["logger_disabled_us"] = measure(lambda: logger.log("state: %s", values, level="debug"), number)
+        logger.close()
+        experiment_logger.shutdown()
+        return results
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def bench_imports(repeat=3):
+    """ Wall time of a fresh interpreter importing the entry points, and of one building the game's graph """
+    scripts = {
+        "python_startup_ms": "pass",
+        "import_agent_ms": "import agent",
+        "import_tournament_ms": "import tournament",
+        "import_and_build_runtime_ms": "import agent, yaml; from utils.runtime import GameRuntime; "
+                                       "GameRuntime.get(yaml.safe_load(open('system_prompts.yaml')))",
+    }
+    results = {}
+    for name, script in scripts.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
+            times.append(time.perf_counter() - start)
+        results[name] = min(times) * 1000
+    return results
+
+
+def bench_knowledge(number, num_concepts=50_000, num_questions=256):
+    """ The player's question scoring by a knowledge base of random concepts, from scratch and along a cached path """
+    rng = np.random.default_rng(0)
+    knowledge = KnowledgeBase(
+        [f"concept {j}" for j in range(num_concepts)],
+        [f"Question {i}?" for i in range(num_questions)],
+        [np.flatnonzero(rng.random(num_concepts) < rng.uniform(0.05, 0.6)) for _ in range(num_questions)],
+    )
+    candidates = knowledge.candidates()
+    results = {"knowledge_score_all_us": measure(lambda: knowledge.next_action(candidates.mask), number)}
+    for _ in range(4):
+        candidates.answer(candidates.next_action()[1], "NO")
+    results["knowledge_score_after_4_answers_us"] = measure(lambda: knowledge.next_action(candidates.mask), number)
+    results["knowledge_next_action_cached_us"] = measure(candidates.next_action, number)
+    return results
+
+
+def bench_games(system_prompt, concurrency_levels, games_per_level):
+    results = {}
+    runtime = GameRuntime.get(system_prompt)
+    options = {"log_level": "warning"}
+    for concurrency in concurrency_levels:
+        num_games = max(games_per_level, concurrency)
+        start = time.perf_counter()
+        games = asyncio.run(run_tournament_async(system_prompt, num_games, concurrency, runtime, game_options=options))
+        elapsed = time.perf_counter() - start
+        failed = sum("error" in g for g in games)
+        if failed:
+            raise RuntimeError(f"{failed} games failed at concurrency {concurrency}")
+        results[f"games_per_second_c{concurrency}"] = num_games / elapsed
+        results[f"game_wall_time_median_ms_c{concurrency}"] = statistics.median(g["wall_time"] for g in games) * 1000
+    experiment_logger.shutdown()
+    return results
+
+
+def higher_is_better(name):
+    return name.startswith("games_per_second")
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the results with a baseline.
+
+    -- returns:
+        list of (name, baseline value, value, relative change) of the regressions
+    """
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # positive change means slower
+        change = (base - value) / base if higher_is_better(name) else (value - base) / base
+        if change > threshold:
+            regressions.append((name, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engine against the offline fake LLM")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations and games, for a smoke run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 512], help="concurrency levels of the full-game benchmark")
+    parser.add_argument("--games", type=int, default=64, help="minimum number of games per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated LLM round-trip in seconds")
+    args = parser.parse_args()
+    output = os.path.join(CWD, args.output) if args.output else None
+    baseline_path = os.path.join(CWD, args.compare) if args.compare else None
+
+    if args.latency:
+        from utils.llm import host_llm, player_llm
+        host_llm.latency = player_llm.latency = args.latency
+
+    system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+    number = 50 if args.quick else 500
+    games = 8 if args.quick else args.games
+
+    log_dir = tempfile.mkdtemp()
+    results = {}
+    try:
+        # the game logs go to a temporary folder
+        os.chdir(log_dir)
+        for name, run in [
+            ("imports", lambda: bench_imports(2 if args.quick else 5)),
+            ("setup", lambda: bench_setup(system_prompt, number)),
+            ("turns", lambda: bench_turns(system_prompt, number)),
+            ("router", lambda: bench_router(system_prompt, number)),
+            ("logger", lambda: bench_logger(number * 4)),
+            ("knowledge", lambda: bench_knowledge(number)),
+            ("games", lambda: bench_games(system_prompt, args.concurrency, games)),
+        ]:
+            part = run()
+            for key, value in part.items():
+                print(f"{name:8s} {key:42s} {value:14.2f}")
+            results.update(part)
+    finally:
+        experiment_logger.shutdown()
+        os.chdir(CWD)
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": args.quick,
+            "latency": args.latency,
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, value, change in regressions:
+            print(f"REGRESSION {name}: {base:.2f} -> {value:.2f} ({change:+.0%} slower)")
+        if regressions:
+            sys.exit(1)
+        print(f"no regression above {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
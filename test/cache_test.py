@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.cache import AnswerCache, normalize_question
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "answers.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  Is it a  Living thing? "), "is it a living thing")
+        self.assertEqual(normalize_question('"Is it an animal?"'), "is it an animal")
+
+    def test_hit_and_miss(self):
+        cache = AnswerCache(namespace="model:prompt")
+        self.assertIsNone(cache.get("dog", "Is it an animal?"))
+        cache.put("dog", "Is it an animal?", "YES")
+        self.assertEqual(cache.get("Dog", "is it an animal"), "YES")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_namespace_versions_keys(self):
+        cache = AnswerCache(self.path, namespace="model-a:prompt")
+        cache.put("dog", "Is it an animal?", "YES")
+        other = AnswerCache(self.path, namespace="model-b:prompt")
+        self.assertIsNone(other.get("dog", "Is it an animal?"))
+
+    def test_memory_lru_eviction(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("dog", "q1", "YES")
+        cache.put("dog", "q2", "NO")
+        cache.get("dog", "q1")
+        cache.put("dog", "q3", "YES")
+        self.assertEqual(cache.get("dog", "q1"), "YES")
+        self.assertIsNone(cache.get("dog", "q2"))
+
+    def test_disk_store_is_shared(self):
+        AnswerCache(self.path).put("dog", "Is it an animal?", "YES")
+        cache = AnswerCache(self.path)
+        self.assertEqual(cache.get("dog", "Is it an animal?"), "YES")
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_disk_eviction(self):
+        cache = AnswerCache(self.path, max_entries=1, max_disk_entries=2)
+        for i in range(6):
+            cache.put("dog", f"question {i}", "NO")
+        fresh = AnswerCache(self.path)
+        self.assertIsNone(fresh.get("dog", "question 0"))
+        self.assertEqual(fresh.get("dog", "question 5"), "NO")
+
+    def test_threads(self):
+        cache = AnswerCache(self.path)
+
+        def worker(i):
+            for j in range(50):
+                cache.put(f"topic {i}", f"question {j}", "YES")
+                cache.get(f"topic {i}", f"question {j}")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.stats()["hits"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+from unittest import mock
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from utils.cassette import Cassette, CassetteMiss, use_cassette, stop_cassette
+from utils.fake_llm import FakeChatModel
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+class RecordingGame(Game):
+    """ Keeps the stream of node updates of the game """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = []
+
+    def _handle_event(self, event):
+        for node, values in event.items():
+            messages = [(m.type, m.content, getattr(m, "tool_calls", None), m.id) for m in values.get("messages", [])]
+            self.events.append((node, messages, {k: v for k, v in values.items() if k != "messages"}))
+        super()._handle_event(event)
+
+
+def play(seed, use_async=False):
+    game = RecordingGame(system_prompt, f"cassette-{seed}", verbose=False, seed=seed, log_level="critical")
+    if use_async:
+        asyncio.run(game.arun())
+    else:
+        game.run()
+    result = game.result()
+    return game.events, {key: result[key] for key in ("topic", "win", "turns", "llm_calls")}
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.cassette_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cassette_dir, ignore_errors=True)
+        self.addCleanup(stop_cassette)
+
+    def record(self, seed, use_async=False):
+        cassette = use_cassette(os.path.join(self.cassette_dir, f"{seed}.jsonl"), "record")
+        recorded = play(seed, use_async)
+        stop_cassette()
+        self.assertEqual(cassette.requests, recorded[1]["llm_calls"])
+        return recorded
+
+    def test_replay_reproduces_the_game_without_calling_the_llm(self):
+        recorded = self.record("a")
+        use_cassette(self.cassette_dir, "replay")
+        with mock.patch.object(FakeChatModel, "_generate", side_effect=AssertionError("the LLM was called")):
+            self.assertEqual(play("a"), recorded)
+
+    def test_async_replay(self):
+        recorded = self.record("b", use_async=True)
+        use_cassette(self.cassette_dir, "replay")
+        with mock.patch.object(FakeChatModel, "_generate", side_effect=AssertionError("the LLM was called")):
+            self.assertEqual(play("b", use_async=True), recorded)
+
+    def test_unknown_request_is_a_miss(self):
+        self.record("c")
+        cassette = Cassette(self.cassette_dir, "replay")
+        self.assertGreater(len(cassette), 0)
+        with self.assertRaises(CassetteMiss):
+            cassette.lookup("a prompt never sent", "model")
+
+
+if __name__ == "__main__":
+    unittest.main()
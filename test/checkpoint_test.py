@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+import threading
+from unittest import mock
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from tournament import run_tournament_async
+from utils.checkpoint import SQLiteCheckpointer
+from utils.fake_llm import FakeChatModel
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+def failing_after(num_calls):
+    """ A _generate for FakeChatModel which fails like a provider outage after num_calls calls """
+    generate = FakeChatModel._generate
+    calls = []
+
+    def _generate(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) > num_calls:
+            raise ConnectionError("provider outage")
+        return generate(self, *args, **kwargs)
+    return _generate
+
+
+class TestSQLiteCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.path = os.path.join(self.tmp_dir, "checkpoints.sqlite")
+
+    def test_failed_game_resumes_from_its_last_step(self):
+        with SQLiteCheckpointer(self.path) as checkpointer:
+            game = Game(system_prompt, "g", verbose=False, log_level="critical", checkpointer=checkpointer)
+            with mock.patch.object(FakeChatModel, "_generate", failing_after(8)):
+                with self.assertRaises(ConnectionError):
+                    game.run()
+            dialogs = game.dialogs
+            self.assertEqual(checkpointer.game_status("g"), ("failed", None))
+
+        # a new process opens the file again
+        with SQLiteCheckpointer(self.path) as checkpointer:
+            game = Game(system_prompt, "g", verbose=False, log_level="critical", checkpointer=checkpointer)
+            result = game.run()
+            self.assertTrue(result["resumed"])
+            self.assertTrue(result["win"])
+            self.assertEqual(result["node_order_violations"], 0)
+            self.assertEqual(game.dialogs[:len(dialogs)], dialogs)
+            self.assertGreater(len(game.dialogs), len(dialogs))
+            self.assertEqual(checkpointer.game_status("g")[0], "finished")
+        with SQLiteCheckpointer(self.path) as checkpointer:
+            self.assertEqual(checkpointer.games("finished"), ["g"])
+
+    def test_status_is_read_from_a_flush_until_it_commits(self):
+        snapshot_taken, commit = threading.Event(), threading.Event()
+
+        def wait_for_commit():
+            snapshot_taken.set()
+            commit.wait(5)
+            return 0.0
+
+        with SQLiteCheckpointer(self.path, flush_interval=60) as checkpointer:
+            checkpointer.start_game("a")
+            checkpointer.flush()
+            checkpointer.finish_game("a", {"win": True})
+            # the flush stops after taking its snapshot, before its transaction
+            with mock.patch("utils.checkpoint.time", mock.Mock(time=wait_for_commit)):
+                flush = threading.Thread(target=checkpointer.flush)
+                flush.start()
+                self.assertTrue(snapshot_taken.wait(5))
+                self.assertEqual(checkpointer.game_status("a"), ("finished", {"win": True}))
+                commit.set()
+                flush.join()
+            self.assertEqual(checkpointer.game_status("a"), ("finished", {"win": True}))
+
+    def test_tournament_skips_finished_games(self):
+        game_ids = ["a", "b", "c"]
+        with SQLiteCheckpointer(self.path) as checkpointer:
+            first = asyncio.run(run_tournament_async(system_prompt, 2, checkpointer=checkpointer, game_ids=game_ids[:2],
+                                                     game_options={"log_level": "critical"}))
+
+        with SQLiteCheckpointer(self.path) as checkpointer:
+            results = asyncio.run(run_tournament_async(system_prompt, 3, checkpointer=checkpointer, game_ids=game_ids,
+                                                       game_options={"log_level": "critical"}))
+            self.assertEqual([r["game_id"] for r in results], game_ids)
+            # the saved results of the finished games, they are not played again
+            self.assertEqual(results[:2], first)
+            self.assertTrue(results[2]["win"])
+            self.assertEqual(sorted(checkpointer.games("finished")), game_ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+The tests play against the offline fake LLM backend (utils/fake_llm.py), except unit_test.py which tests the
+agents on the real models. The backend is set around each test module, and the models of the process, kept
+by the runtimes and the chains built on them, are dropped whenever it changes.
+"""
+import os
+from unittest import mock
+
+import pytest
+from dotenv import load_dotenv
+
+# the test modules calling the real models
+REAL_LLM_MODULES = ("unit_test.py",)
+
+load_dotenv()
+# unit_test.py creates the real models when it is imported, which needs an API key
+collect_ignore = [] if os.getenv("OPENAI_API_KEY") or os.getenv("LLM_BACKEND") == "fake" else list(REAL_LLM_MODULES)
+
+
+def _drop_llms():
+    from utils import llm, tools
+    from utils.runtime import GameRuntime
+
+    with GameRuntime._runtimes_lock:
+        runtimes = list(GameRuntime._runtimes.values())
+        GameRuntime._runtimes.clear()
+    for runtime in runtimes:
+        runtime.close()
+    tools._chains.clear()
+    llm._llms = None
+
+
+@pytest.fixture(autouse=True, scope="module")
+def llm_backend(request):
+    if request.path.name in REAL_LLM_MODULES:
+        yield
+        return
+    with mock.patch.dict(os.environ, {"LLM_BACKEND": "fake"}):
+        _drop_llms()
+        yield
+    _drop_llms()
@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.context import TranscriptDigest, bounded_chat_history
+
+from langchain_core.messages import SystemMessage, AIMessage, ToolMessage
+
+
+def play(turns):
+    """ Build the messages of a game from (tool name, content) pairs """
+    messages = [SystemMessage(content="Let's play a game of 20 questions")]
+    for i, (name, content) in enumerate(turns):
+        sender = "player" if name in ("generate_question", "make_guess") else "host"
+        messages.append(AIMessage(content="", name=sender))
+        messages.append(ToolMessage(content=content, name=name, tool_call_id=str(i)))
+        messages.append(AIMessage(content=content, name=sender))
+    return messages
+
+
+class TestTranscriptDigest(unittest.TestCase):
+
+    def test_questions_answers_and_wrong_guesses(self):
+        messages = play([
+            ("generate_topic", "dog"),
+            ("generate_question", "Is it alive?"),
+            ("answer_question", "YES"),
+            ("make_guess", "cat"),
+            ("check_guess", "Sorry, you are wrong. Please ask another question."),
+            ("generate_question", "Does it bark?"),
+            ("answer_question", "YES"),
+        ])
+        digest = TranscriptDigest()
+        digest.update(messages[:10])
+        digest.update(messages)
+        self.assertEqual(digest.questions, [("Is it alive?", "YES"), ("Does it bark?", "YES")])
+        self.assertEqual(digest.wrong_guesses, ["cat"])
+        self.assertIn("2. Does it bark? - YES", digest.render())
+
+    def test_bounded_history_size_is_flat(self):
+        turns = [("generate_topic", "dog")]
+        for i in range(100):
+            turns += [("generate_question", f"Question {i}?"), ("answer_question", "NO")]
+        digest = TranscriptDigest()
+        digest.update(play(turns))
+        chat_history = [("human", f"message {i}") for i in range(200)]
+
+        bounded = bounded_chat_history(digest, chat_history, 4, digest_questions=20)
+        self.assertEqual(len(bounded), 5)
+        self.assertEqual(bounded[-1], ("human", "message 199"))
+        self.assertEqual(len(digest.questions), 100)
+        self.assertIn("(80 earlier questions omitted)", bounded[0][1])
+        self.assertIn("100. Question 99? - NO", bounded[0][1])
+        self.assertNotIn("Question 79?", bounded[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
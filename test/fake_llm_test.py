@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.fake_llm import FakeChatModel, DEFAULT_KNOWLEDGE
+from utils.node import GameAgentNode, PlayerAction
+from utils.tools import (
+    GENERATE_QUESTION_PROMPT, MAKE_GUESS_PROMPT, GENERATE_TOPIC_PROMPT, ANSWER_QUESTION_PROMPT,
+    host_tools, player_tools,
+)
+
+
+class TestFakeChatModel(unittest.TestCase):
+
+    def setUp(self):
+        self.host_llm = FakeChatModel(seed=3)
+        self.player_llm = FakeChatModel(seed=4)
+
+    def test_tool_prompts_play_a_game(self):
+        topic = (GENERATE_TOPIC_PROMPT | self.host_llm).invoke({"sample_reference_topics": ["aardvark"]}).content
+        self.assertIn(topic, DEFAULT_KNOWLEDGE["topics"])
+
+        history = []
+        for _ in range(len(DEFAULT_KNOWLEDGE["questions"])):
+            question = (GENERATE_QUESTION_PROMPT | self.player_llm).invoke({"messages": history}).content
+            answer = (ANSWER_QUESTION_PROMPT | self.host_llm).invoke({"topic": topic, "question": question}).content
+            history += [("ai", question), ("human", answer)]
+            guess = (MAKE_GUESS_PROMPT | self.player_llm).invoke({"messages": history}).content
+            if guess == topic:
+                break
+        self.assertEqual(guess, topic)
+
+    def test_host_agent_calls_the_tool_of_the_task(self):
+        agent = GameAgentNode(llm=self.host_llm, tools=host_tools, role="host", system_prompt="").create_agent()
+        result = agent.invoke({
+            "messages": [("human", "I have a secret topic for you to guess. Let's start the game."), ("human", "Can it fly?")],
+            "topic": ["eagle"],
+            "task_for_host": ["answer_question"],
+            "guess": [""],
+        })
+        self.assertEqual(result.tool_calls[0]["name"], "answer_question")
+        self.assertEqual(result.tool_calls[0]["args"], {"topic": "eagle", "question": "Can it fly?", "task_for_host": "answer_question"})
+        self.assertGreater(result.usage_metadata["input_tokens"], 0)
+
+    def test_player_agents(self):
+        node = GameAgentNode(llm=self.player_llm, tools=player_tools, role="player", system_prompt="")
+        history = [("human", "Is it alive?"), ("ai", "YES"), ("human", "Is it a flower?"), ("ai", "YES")]
+
+        result = node.create_agent().invoke({"messages": history})
+        self.assertEqual(result.tool_calls[0]["name"], "make_guess")
+
+        action = node.create_fused_agent().invoke({"messages": history[:2]})
+        self.assertIsInstance(action, PlayerAction)
+        self.assertEqual(action.action, "generate_question")
+        self.assertNotIn(action.content, ("Is it alive?", "Is it a flower?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import asyncio
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+class TestAsyncGame(unittest.TestCase):
+
+    def play(self, game_id, run_async, **kwargs):
+        game = Game(system_prompt, game_id, verbose=False, log_level="critical", **kwargs)
+        result = asyncio.run(game.arun()) if run_async else game.run()
+        return game, result
+
+    def assert_same_game(self, **kwargs):
+        game, result = self.play("sync", False, **kwargs)
+        async_game, async_result = self.play("async", True, **kwargs)
+        self.assertEqual(async_game.dialogs, game.dialogs)
+        self.assertEqual(async_game.state, game.state)
+        for key in ("topic", "win", "turns", "llm_calls"):
+            self.assertEqual(async_result[key], result[key], key)
+        return result
+
+    def test_arun_plays_the_same_game_as_run(self):
+        result = self.assert_same_game(topic="horse")
+        self.assertTrue(result["win"])
+        self.assertGreater(result["llm_calls"], 0)
+
+    def test_arun_in_every_mode(self):
+        self.assert_same_game(topic="piano", host_mode="direct", player_mode="fused")
+        self.assert_same_game(topic="cat", player_context="digest", context_window=2)
+
+    def test_games_in_flight_on_one_loop(self):
+        async def main():
+            games = [Game(system_prompt, f"loop-{i}", verbose=False, log_level="critical", topic=topic)
+                     for i, topic in enumerate(["horse", "piano", "cat", "dog"])]
+            return games, await asyncio.gather(*[game.arun() for game in games])
+
+        games, results = asyncio.run(main())
+        for game, result in zip(games, results):
+            self.assertEqual(result["topic"], game.topic)
+            _, expected = self.play("sync", False, topic=game.topic)
+            self.assertEqual((result["win"], result["turns"]), (expected["win"], expected["turns"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
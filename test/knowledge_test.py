@@ -0,0 +1,151 @@
+import unittest
+import sys
+import os
+import json
+import asyncio
+import shutil
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from langchain_core.messages import AIMessage, ToolMessage
+from agent import Game
+from utils.fake_llm import DEFAULT_KNOWLEDGE
+import numpy as np
+from utils.knowledge import KnowledgeBase, abuild_knowledge_csv, load_concepts
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+def play(turns):
+    """ Build the messages of a game from (tool name, content) pairs """
+    messages = []
+    for i, (name, content) in enumerate(turns):
+        sender = "player" if name in ("generate_question", "make_guess") else "host"
+        messages.append(AIMessage(content="", name=sender))
+        messages.append(ToolMessage(content=content, name=name, tool_call_id=str(i)))
+    return messages
+
+
+class TestKnowledgeBase(unittest.TestCase):
+
+    def setUp(self):
+        self.knowledge = KnowledgeBase.from_table(DEFAULT_KNOWLEDGE)
+
+    def questions_to_find(self, topic):
+        attributes = {q: attr for attr, q in DEFAULT_KNOWLEDGE["questions"].items()}
+        candidates = self.knowledge.candidates()
+        num_questions = 0
+        while True:
+            action, content = candidates.next_action()
+            if action == "make_guess":
+                if content == topic:
+                    return num_questions
+                candidates.exclude(content)
+            else:
+                num_questions += 1
+                candidates.answer(content, "YES" if attributes[content] in DEFAULT_KNOWLEDGE["topics"][topic] else "NO")
+
+    def test_finds_every_topic_with_near_optimal_questions(self):
+        turns = [self.questions_to_find(topic) for topic in DEFAULT_KNOWLEDGE["topics"]]
+        # 12 topics need at least log2(12) = 3.58 questions on average
+        self.assertLessEqual(max(turns), 4)
+        self.assertLess(sum(turns) / len(turns), 3.7)
+
+    def test_candidates_follow_the_transcript(self):
+        messages = play([
+            ("generate_topic", "dog"),
+            ("generate_question", "Is it an animal?"),
+            ("answer_question", "YES"),
+            ("generate_question", "Is it purple?"),
+            ("answer_question", "NO"),
+            ("make_guess", "eagle"),
+            ("check_guess", "Sorry, you are wrong. Please ask another question."),
+            ("generate_question", "is it a mammal"),
+            ("answer_question", "Yes."),
+        ])
+        candidates = self.knowledge.candidates()
+        candidates.update(messages[:8])
+        candidates.update(messages)
+        self.assertEqual(candidates.names(), ["dog", "cat", "horse"])
+
+        scratch = self.knowledge.candidates()
+        scratch.update(messages)
+        self.assertEqual(scratch.path, candidates.path)
+        self.assertEqual(scratch.next_action(), candidates.next_action())
+
+    def test_branch_leaves_the_candidates_alone(self):
+        candidates = self.knowledge.candidates()
+        candidates.answer("Is it an animal?", "YES")
+        yes, no = candidates.branch("Is it a mammal?", "YES"), candidates.branch("Is it a mammal?", "NO")
+        self.assertEqual(yes.names(), ["dog", "cat", "horse"])
+        self.assertEqual(sorted(yes.names() + no.names()), sorted(candidates.names()))
+        self.assertEqual(len(candidates.path), 1)
+
+    def test_csv_with_question_columns(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        path = os.path.join(tmp_dir, "things.csv")
+        with open(path, "w") as f:
+            f.write(",THINGS-concept,Is it alive?,Can it fly?\n0,aardvark,1,0\n1,abacus,0,0\n2,albatross,1,1\n")
+        knowledge = KnowledgeBase.from_csv(path)
+        candidates = knowledge.candidates()
+        candidates.answer("Is it alive?", "YES")
+        self.assertEqual(candidates.next_action(), ("generate_question", "Can it fly?"))
+        candidates.answer("Can it fly?", "NO")
+        self.assertEqual(candidates.next_action(), ("make_guess", "aardvark"))
+
+        # the reference concepts alone have no answers to play with
+        with self.assertRaisesRegex(ValueError, "no question columns"):
+            KnowledgeBase.from_csv(os.path.join(ROOT, "data", "reference_things.csv"))
+
+    def test_build_from_the_host_answers(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        path = os.path.join(tmp_dir, "knowledge.csv")
+        concepts, questions = list(DEFAULT_KNOWLEDGE["topics"]), list(DEFAULT_KNOWLEDGE["questions"].values())
+        self.assertEqual(asyncio.run(abuild_knowledge_csv(concepts, questions, path, max_concurrency=4)), 0)
+
+        built = KnowledgeBase.from_csv(path)
+        self.assertEqual((built.concepts, built.questions), (concepts, questions))
+        np.testing.assert_array_equal(built.matrix, self.knowledge.matrix)
+        self.assertGreater(len(load_concepts(os.path.join(ROOT, "data", "reference_things.csv"))), 1000)
+
+
+class TestKnowledgePlayer(unittest.TestCase):
+
+    def test_game_without_player_llm_calls(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        path = os.path.join(tmp_dir, "knowledge.json")
+        with open(path, "w") as f:
+            json.dump(DEFAULT_KNOWLEDGE, f)
+
+        for player_mode in ("tools", "fused"):
+            game = Game(system_prompt, f"knowledge-{player_mode}", verbose=False, log_level="critical",
+                        player_mode=player_mode, player_knowledge=path)
+            result = game.run()
+            self.assertTrue(result["win"])
+            self.assertLessEqual(result["turns"], 4)
+            self.assertEqual(result["node_order_violations"], 0)
+            self.assertNotIn("player", result["metrics"]["llm_calls"])
+            self.assertNotIn("generate_question", result["metrics"]["llm_calls"])
+
+    def test_no_speculation_while_the_knowledge_base_plays(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        path = os.path.join(tmp_dir, "knowledge.json")
+        with open(path, "w") as f:
+            json.dump(DEFAULT_KNOWLEDGE, f)
+
+        game = Game(system_prompt, "knowledge-speculation", verbose=False, log_level="critical",
+                    player_mode="fused", player_speculation=True, player_knowledge=path)
+        result = game.run()
+        self.assertTrue(result["win"])
+        self.assertNotIn("speculation_started", result["metrics"]["events"])
+        self.assertNotIn("speculation", result["metrics"]["llm_calls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
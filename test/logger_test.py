@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import logger as experiment_logger
+from utils.logger import ExperimentLogger
+
+
+class Expensive:
+    """ Counts how often it is formatted, and records the threads formatting it """
+    formatted = 0
+    threads = set()
+
+    def __str__(self):
+        Expensive.formatted += 1
+        Expensive.threads.add(threading.get_ident())
+        return "expensive"
+
+
+class TestExperimentLogger(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def read_lines(self, logger):
+        experiment_logger.shutdown()
+        with open(logger.log_file) as f:
+            return f.read().splitlines()
+
+    def test_text_log_and_lazy_arguments(self):
+        Expensive.formatted = 0
+        with ExperimentLogger(self.log_dir, game_id="text") as logger:
+            logger.log("update node: %s and update: %s", "host", {"topic": "dog"})
+            logger.log("state: %s", Expensive(), level="debug")
+
+        lines = self.read_lines(logger)
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith("INFO - update node: host and update: {'topic': 'dog'}"))
+        self.assertEqual(Expensive.formatted, 0)
+
+    def test_arguments_are_formatted_by_the_writer(self):
+        Expensive.formatted, Expensive.threads = 0, set()
+        with ExperimentLogger(self.log_dir, game_id="writer") as logger:
+            logger.log("state: %s", Expensive())
+
+        lines = self.read_lines(logger)
+        self.assertTrue(lines[0].endswith("INFO - state: expensive"))
+        self.assertEqual(Expensive.formatted, 1)
+        self.assertNotIn(threading.get_ident(), Expensive.threads)
+
+    def test_jsonl_events(self):
+        logger = ExperimentLogger(self.log_dir, game_id="events", level="debug", log_format="jsonl")
+        logger.event("game_result", topic="dog", win=True)
+        logger.log("state: %s", Expensive(), level="debug")
+        logger.close()
+        logger.log("dropped after close")
+
+        events = [json.loads(line) for line in self.read_lines(logger)]
+        self.assertTrue(logger.log_file.endswith("game_events.jsonl"))
+        self.assertEqual(events[0]["event"], "game_result")
+        self.assertEqual((events[0]["topic"], events[0]["win"], events[0]["game_id"]), ("dog", True, "events"))
+        self.assertEqual((events[1]["level"], events[1]["message"]), ("DEBUG", "state: expensive"))
+        self.assertEqual(len(events), 2)
+
+    def test_open_files_stay_bounded(self):
+        loggers = [ExperimentLogger(self.log_dir, game_id=i) for i in range(100)]
+        for logger in loggers:
+            logger.log("hello %s", logger.game_id)
+        handler = experiment_logger._listener.handlers[0]
+        for logger in loggers:
+            logger.close()
+
+        for logger in loggers:
+            self.assertEqual(len(self.read_lines(logger)), 1)
+        self.assertEqual(handler.files, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import sys
+import os
+import threading
+from unittest import mock
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.matching import GuessMatcher, get_matcher, normalize_guess
+from utils.metrics import LLMCallCounter
+from utils.runtime import is_correct_guess
+from utils.fake_llm import FakeChatModel
+from utils.tools import check_guess, generate_topic
+
+RIGHT = "Congratulations, you are right!"
+WRONG = "Sorry, you are wrong. Please ask another question."
+
+
+def check(topic, guess):
+    counter = LLMCallCounter()
+    reply = check_guess.invoke({"topic": topic, "guess": guess, "task_for_host": "check_guess"},
+                               config={"callbacks": [counter]})
+    return reply, counter.llm_calls
+
+
+class TestGuessMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = GuessMatcher(["dog", "cat", "catfish", "butterfly", "strawberry", "sledgehammer", "hammer"],
+                                    aliases={"cat": ["kitty"]})
+
+    def test_normalize_guess(self):
+        self.assertEqual(normalize_guess("Is it a Dog?"), "dog")
+        self.assertEqual(normalize_guess("I think it's the Butterflies!"), "butterfly")
+        self.assertEqual(normalize_guess("  Crème Brûlée "), "creme brulee")
+        self.assertEqual(normalize_guess("?!"), "")
+        self.assertEqual(normalize_guess("a contact lens"), "contact lens")
+        self.assertEqual(normalize_guess("Species"), "species")
+        self.assertEqual(normalize_guess("penguins"), "penguin")
+
+    def test_spelling_variants_name_the_topic(self):
+        for guess in ["Dogs", "the dog.", "is it a dog?", "DOG"]:
+            self.assertIs(self.matcher.match("dog", guess), True, guess)
+        self.assertIs(self.matcher.match("strawberry", "strawbery"), True)
+        self.assertIs(self.matcher.match("cat", "Kitty"), True)
+
+    def test_other_things_of_the_vocabulary(self):
+        # another thing of the vocabulary may be a synonym, the host tells
+        self.assertIsNone(self.matcher.match("cat", "catfish"))
+        self.assertIsNone(self.matcher.match("hammer", "sledgehammer"))
+        self.assertIsNone(self.matcher.match("hammer", "sledgehamers"))
+        self.assertIsNone(self.matcher.match("bicycle", "dog"))
+        self.assertIs(self.matcher.match("dog", ""), False)
+
+    def test_scores_that_cant_tell(self):
+        # a guess outside the vocabulary far from the topic is wrong
+        self.assertIs(self.matcher.match("dog", "puppy"), False)
+        self.assertIs(self.matcher.match("bicycle", "motorbike"), False)
+        self.assertIs(self.matcher.match("bicycle", "bicycles"), True)
+        self.assertIsNone(self.matcher.match("bicycle", "unicycle"))
+
+        self.matcher.add(["puppy"])
+        self.assertIsNone(self.matcher.match("dog", "puppy"))
+        self.matcher.remember("dog", "Puppy", True)
+        self.assertIs(self.matcher.verdict("dog", "puppies"), True)
+
+    def test_topics_added_to_the_vocabulary(self):
+        self.assertIsNone(self.matcher.match("bicycle", "unicycle"))
+        self.matcher.add(["Bicycles", "unicycle"])
+        self.assertIsNone(self.matcher.match("bicycle", "unicycle"))
+        self.assertIsNone(self.matcher.match("unicycle", "bicycle"))
+        self.assertIs(self.matcher.match("bicycle", "a bicycle"), True)
+        self.assertEqual(len(self.matcher), 9)
+
+    def test_add_swaps_the_index(self):
+        index = self.matcher._index
+        self.matcher.add(["dog", "Cats"])
+        self.assertIs(self.matcher._index, index)
+
+        verdicts = []
+
+        def match():
+            for _ in range(200):
+                verdicts.append(self.matcher.match("cat", "catfish"))
+
+        threads = [threading.Thread(target=match) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(50):
+            self.matcher.add([f"thing {i}"])
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(verdicts), {None})
+        self.assertIsNot(self.matcher._index, index)
+        self.assertEqual(len(index.names), 8)
+
+    def test_verdicts_are_bounded(self):
+        self.matcher.max_verdicts = 2
+        self.matcher.add(["puppy", "hound", "doggo"])
+        for guess in ["puppy", "hound", "doggo"]:
+            self.matcher.remember("dog", guess, True)
+        self.assertIsNone(self.matcher.verdict("dog", "puppy"))
+        self.assertIs(self.matcher.verdict("dog", "doggo"), True)
+
+
+class TestCheckGuess(unittest.TestCase):
+
+    def test_reference_topics(self):
+        self.assertGreater(len(get_matcher()), 1000)
+        self.assertEqual(check("horse", "Horses!"), (RIGHT, 0))
+        # the host tells whether another reference topic names the topic, once
+        self.assertEqual(check("cat", "catfish"), (WRONG, 1))
+        self.assertEqual(check("cat", "catfish"), (WRONG, 0))
+
+    def test_topic_outside_the_vocabulary(self):
+        self.assertNotIn("quokka", get_matcher()._index.concepts)
+        # a guess sharing nothing with the topic or the vocabulary is wrong without asking the LLM
+        self.assertEqual(check("quokka", "wallaby"), (WRONG, 0))
+        self.assertEqual(check("quokka", "kangaroo"), (WRONG, 1))
+        self.assertEqual(check("quokka", "Quokkas"), (RIGHT, 0))
+
+    def test_generated_topics_leave_the_vocabulary_alone(self):
+        index = get_matcher()._index
+        with mock.patch.object(FakeChatModel, "_topic", return_value="pangolin"):
+            topic = generate_topic.invoke({"task_for_host": "generate_topic"})
+        self.assertEqual(topic, "pangolin")
+        self.assertIs(get_matcher()._index, index)
+        # the guesses are told by the spelling of the generated topic
+        self.assertEqual(check("pangolin", "Pangolins"), (RIGHT, 0))
+        self.assertEqual(check("pangolin", "hobbit"), (WRONG, 0))
+
+    def test_llm_checks_an_ambiguous_guess_once(self):
+        self.assertFalse(is_correct_guess("grand piano", "piano"))
+        self.assertEqual(check("piano", "grand piano"), (RIGHT, 1))
+        self.assertEqual(check("piano", "Grand pianos"), (RIGHT, 0))
+        # the router and the result see the host's verdict without calling the LLM
+        self.assertTrue(is_correct_guess("grand piano", "piano"))
+
+        # mackerel is not a reference topic, mackintosh shares a little of its spelling
+        self.assertEqual(check("mackerel", "mackintosh"), (WRONG, 1))
+        self.assertEqual(check("mackerel", "mackintosh"), (WRONG, 0))
+        self.assertFalse(is_correct_guess("mackintosh", "mackerel"))
+        self.assertFalse(is_correct_guess("", "mackerel"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from typing import TypedDict
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.fake_llm import FakeChatModel
+from utils.metrics import GameMetrics, ProcessMetrics, emit_metric
+
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph, START, END
+
+llm = FakeChatModel()
+
+
+@tool
+def lookup(question: str):
+    """ Answer the question, like the host's tools do """
+    emit_metric("answer_cache_miss")
+    return llm.invoke(question).content
+
+
+class State(TypedDict):
+    question: str
+    answer: str
+
+
+def host(state):
+    llm.invoke("Generate a unique topic")
+    return {}
+
+
+def call_tool(state):
+    return {"answer": lookup.invoke({"question": state["question"]})}
+
+
+def build_app():
+    workflow = StateGraph(State)
+    workflow.add_node("host", host)
+    workflow.add_node("call_tool", call_tool)
+    workflow.add_edge(START, "host")
+    workflow.add_edge("host", "call_tool")
+    workflow.add_edge("call_tool", END)
+    return workflow.compile()
+
+
+class TestGameMetrics(unittest.TestCase):
+
+    def test_nodes_sources_tokens_and_events(self):
+        metrics = GameMetrics()
+        build_app().invoke({"question": "Is it alive?", "answer": ""}, {"callbacks": [metrics]})
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["node_runs"], {"host": 1, "call_tool": 1})
+        self.assertGreater(snapshot["node_seconds"]["call_tool"], 0)
+        self.assertEqual(snapshot["llm_calls"], {"host": 1, "lookup": 1})
+        self.assertEqual(metrics.llm_calls, 2)
+        self.assertGreater(snapshot["prompt_tokens"]["lookup"], 0)
+        self.assertGreater(snapshot["completion_tokens"]["host"], 0)
+        self.assertEqual(snapshot["events"], {"answer_cache_miss": 1})
+
+    def test_emit_outside_of_a_run_is_dropped(self):
+        emit_metric("answer_cache_hit")
+
+    def test_process_totals_hooks_and_export(self):
+        process = ProcessMetrics()
+        finished = []
+        process.add_hook(lambda game_id, snapshot: finished.append(game_id))
+        process.record_game("a", {"llm_calls": {"host": 2}, "events": {"answer_cache_hit": 1}})
+        process.record_game("b", {"llm_calls": {"host": 3, "make_guess": 1}})
+
+        self.assertEqual(finished, ["a", "b"])
+        path = os.path.join(tempfile.mkdtemp(), "metrics")
+        process.export(path)
+        with open(path) as f:
+            snapshot = json.load(f)
+        self.assertEqual(snapshot["games"], 2)
+        self.assertEqual(snapshot["llm_calls"], {"host": 5, "make_guess": 1})
+
+        text = process.to_prometheus()
+        self.assertIn('games_agent_llm_calls_total{source="host"} 5', text)
+        self.assertIn('games_agent_events_total{event="answer_cache_hit"} 1', text)
+        self.assertIn("games_agent_games_total 2", text)
+
+    def test_batching_stats_export(self):
+        process = ProcessMetrics()
+        self.assertNotIn("batching", process.snapshot())
+        process.record_batching({"host": {"requests": 7, "batches": 3, "queue_depth": 0, "max_queue_depth": 4,
+                                          "batch_sizes": {1: 1, 3: 2}}})
+        self.assertEqual(process.snapshot()["batching"]["host"]["batches"], 3)
+
+        text = process.to_prometheus()
+        self.assertIn('games_agent_batch_requests_total{llm="host"} 7', text)
+        self.assertIn('games_agent_batch_max_queue_depth{llm="host"} 4', text)
+        for bucket, count in [("1", 1), ("2", 1), ("4", 3), ("+Inf", 3)]:
+            self.assertIn(f'games_agent_batch_size_bucket{{llm="host",le="{bucket}"}} {count}', text)
+        self.assertIn('games_agent_batch_size_sum{llm="host"} 7', text)
+
+        process.reset()
+        self.assertNotIn("batching", process.snapshot())
+
+
+if __name__ == "__main__":
+    unittest.main()
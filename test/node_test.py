@@ -0,0 +1,136 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.node import GameAgentNode, PlayerAction, ChatHistoryProjection
+
+from langchain_core.messages import SystemMessage, AIMessage, ToolMessage
+
+
+class RaisingLLM:
+    """ The direct host mode must never reach the LLM """
+    def bind_tools(self, tools, **kwargs):
+        return self.invoke
+
+    def invoke(self, *args, **kwargs):
+        raise AssertionError("the LLM should not be called")
+
+
+class StructuredLLM(RaisingLLM):
+    """ Returns a fixed action from the fused player call """
+    def __init__(self, action):
+        self.action = action
+
+    def with_structured_output(self, schema, **kwargs):
+        return lambda prompt: self.action
+
+
+host = GameAgentNode(llm=RaisingLLM(), tools=[], role="host", system_prompt="")
+host_node = host.create_runnable()
+direct_config = {"configurable": {"host_mode": "direct"}}
+fused_config = {"configurable": {"player_mode": "fused"}}
+
+
+def game_state(**kwargs):
+    state = {
+        "messages": [SystemMessage(content="Let's play a game of 20 questions")],
+        "topic": "",
+        "num_questions_asked": 0,
+        "num_questions_answered": 0,
+        "guess": "",
+        "task_for_host": "generate_topic",
+        "most_recent_question": "",
+    }
+    state.update(kwargs)
+    return state
+
+
+class TestDirectHostDispatch(unittest.TestCase):
+
+    def test_generate_topic(self):
+        response = host_node.invoke(game_state(), direct_config)
+        tool_call = response["messages"][0].tool_calls[0]
+        self.assertEqual(tool_call["name"], "generate_topic")
+        self.assertEqual(tool_call["args"], {"task_for_host": "generate_topic"})
+        self.assertEqual(response["sender"], "host")
+
+    def test_answer_question(self):
+        state = game_state(messages=[AIMessage(content="Is it a cat?", name="player")],
+                           topic="dog",
+                           task_for_host="answer_question",
+                           most_recent_question="Is it a cat?")
+        tool_call = host_node.invoke(state, direct_config)["messages"][0].tool_calls[0]
+        self.assertEqual(tool_call["name"], "answer_question")
+        self.assertEqual(tool_call["args"], {"task_for_host": "answer_question", "topic": "dog", "question": "Is it a cat?"})
+
+    def test_check_guess(self):
+        state = game_state(topic="kitten", guess="kitten", task_for_host="check_guess")
+        tool_call = host_node.invoke(state, direct_config)["messages"][0].tool_calls[0]
+        self.assertEqual(tool_call["name"], "check_guess")
+        self.assertEqual(tool_call["args"], {"task_for_host": "check_guess", "topic": "kitten", "guess": "kitten"})
+
+    def test_default_mode_uses_llm(self):
+        with self.assertRaises(AssertionError):
+            host_node.invoke(game_state())
+
+
+class TestFusedPlayer(unittest.TestCase):
+
+    def setUp(self):
+        action = PlayerAction(action="generate_question", content="Is it an animal?")
+        self.player = GameAgentNode(llm=StructuredLLM(action), tools=[], role="player", system_prompt="")
+        self.player_node = self.player.create_runnable()
+
+    def test_fused_call_emits_tool_call_with_precomputed_response(self):
+        state = game_state(messages=[AIMessage(content="I have a secret topic for you to guess.", name="host")],
+                           task_for_host="answer_question")
+        response = self.player_node.invoke(state, fused_config)
+        tool_call = response["messages"][0].tool_calls[0]
+        self.assertEqual(tool_call["name"], "generate_question")
+        self.assertEqual(tool_call["args"]["messages"], [("human", "I have a secret topic for you to guess.")])
+        self.assertEqual(response["player_response"], "Is it an animal?")
+
+    def test_tool_message_clears_precomputed_response(self):
+        state = game_state(messages=[ToolMessage(content="Is it an animal?", name="generate_question", tool_call_id="1")],
+                           player_response="Is it an animal?")
+        response = self.player_node.invoke(state, fused_config)
+        self.assertEqual(response["most_recent_question"], "Is it an animal?")
+        self.assertEqual(response["num_questions_asked"], 1)
+        self.assertEqual(response["player_response"], "")
+
+
+class TestChatHistoryProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [
+            SystemMessage(content="Let's play a game of 20 questions"),
+            AIMessage(content="", name="host"),
+            ToolMessage(content="dog", name="generate_topic", tool_call_id="1"),
+            AIMessage(content="I have a secret topic for you to guess. Let's start the game.", name="host"),
+            AIMessage(content="Is it an animal?", name="player"),
+        ]
+
+    def test_projection_only_adds_new_messages(self):
+        projection = ChatHistoryProjection("player")
+        self.assertEqual(len(projection.update(self.messages[:3])), 1)
+        new_messages = projection.update(self.messages)
+        self.assertEqual(new_messages, [("human", "I have a secret topic for you to guess. Let's start the game."),
+                                        ("ai", "Is it an animal?")])
+        self.assertEqual(len(projection.history), 3)
+
+    def test_node_keeps_projection_per_game(self):
+        node = GameAgentNode(llm=RaisingLLM(), tools=[], role="host", system_prompt="")
+        config = {"configurable": {"game_id": "game-1"}}
+        full_history = node.format_chat_history(self.messages)
+
+        node.format_chat_history(self.messages[:2], config)
+        self.assertEqual(node.format_chat_history(self.messages, config), full_history)
+        self.assertEqual(node.format_chat_history(self.messages, {"configurable": {"game_id": "game-2"}}), full_history)
+
+        node.release("game-1")
+        self.assertNotIn("game-1", node._game_views)
+
+
+if __name__ == "__main__":
+    unittest.main()
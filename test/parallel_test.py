@@ -5,20 +5,22 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from agent import Game
+from utils.runtime import GameRuntime
 import uuid
 import yaml
 
-def run_game(game_id):
-    system_prompt = yaml.safe_load(open("system_prompts.yaml"))
-    game = Game(system_prompt, game_id)
+def run_game(system_prompt, game_id, runtime):
+    game = Game(system_prompt, game_id, runtime=runtime)
     game.run()
 
 def run_parallel_games(num_games):
     threads = []
+    system_prompt = yaml.safe_load(open("system_prompts.yaml"))
+    runtime = GameRuntime(system_prompt)
 
     for i in range(num_games):
         game_id = str(uuid.uuid4())
-        thread = threading.Thread(target=run_game, args=(game_id,))
+        thread = threading.Thread(target=run_game, args=(system_prompt, game_id, runtime))
         threads.append(thread)
         thread.start()
 
@@ -0,0 +1,121 @@
+import unittest
+import sys
+import os
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.ratelimit import TokenBucket
+from utils.llm import create_llms
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """ Chat completions endpoint answering 429 to the first `throttled` requests and YES afterwards """
+    throttled = 0
+    requests = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            self.requests.append((time.monotonic(), json.loads(body)))
+            throttled = len(self.requests) <= self.throttled
+
+        if throttled:
+            payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+            self.send_response(429)
+            self.send_header("Retry-After", "0.2")
+        else:
+            payload = json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "YES"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+            }).encode()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRateLimitedClients(unittest.TestCase):
+
+    def setUp(self):
+        StubOpenAI.throttled = 0
+        StubOpenAI.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_honours_retry_after(self):
+        StubOpenAI.throttled = 2
+        host_llm, _ = create_llms(api_key="test", base_url=self.base_url, max_retries=3, retry_base_delay=0.01)
+
+        self.assertEqual(host_llm.invoke("Is it alive?").content, "YES")
+        times = [t for t, _ in StubOpenAI.requests]
+        self.assertEqual(len(times), 3)
+        self.assertGreaterEqual(times[1] - times[0], 0.2)
+
+    def test_gives_up_after_max_retries(self):
+        StubOpenAI.throttled = 10
+        host_llm, _ = create_llms(api_key="test", base_url=self.base_url, max_retries=1, retry_base_delay=0.01)
+
+        with self.assertRaises(Exception):
+            host_llm.invoke("Is it alive?")
+        self.assertEqual(len(StubOpenAI.requests), 2)
+
+    def test_roles_share_the_request_budget(self):
+        host_llm, player_llm = create_llms(api_key="test", base_url=self.base_url, requests_per_minute=600)
+
+        async def main():
+            calls = [llm.ainvoke("Is it alive?") for llm in (host_llm, player_llm) for _ in range(6)]
+            return await asyncio.gather(*calls)
+
+        start = time.monotonic()
+        self.assertEqual([m.content for m in asyncio.run(main())], ["YES"] * 12)
+        # 10 requests per second with a burst of 10
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(len(StubOpenAI.requests), 12)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_threads_and_tasks_share_the_bucket(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        async def main():
+            await asyncio.gather(*(bucket.aacquire() for _ in range(4)))
+
+        asyncio.run(main())
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 7 / 20 - 0.01)
+
+    def test_pause_holds_back_callers(self):
+        bucket = TokenBucket(rate=1000)
+        bucket.pause(0.1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from utils.runtime import GameRuntime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+class TestGameRuntime(unittest.TestCase):
+
+    def test_one_runtime_per_prompts(self):
+        runtime = GameRuntime.get(system_prompt)
+        self.assertIs(GameRuntime.get(dict(system_prompt)), runtime)
+        other = GameRuntime.get({**system_prompt, "player": system_prompt["player"] + "\nBe brief."})
+        self.assertIsNot(other, runtime)
+        self.assertIsNot(other.app, runtime.app)
+
+    def test_runtime_is_built_once_across_threads(self):
+        prompts = {**system_prompt, "host": system_prompt["host"] + "\nThreads."}
+        runtimes = []
+        threads = [threading.Thread(target=lambda: runtimes.append(GameRuntime.get(prompts))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(runtime) for runtime in runtimes}), 1)
+
+    def test_games_share_the_compiled_graph(self):
+        games = [Game(system_prompt, f"shared-{i}", verbose=False, log_level="critical", topic=topic)
+                 for i, topic in enumerate(["horse", "piano"])]
+        for game in games:
+            self.assertTrue(game.run()["win"])
+        self.assertIs(games[0].runtime, games[1].runtime)
+        self.assertIs(games[0].app, games[1].app)
+        self.assertIs(games[0].app, GameRuntime.get(system_prompt).app)
+
+    def test_release_game(self):
+        runtime = GameRuntime.get(system_prompt)
+        views = {}
+        release_game = runtime.release_game
+
+        def spy(game_id):
+            views[game_id] = [game_id in node._game_views for node in (runtime.host_agent, runtime.player_agent)]
+            release_game(game_id)
+
+        runtime.release_game = spy
+        try:
+            Game(system_prompt, "released", verbose=False, log_level="critical", runtime=runtime, topic="cat").run()
+        finally:
+            del runtime.release_game
+        # the nodes kept the game's views while it was played, and dropped them at its end
+        self.assertEqual(views, {"released": [True, True]})
+        self.assertNotIn("released", runtime.host_agent._game_views)
+        self.assertNotIn("released", runtime.player_agent._game_views)
+
+
+if __name__ == '__main__':
+    unittest.main()
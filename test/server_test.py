@@ -0,0 +1,201 @@
+import unittest
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+import time
+from unittest import mock
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+import yaml
+from server import GameServer, ServerError
+from utils.checkpoint import SQLiteCheckpointer
+from utils.llm import get_llms
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+class TestGameServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.checkpointer = SQLiteCheckpointer(os.path.join(self.tmp, "sessions.sqlite"))
+
+    def tearDown(self):
+        self.checkpointer.close()
+        shutil.rmtree(self.tmp)
+
+    def serve(self, test, **options):
+        """ Run test(server, client) against a server listening on a free local port """
+        async def main():
+            server = GameServer(system_prompt, self.checkpointer, sweep_interval=3600, **options)
+            await server.start(port=0)
+            try:
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                    await test(server, client)
+            finally:
+                await server.close()
+        asyncio.run(main())
+
+    def test_human_player_wins(self):
+        async def test(server, client):
+            response = await client.post("/sessions", json={"topic": "horse"})
+            self.assertEqual(response.status_code, 201)
+            session = response.json()
+            self.assertEqual(session["status"], "playing")
+            url = f"/sessions/{session['session_id']}/moves"
+
+            session = (await client.post(url, json={"action": "generate_question", "content": "Can you ride it?"})).json()
+            self.assertEqual(session["messages"][-2:], [{"role": "player", "content": "Can you ride it?"},
+                                                         {"role": "host", "content": "YES"}])
+            self.assertEqual(session["questions_left"], 19)
+
+            session = (await client.post(url, json={"action": "make_guess", "content": "bicycle"})).json()
+            self.assertEqual(session["status"], "playing")
+            session = (await client.post(url, json={"action": "make_guess", "content": "horse"})).json()
+            self.assertEqual(session["status"], "finished")
+            self.assertEqual(session["result"], {"win": True, "topic": "horse", "turns": 1})
+
+            response = await client.post(url, json={"action": "make_guess", "content": "horse"})
+            self.assertEqual(response.status_code, 409)
+        self.serve(test)
+
+    def test_bad_requests(self):
+        async def test(server, client):
+            self.assertEqual((await client.get("/sessions/unknown")).status_code, 404)
+            self.assertEqual((await client.post("/sessions", json={"player": "robot"})).status_code, 400)
+            session_id = (await client.post("/sessions", json={})).json()["session_id"]
+            url = f"/sessions/{session_id}/moves"
+            self.assertEqual((await client.post(url, json={"action": "check_guess", "content": "x"})).status_code, 400)
+            self.assertEqual((await client.post(url, json={"action": "make_guess", "content": " "})).status_code, 400)
+            self.assertEqual((await client.post(url, content=b"{")).status_code, 400)
+            self.assertEqual((await client.put(url)).status_code, 405)
+
+            self.assertEqual((await client.delete(f"/sessions/{session_id}")).status_code, 204)
+            self.assertEqual((await client.get(f"/sessions/{session_id}")).status_code, 404)
+            self.assertEqual(self.checkpointer.game_status(session_id)[0], "abandoned")
+        self.serve(test)
+
+    def test_bad_content_length(self):
+        async def test(server, client):
+            for length, status in (("abc", 400), ("-5", 400), ("1_0", 400), (str(server.max_body + 1), 413)):
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(f"POST /sessions HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+                await writer.drain()
+                self.assertEqual((await reader.readline()).split()[1], str(status).encode(), length)
+                writer.close()
+            self.assertEqual(server.sessions, {})
+        self.serve(test)
+
+    def test_self_play_session(self):
+        async def test(server, client):
+            response = await client.post("/sessions", json={"player": "fused", "topic": "piano"})
+            self.assertEqual(response.status_code, 201)
+            # the game is played in the background, the client polls the session
+            session = response.json()
+            self.assertEqual(session["status"], "playing")
+            url = f"/sessions/{session['session_id']}"
+            while session["status"] == "playing":
+                await asyncio.sleep(0.01)
+                session = (await client.get(url)).json()
+            self.assertEqual(session["status"], "finished")
+            self.assertTrue(session["result"]["win"])
+            response = await client.post(f"{url}/moves", json={"action": "make_guess", "content": "piano"})
+            self.assertEqual(response.status_code, 409)
+        self.serve(test)
+
+    def test_self_play_session_closed_with_the_server(self):
+        host_llm = get_llms()[0]
+        latency = host_llm.latency
+        host_llm.latency = 0.2
+
+        async def test(server, client):
+            session_id = (await client.post("/sessions", json={"player": "fused"})).json()["session_id"]
+            await asyncio.sleep(0.05)
+            await server.close()
+            self.assertEqual(server.stats()["failed"], 1)
+            self.assertEqual(self.checkpointer.game_status(session_id)[0], "failed")
+        try:
+            self.serve(test)
+        finally:
+            host_llm.latency = latency
+
+    def test_session_limit(self):
+        async def test(server, client):
+            for _ in range(2):
+                self.assertEqual((await client.post("/sessions", json={})).status_code, 201)
+            response = await client.post("/sessions", json={})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["retry-after"], "1")
+            self.assertEqual((await client.get("/stats")).json()["rejected"], 1)
+        self.serve(test, max_sessions=2)
+
+    def test_busy_server_refuses_moves(self):
+        host_llm = get_llms()[0]
+        latency = host_llm.latency
+        host_llm.latency = 0.2
+
+        async def test(server, client):
+            ids = [(await client.post("/sessions", json={"topic": "horse"})).json()["session_id"] for _ in range(2)]
+            move = {"action": "generate_question", "content": "Is it alive?"}
+            responses = await asyncio.gather(*[client.post(f"/sessions/{i}/moves", json=move) for i in ids])
+            self.assertEqual(sorted(r.status_code for r in responses), [200, 503])
+        try:
+            self.serve(test, max_running=1, max_waiting=0)
+        finally:
+            host_llm.latency = latency
+
+    def test_idle_sessions_are_parked_then_evicted(self):
+        async def test(server, client):
+            session_id = (await client.post("/sessions", json={"topic": "horse"})).json()["session_id"]
+            await server.park(server.sweep(time.monotonic() + server.park_after))
+            self.assertTrue(server.sessions[session_id].parked)
+            self.assertIsNone(server.sessions[session_id].game)
+            self.assertFalse(any(key[0] == session_id for key in self.checkpointer._latest))
+            self.assertNotIn(session_id, server.runtime.host_agent._game_views)
+            self.assertNotIn(session_id, server.runtime.player_agent._game_views)
+
+            # reading a parked session rebuilds its game from the file
+            session = (await client.get(f"/sessions/{session_id}")).json()
+            self.assertEqual((session["status"], session["questions_left"]), ("playing", 20))
+            self.assertFalse(server.sessions[session_id].parked)
+            await server.park(server.sweep(time.monotonic() + server.park_after))
+            self.assertTrue(server.sessions[session_id].parked)
+            self.assertEqual(server.counts["parked"], 2)
+
+            # a parked game continues from the file
+            move = {"action": "make_guess", "content": "horse"}
+            session = (await client.post(f"/sessions/{session_id}/moves", json=move)).json()
+            self.assertTrue(session["result"]["win"])
+
+            parked_id = (await client.post("/sessions", json={"topic": "piano"})).json()["session_id"]
+            await server.park(server.sweep(time.monotonic() + server.park_after))
+            self.assertTrue(server.sessions[parked_id].parked)
+
+            # a move refused while its session is resumed is not lost, the next one resumes the session again
+            move = {"action": "make_guess", "content": "piano"}
+            with mock.patch.object(server, "_reserve", side_effect=ServerError(503, "the server is busy, retry later")):
+                response = await client.post(f"/sessions/{parked_id}/moves", json=move)
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(server.sessions[parked_id].parked)
+            self.assertEqual((await client.post(f"/sessions/{parked_id}/moves", json=move)).json()["status"], "finished")
+            await server.park(server.sweep(time.monotonic() + server.park_after))
+            parked_id = (await client.post("/sessions", json={})).json()["session_id"]
+            await server.park(server.sweep(time.monotonic() + server.park_after))
+            self.assertTrue(server.sessions[parked_id].parked)
+
+            idle_id = (await client.post("/sessions", json={})).json()["session_id"]
+            server.sweep(time.monotonic() + server.idle_timeout)
+            self.assertEqual(server.sessions, {})
+            # the parked session is abandoned without rebuilding its game
+            for session_id in (parked_id, idle_id):
+                self.assertEqual(self.checkpointer.game_status(session_id)[0], "abandoned")
+            self.assertEqual(server.stats()["evicted"], 2)
+        self.serve(test)
+
+
+if __name__ == '__main__':
+    unittest.main()
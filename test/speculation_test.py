@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import asyncio
+import threading
+from unittest import mock
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from utils.fake_llm import FakeChatModel
+from utils.node import Speculation
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+def play(game_id, use_async=False):
+    game = Game(system_prompt, game_id, verbose=False, player_mode="fused", player_speculation=True, log_level="critical")
+    return asyncio.run(game.arun()) if use_async else game.run()
+
+
+class TestPlayerSpeculation(unittest.TestCase):
+
+    def check_hits(self, result):
+        events = result["metrics"]["events"]
+        llm_calls = result["metrics"]["llm_calls"]
+        self.assertTrue(result["win"])
+        # the player's action after every answer was speculated, one of the two branches is used
+        self.assertEqual(events["speculation_hit"], result["turns"])
+        self.assertEqual(events["speculation_started"], 2 * result["turns"])
+        self.assertEqual(events["speculation_cancelled"], result["turns"])
+        self.assertNotIn("speculation_miss", events)
+        self.assertEqual(llm_calls["player"], 1)
+        self.assertEqual(llm_calls["speculation"], 2 * result["turns"])
+
+    def test_sync_game_uses_the_branch_of_the_answer(self):
+        self.check_hits(play("speculation-sync"))
+
+    def test_async_game_uses_the_branch_of_the_answer(self):
+        self.check_hits(play("speculation-async", use_async=True))
+
+    def test_answer_is_read_as_yes_or_no(self):
+        answer = FakeChatModel._answer
+        # the host answers in a sentence, the branch speculated for its YES or NO is played
+        with mock.patch.object(FakeChatModel, "_answer", lambda llm, text: answer(llm, text) + ", it is."):
+            self.check_hits(play("speculation-sentence"))
+
+    def test_speculation_is_a_run_of_its_own(self):
+        game = Game(system_prompt, "speculation-run", verbose=False, player_mode="fused", player_speculation=True,
+                    log_level="critical")
+        with mock.patch.object(type(game.metrics), "on_chain_start", autospec=True,
+                               side_effect=type(game.metrics).on_chain_start) as on_chain_start:
+            result = game.run()
+        self.check_hits(result)
+        starts = [call.kwargs for call in on_chain_start.call_args_list
+                  if (call.kwargs.get("metadata") or {}).get("metrics_source") == "speculation"]
+        roots = [start for start in starts if start.get("parent_run_id") is None]
+        # one root run per speculation, the node run it started in is over by the time it ends
+        self.assertEqual(len(roots), 2 * result["turns"])
+        # nor are its runs taken for the runs of a graph node
+        self.assertFalse(any(key.startswith("langgraph_") for start in starts for key in start["metadata"]))
+
+    def test_unexpected_answer_is_a_miss(self):
+        with mock.patch.object(FakeChatModel, "_answer", return_value="I am not sure."):
+            result = play("speculation-miss")
+        events = result["metrics"]["events"]
+        # the game ends at the question limit, the speculations of the last answer are dropped without a player turn
+        self.assertFalse(result["win"])
+        self.assertEqual(events["speculation_miss"], result["turns"] - 1)
+        self.assertEqual(events["speculation_cancelled"], 2 * (result["turns"] - 1))
+        self.assertNotIn("speculation_hit", events)
+        self.assertEqual(result["metrics"]["llm_calls"]["player"], result["turns"])
+
+    def test_runtime_close_shuts_the_pool_down(self):
+        game = Game(system_prompt, "speculation-close", verbose=False, player_mode="fused", player_speculation=True,
+                    log_level="critical")
+        self.assertTrue(game.run()["win"])
+        node = game.runtime.player_agent
+        pool = node._speculation_pool
+        self.assertIsNotNone(pool)
+        # a speculation still queued when the runtime closes is dropped
+        blocker = threading.Event()
+        running = [pool.submit(blocker.wait) for _ in range(pool._max_workers)]
+        queued = Speculation("YES", {}, pool.submit(lambda: None))
+        node._speculations["in flight"] = [queued]
+        game.runtime.close()
+        blocker.set()
+        for future in running:
+            future.result()
+        self.assertTrue(queued.task.cancelled())
+        self.assertIsNone(node._speculation_pool)
+        self.assertEqual(node._speculations, {})
+        with self.assertRaises(RuntimeError):
+            pool.submit(lambda: None)
+        # the next game starts a new pool
+        self.check_hits(play("speculation-after-close"))
+
+    def test_needs_the_fused_player(self):
+        with self.assertRaises(ValueError):
+            Game(system_prompt, "speculation-tools", player_speculation=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
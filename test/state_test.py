@@ -0,0 +1,124 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.state import TurnRecord, compact_messages
+from utils.context import TranscriptDigest
+from utils.checkpoint import SQLiteCheckpointer
+from utils.runtime import GameRuntime
+from utils.fake_llm import FakeChatModel
+from agent import Game
+
+import yaml
+from unittest import mock
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from test.context_test import play
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+class Logger:
+    def log(self, *args):
+        pass
+
+
+class TestCompactMessages(unittest.TestCase):
+
+    def messages(self):
+        return play([
+            ("generate_topic", "dog"),
+            ("generate_question", "Is it alive?"),
+            ("answer_question", "YES"),
+        ])
+
+    def test_only_last_message_is_kept_whole(self):
+        messages = []
+        for m in self.messages():
+            messages = compact_messages(messages, [m])
+        self.assertTrue(all(isinstance(m, TurnRecord) for m in messages[:-1]))
+        self.assertIsInstance(messages[-1], AIMessage)
+
+    def test_records_keep_role_name_and_content(self):
+        messages = []
+        for m in self.messages():
+            messages = compact_messages(messages, [m])
+        tool = messages[5]
+        self.assertEqual((tool.role, tool.type, tool.name, tool.content), ("player", "tool", "generate_question", "Is it alive?"))
+        self.assertEqual((messages[4].role, messages[4].type), ("player", "ai"))
+
+    def test_views_read_records_like_messages(self):
+        full = self.messages()
+        compacted = []
+        for m in full:
+            compacted = compact_messages(compacted, [m])
+        expected, digest = TranscriptDigest(), TranscriptDigest()
+        expected.update(full)
+        digest.update(compacted)
+        self.assertEqual(digest.render(), expected.render())
+
+    def test_checkpoint_serializer_roundtrip(self):
+        record = TurnRecord("host", "tool", "answer_question", "YES")
+        serde = JsonPlusSerializer(allowed_msgpack_modules=SQLiteCheckpointer.allowed_msgpack_modules)
+        self.assertEqual(serde.loads_typed(serde.dumps_typed(record)), record)
+
+
+class TestCorrectToolCall(unittest.TestCase):
+
+    def setUp(self):
+        call = {"name": "answer_question", "args": {"topic": "cat", "question": "Is it alive?",
+                                                    "task_for_host": "answer_question"}, "id": "1"}
+        self.message = AIMessage(content="", name="host", tool_calls=[call], id="run-1")
+        self.state = {"messages": [SystemMessage(content="Let's play"), self.message], "task_for_host": "answer_question",
+                      "topic": "dog", "most_recent_question": "Is it alive?", "guess": ""}
+
+    def test_fix_does_not_change_the_llm_tool_call(self):
+        fixed = GameRuntime._correct_tool_call(None, self.state, Logger())
+        self.assertEqual(fixed.tool_calls[0]["args"]["topic"], "dog")
+        self.assertEqual(fixed.id, self.message.id)
+        self.assertEqual(self.message.tool_calls[0]["args"]["topic"], "cat")
+        self.assertIsNone(GameRuntime._correct_tool_call(None, {**self.state, "topic": "cat"}, Logger()))
+
+    def test_router_leaves_the_state_alone(self):
+        runtime = GameRuntime.get(system_prompt)
+        config = {"configurable": {"logger": Logger(), "max_questions": 20}}
+        state = {**self.state, "num_questions_asked": 1, "num_questions_answered": 0}
+        self.assertEqual(runtime._router(state, config), "call_tool")
+        self.assertEqual(self.message.tool_calls[0]["args"]["topic"], "cat")
+
+    def test_fixed_call_replaces_the_message_in_the_history(self):
+        runtime = GameRuntime.get(system_prompt)
+        config = {"configurable": {"logger": Logger(), "max_questions": 20}}
+        tool_input, fixed = runtime._tool_input(self.state, config)
+        self.assertIs(tool_input["messages"][-1], fixed)
+        tool_message = ToolMessage(content="YES", name="answer_question", tool_call_id="1")
+        update = runtime._tool_output({"messages": [tool_message]}, fixed)
+        self.assertEqual(update["messages"], [fixed, tool_message])
+
+        history = compact_messages(self.state["messages"], update["messages"])
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history[1].role, "host")
+        self.assertIs(history[2], tool_message)
+
+    def test_game_with_wrong_host_calls(self):
+        host_tool_call = FakeChatModel._host_tool_call
+
+        def wrong_tool_call(self, messages):
+            # the host checks a guess with the wrong topic while it should answer the question
+            name, args = host_tool_call(self, messages)
+            if name == "answer_question":
+                return "check_guess", {"topic": "cat", "guess": "", "task_for_host": "check_guess"}
+            return name, args
+
+        with mock.patch.object(FakeChatModel, "_host_tool_call", wrong_tool_call):
+            game = Game(system_prompt, "wrong-calls", verbose=False, log_level="critical", topic="horse")
+            result = game.run()
+        self.assertTrue(result["win"])
+        self.assertEqual(result["metrics"]["events"]["tool_call_correction"], result["turns"])
+        self.assertIn("host: YES", game.dialogs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+import io
+import asyncio
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from utils.fake_llm import FakeChatModel
+from utils.streaming import ConsoleSink, CallbackSink
+from langchain_core.messages import HumanMessage
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+def play(stream_sink=None, run_async=False, **kwargs):
+    game = Game(system_prompt, "streaming", verbose=False, log_level="critical", topic="horse",
+                stream_sink=stream_sink, **kwargs)
+    result = asyncio.run(game.arun()) if run_async else game.run()
+    return game, result
+
+
+class TestFakeStreaming(unittest.TestCase):
+
+    def test_chunks_add_up_to_the_response(self):
+        llm = FakeChatModel()
+        messages = [HumanMessage(content="You are a host of 20 questions game. You already come up with a secret topic "
+                                         "given as dog.\nThe question is given as Does it bark?\n")]
+        chunks = list(llm.stream(messages))
+        self.assertEqual("".join(c.content for c in chunks), llm.invoke(messages).content)
+
+        question = [HumanMessage(content="Your task is to ask a YES-or-NO type question")]
+        chunks = list(llm.stream(question))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(c.content for c in chunks), llm.invoke(question).content)
+
+
+class TestStreamingGame(unittest.TestCase):
+
+    def test_same_game_as_without_sink(self):
+        tokens, messages = [], []
+        game, result = play(CallbackSink(lambda *a: tokens.append(a), lambda *a: messages.append(a)))
+        expected_game, expected = play()
+        self.assertEqual(game.dialogs, expected_game.dialogs)
+        self.assertEqual(game.state, expected_game.state)
+        self.assertEqual((result["win"], result["turns"], result["llm_calls"]),
+                         (expected["win"], expected["turns"], expected["llm_calls"]))
+
+        # every question and answer is streamed by its tool, then sent whole with the node's update
+        self.assertEqual([f"{role}: {content}" for role, content in messages], game.dialogs[1:])
+        streamed = {(role, source) for role, source, _ in tokens}
+        self.assertEqual(streamed, {("player", "generate_question"), ("host", "answer_question"), ("player", "make_guess")})
+        question = "".join(text for role, source, text in tokens if source == "generate_question" and role == "player")
+        self.assertTrue(question.startswith(messages[0][1]))
+
+    def test_topic_is_never_streamed(self):
+        tokens = []
+        game = Game(system_prompt, "secret", verbose=False, log_level="critical",
+                    stream_sink=CallbackSink(lambda *a: tokens.append(a)))
+        asyncio.run(game.arun())
+        self.assertTrue(tokens)
+        self.assertNotIn("generate_topic", {source for _, source, _ in tokens})
+
+    def test_console_prints_every_message_once(self):
+        out = io.StringIO()
+        game, _ = play(ConsoleSink(out), run_async=True)
+        self.assertEqual(out.getvalue().splitlines(), game.dialogs[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import asyncio
+import shutil
+import tempfile
+from collections import Counter
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+from agent import Game
+from tournament import run_tournament_async
+from utils.fake_llm import FakeChatModel, DEFAULT_KNOWLEDGE
+from utils.topics import TopicScheduler, pool_from_csv, generate_topic_pool, save_topic_pool, load_topic_pool
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+system_prompt = yaml.safe_load(open(os.path.join(ROOT, "system_prompts.yaml")))
+
+
+def pool(strata):
+    return {"topics": [{"topic": f"{category} {i}", "category": category}
+                       for category, size in strata.items() for i in range(size)]}
+
+
+class TestTopicScheduler(unittest.TestCase):
+
+    def test_workers_deal_every_topic_once_per_cycle(self):
+        scheduler = TopicScheduler(pool({"animals": 30, "places": 10}), seed="run1")
+        # 4 workers of 10 games each, with the indices of tournament.run_worker
+        topics = [scheduler.topic(worker_id * 10 + i) for worker_id in range(4) for i in range(10)]
+        self.assertEqual(len(set(topics)), 40)
+
+        self.assertEqual(topics, [TopicScheduler(pool({"animals": 30, "places": 10}), seed="run1").topic(i) for i in range(40)])
+        self.assertNotEqual(topics, [TopicScheduler(pool({"animals": 30, "places": 10}), seed="run2").topic(i) for i in range(40)])
+        # the next cycle deals every topic again, in another order
+        next_cycle = [scheduler.topic(40 + i) for i in range(40)]
+        self.assertEqual(set(next_cycle), set(topics))
+        self.assertNotEqual(next_cycle, topics)
+
+    def test_every_run_of_games_is_stratified(self):
+        scheduler = TopicScheduler(pool({"animals": 30, "places": 10, "plants": 20}), seed=7)
+        for k in range(1, 61):
+            counts = Counter(scheduler.topic(i).split()[0] for i in range(k))
+            for category, share in (("animals", 0.5), ("places", 1 / 6), ("plants", 1 / 3)):
+                self.assertLessEqual(abs(counts[category] - k * share), 1)
+
+    def test_next_topic_and_duplicates(self):
+        scheduler = TopicScheduler({"topics": [{"topic": "Dog"}, {"topic": " dog."}, {"topic": "cat"}]})
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual({scheduler.next_topic(), scheduler.next_topic()}, {"Dog", "cat"})
+
+
+class TestTopicPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+    def test_pool_from_the_reference_csv(self):
+        topics = pool_from_csv()["topics"]
+        self.assertGreater(len(topics), 1800)
+        self.assertEqual(topics[0], {"topic": "aardvark", "category": "things"})
+        self.assertEqual(len({t["topic"].lower() for t in topics}), len(topics))
+
+        path = os.path.join(self.tmp_dir, "pools", "things.json")
+        save_topic_pool({"source": "csv", "topics": topics}, path)
+        self.assertEqual(load_topic_pool(path)["topics"], topics)
+
+    def test_generated_pool_is_deduplicated(self):
+        generated = generate_topic_pool(10, llm=FakeChatModel(), categories=("animals", "things"), batch_size=8)
+        topics = [t["topic"] for t in generated["topics"]]
+        self.assertEqual(len(topics), len(set(topics)))
+        self.assertTrue(set(topics) <= set(DEFAULT_KNOWLEDGE["topics"]))
+        self.assertLessEqual(max(Counter(t["category"] for t in generated["topics"]).values()), 5)
+
+
+class TestPresetTopic(unittest.TestCase):
+
+    def test_game_starts_without_generating_a_topic(self):
+        result = Game(system_prompt, "preset", verbose=False, log_level="critical", topic="salmon").run()
+        self.assertEqual(result["topic"], "salmon")
+        self.assertTrue(result["win"])
+        self.assertEqual(result["node_order_violations"], 0)
+        self.assertNotIn("generate_topic", result["metrics"]["llm_calls"])
+
+    def test_tournament_plays_the_scheduled_topics(self):
+        scheduler = TopicScheduler({"topics": [{"topic": t} for t in DEFAULT_KNOWLEDGE["topics"]]}, seed=1)
+        topics = [scheduler.topic(i) for i in range(6)]
+        results = asyncio.run(run_tournament_async(system_prompt, 6, topics=topics, game_options={"log_level": "critical"}))
+        self.assertEqual([r["topic"] for r in results], topics)
+        self.assertTrue(all(r["win"] for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tournament import merge_shards, run_tournament, run_worker, shard_path
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PROMPTS = os.path.join(ROOT, "system_prompts.yaml")
+GAME_OPTIONS = {"log_level": "critical"}
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestTournament(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_worker_writes_one_line_per_game(self):
+        path = run_worker(3, 4, PROMPTS, self.output_dir, 2, GAME_OPTIONS)
+        self.assertEqual(path, shard_path(self.output_dir, 3))
+        results = read_lines(path)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len({r["game_id"] for r in results}), 4)
+        for result in results:
+            self.assertEqual(result["worker_id"], 3)
+            self.assertNotIn("error", result)
+            self.assertTrue(result["topic"])
+            self.assertGreater(result["llm_calls"], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "metrics_worker_3.json")))
+
+    def test_invalid_game_options_fail_the_games_not_the_worker(self):
+        options = {**GAME_OPTIONS, "player_speculation": True}
+        results = read_lines(run_worker(0, 2, PROMPTS, self.output_dir, 2, options))
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIn("player_speculation", result["error"])
+            self.assertFalse(result["win"])
+
+    def test_merge_shards(self):
+        def result(game_id, win, turns, **extra):
+            return {"game_id": game_id, "topic": f"topic {game_id}", "win": win, "turns": turns, "llm_calls": 2 * turns,
+                    "wall_time": 1.0, "setup_time": 0.5, **extra}
+
+        shards = {
+            0: [result("a", True, 4), result("b", False, 20)],
+            1: [result("c", True, 6), result("d", False, 0, error="ConnectionError()")],
+        }
+        paths = []
+        for worker_id, results in shards.items():
+            paths.append(shard_path(self.output_dir, worker_id))
+            with open(paths[-1], "w") as shard:
+                shard.writelines(json.dumps({**r, "worker_id": worker_id}) + "\n" for r in results)
+
+        summary = merge_shards(self.output_dir, paths)
+        self.assertEqual([r["game_id"] for r in read_lines(os.path.join(self.output_dir, "results.jsonl"))],
+                         ["a", "b", "c", "d"])
+        with open(os.path.join(self.output_dir, "summary.json")) as f:
+            self.assertEqual(json.load(f), summary)
+        self.assertEqual((summary["games"], summary["failed"], summary["wins"]), (4, 1, 2))
+        self.assertAlmostEqual(summary["win_rate"], 2 / 3)
+        self.assertEqual(summary["avg_turns"], 10)
+        self.assertEqual(summary["avg_llm_calls"], 20)
+        self.assertEqual(summary["distinct_topics"], 4)
+
+    def test_process_pool(self):
+        summary = run_tournament(2, 2, PROMPTS, self.output_dir, max_concurrency=2, game_options=GAME_OPTIONS)
+        self.assertEqual((summary["games"], summary["failed"]), (4, 0))
+        results = read_lines(os.path.join(self.output_dir, "results.jsonl"))
+        self.assertEqual(sorted(r["worker_id"] for r in results), [0, 0, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,12 +19,12 @@ player_system_prompt = system_prompt["player"]
 host_node = GameAgentNode(llm=host_llm, 
                          tools=host_tools, 
                          role="host", 
-                        system_prompt=host_system_prompt).create_node()
+                        system_prompt=host_system_prompt).create_runnable()
 
 player_node = GameAgentNode(llm=player_llm, 
                             tools=player_tools, 
                             role="player", 
-                            system_prompt=player_system_prompt).create_node()
+                            system_prompt=player_system_prompt).create_runnable()
 
 class Test(unittest.TestCase):
 
@@ -36,7 +36,7 @@ class Test(unittest.TestCase):
                            topic="")
 
 
-        response = host_node(state)
+        response = host_node.invoke(state)
         self.assertEqual(response['messages'][0].tool_calls[0]['name'], 'generate_topic')
 
     def test_host_agent_is_answering_question(self):
@@ -48,7 +48,7 @@ class Test(unittest.TestCase):
                            task_for_host="answer_question", 
                            topic="dog") 
         
-        response = host_node(state)
+        response = host_node.invoke(state)
         self.assertEqual(response['messages'][0].tool_calls[0]['name'], 'answer_question') 
     
     def test_host_agent_is_checking_guess(self):
@@ -61,7 +61,7 @@ class Test(unittest.TestCase):
                            topic="kitten",
                            task_for_host="check_guess")
         
-        response = host_node(state)
+        response = host_node.invoke(state)
         self.assertEqual(response['messages'][0].tool_calls[0]['name'], 'check_guess')
         
     def test_player_agent_is_generating_question(self):
@@ -69,7 +69,7 @@ class Test(unittest.TestCase):
                                      AIMessage(content="Is it a dog?"),
                                      HumanMessage(content="No")])
         
-        response = player_node(state)
+        response = player_node.invoke(state)
         self.assertEqual(response['messages'][0].tool_calls[0]['name'], 'generate_question')
 
 
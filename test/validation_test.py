@@ -0,0 +1,52 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.validation import NodeOrderValidator
+
+TURN = ["host", "call_tool", "host", "player", "call_tool", "player"]
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.records = []
+
+    def log(self, message, *args, level="info"):
+        self.records.append((level, message % args))
+
+    def event(self, event, level="info", **fields):
+        self.records.append((level, event, fields))
+
+
+class TestNodeOrderValidator(unittest.TestCase):
+
+    def test_legal_game(self):
+        logger = RecordingLogger()
+        validator = NodeOrderValidator(logger)
+        for node in TURN * 20 + ["host", "call_tool", "host"]:
+            self.assertTrue(validator.update(node))
+
+        summary = validator.finish()
+        self.assertEqual(summary["node_order_violations"], 0)
+        self.assertEqual(summary["node_updates"], 123)
+        self.assertTrue(summary["ended_after_turn"])
+        # nothing but the summary is logged
+        self.assertEqual(logger.records, [("info", "node_order", summary)])
+
+    def test_violation_is_counted_once(self):
+        logger = RecordingLogger()
+        validator = NodeOrderValidator(logger)
+        # the player's tool call is missing in the second turn
+        nodes = TURN + ["host", "call_tool", "host", "player", "player"] + TURN * 3
+        results = [validator.update(node) for node in nodes]
+
+        self.assertEqual(results.count(False), 1)
+        self.assertEqual(validator.violations, 1)
+        self.assertEqual(logger.records[0][0], "error")
+        self.assertIn("Invalid node order: player at index 10", logger.records[0][1])
+        self.assertEqual(validator.finish()["node_order_violations"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
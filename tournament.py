@@ -0,0 +1,333 @@
+"""
+Tournament runner for the 20 questions game.
+
+Run N games across a pool of worker processes. Every worker builds one GameRuntime, so its games
+share the compiled graph and the LLM clients, and keeps up to `concurrency` games in flight on its
+own event loop. Each worker appends one JSON line per game to its own result shard, and the shards
+are merged when all workers are done:
+
+    python -m tournament --workers 8 --games-per-worker 50 --concurrency 16
+
+With --checkpoint the games are saved after every step to checkpoints.sqlite in the output directory, and
+an interrupted tournament is continued with `python -m tournament --resume <output directory>`: finished
+games are skipped and unfinished games continue from their last saved step.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import asyncio
+import json
+import os
+import uuid
+import yaml
+
+from agent import Game
+from utils.runtime import GameRuntime
+from utils import logger as experiment_logger
+from utils.metrics import ProcessMetrics, process_metrics
+
+
+async def run_tournament_async(system_prompt, num_games, max_concurrency=32, runtime=None, on_result=None, game_options=None,
+                               seed=None, checkpointer=None, game_ids=None, topics=None):
+    """
+    Run many games on one event loop. At most max_concurrency games are in flight at the same time,
+    the rest wait on a semaphore instead of holding a thread each.
+
+    -- arguments:
+        system_prompt: the system prompts of the host and the player
+        num_games: the number of games to run
+        max_concurrency: the maximum number of games in flight
+        runtime: the GameRuntime shared by the games, the process-wide runtime of the prompts if not given
+        on_result: optional callback called with the result of each game as soon as it finishes
+        game_options: optional keyword arguments of Game, e.g. {"host_mode": "direct"}
+        seed: optional seed of the run, game i is seeded with "<seed>-<i>" so that the run can be replayed
+        checkpointer: optional SQLiteCheckpointer saving the games; finished games are not played again,
+            their saved result is returned, and unfinished games continue from their saved state
+        game_ids: optional ids of the games, to find them in the checkpointer again; random ids by default
+        topics: optional preset topics of the games, e.g. from a utils.topics.TopicScheduler; the host
+            generates the topics by default
+
+    -- returns:
+        list of game results, in the order of the games; the result of a game that failed holds the repr
+        of its exception under "error"
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    runtime = runtime or GameRuntime.get(system_prompt)
+    game_options = game_options or {}
+
+    async def play(game_id, game_seed, topic):
+        async with semaphore:
+            status, result = checkpointer.game_status(game_id) if checkpointer else (None, None)
+            if status == "finished":
+                if on_result:
+                    on_result(result)
+                return result
+
+            game = None
+            try:
+                game = Game(system_prompt, game_id, verbose=False, runtime=runtime, seed=game_seed,
+                            checkpointer=checkpointer, topic=topic, **game_options)
+                result = await game.arun()
+            except Exception as e:
+                # a game that could not be built, e.g. with invalid options, fails alone like a game that crashed
+                summary = game.result() if game else {"game_id": str(game_id), "topic": topic or "", "seed": game_seed,
+                                                      "win": False, "turns": 0, "llm_calls": 0}
+                result = {**summary, "error": repr(e)}
+            if on_result:
+                on_result(result)
+            return result
+
+    game_ids = game_ids or [str(uuid.uuid4()) for _ in range(num_games)]
+    topics = topics or [None] * len(game_ids)
+    tasks = [play(game_id, None if seed is None else f"{seed}-{i}", topic)
+             for i, (game_id, topic) in enumerate(zip(game_ids, topics))]
+    return await asyncio.gather(*tasks)
+
+
+def shard_path(output_dir, worker_id):
+    return os.path.join(output_dir, f"shard_{worker_id}.jsonl")
+
+
+def run_worker(worker_id, num_games, prompts_path, output_dir, max_concurrency, game_options=None,
+               answer_cache_path=None, batch_size=1, batch_wait=0.01, metrics_format="json", seed=None,
+               cassette_dir=None, cassette_mode="record", checkpoint_path=None, topic_pool=None):
+    """
+    Entry point of a worker process: play num_games games and write their results to the worker's shard.
+    With answer_cache_path, the workers share one on-disk cache of the host's answers.
+    With batch_size > 1, the tools' LLM calls of the worker's games are sent in batches.
+    The metrics of the worker's games, and the stats of its batching executors, are exported to
+    metrics_worker_<id>.json (.prom) in metrics_format.
+    With cassette_dir, the LLM traffic of the seeded games is recorded to cassette_dir/worker_<id>.jsonl,
+    or replayed from the cassettes in cassette_dir.
+    With checkpoint_path, the games are saved to that SQLite file under the ids <worker_id>-<i>, so that
+    running the worker again skips its finished games and continues the others.
+    With topic_pool, the games play the topics of the pool's TopicScheduler seeded by seed: game i of the
+    worker gets the topic of index worker_id * num_games + i, so the workers never deal the same topic
+    twice in a cycle and the topics of a run only depend on its seed.
+
+    -- returns:
+        the path of the result shard
+    """
+    # the engine is loaded by the workers, the parent process only parses the arguments and merges the shards
+    from utils.tools import enable_answer_cache
+    from utils.batching import enable_batching, disable_batching, aclose_batching
+    from utils.llm import get_llms
+    from utils.cassette import use_cassette, stop_cassette
+    from utils.checkpoint import SQLiteCheckpointer
+    from utils.topics import TopicScheduler, load_topic_pool
+    from utils.matching import get_matcher
+
+    system_prompt = yaml.safe_load(open(prompts_path))
+    path = shard_path(output_dir, worker_id)
+    # a pool process may run more than one worker task
+    process_metrics.reset()
+    if answer_cache_path:
+        enable_answer_cache(answer_cache_path)
+    executors = {}
+    if batch_size > 1:
+        executors = dict(zip(("host", "player"), enable_batching(list(get_llms()), batch_size, batch_wait)))
+    if cassette_dir and cassette_mode == "record":
+        use_cassette(os.path.join(cassette_dir, f"worker_{worker_id}.jsonl"), "record")
+    elif cassette_dir:
+        use_cassette(cassette_dir, "replay")
+    checkpointer, game_ids = None, None
+    if checkpoint_path:
+        checkpointer = SQLiteCheckpointer(checkpoint_path)
+        game_ids = [f"{worker_id}-{i}" for i in range(num_games)]
+    topics = None
+    if topic_pool:
+        pool = load_topic_pool(topic_pool)
+        # the guesses are told apart from the topics of the pool too
+        get_matcher().add(entry["topic"] for entry in pool["topics"])
+        scheduler = TopicScheduler(pool, seed=seed or 0)
+        topics = [scheduler.topic(worker_id * num_games + i) for i in range(num_games)]
+
+    with open(path, "w") as shard:
+        def write_result(result):
+            shard.write(json.dumps({**result, "worker_id": worker_id}) + "\n")
+            shard.flush()
+
+        async def play():
+            try:
+                await run_tournament_async(
+                    system_prompt, num_games, max_concurrency, on_result=write_result, game_options=game_options,
+                    seed=None if seed is None else f"{seed}-{worker_id}", checkpointer=checkpointer,
+                    game_ids=game_ids, topics=topics,
+                )
+            finally:
+                await aclose_batching()
+                GameRuntime.get(system_prompt).close()
+
+        try:
+            asyncio.run(play())
+        finally:
+            if executors:
+                process_metrics.record_batching({llm: executor.stats() for llm, executor in executors.items()})
+                disable_batching()
+            # the pool may end the worker without running atexit, write out the queued log records now
+            experiment_logger.shutdown()
+            stop_cassette()
+            if checkpointer:
+                checkpointer.close()
+            extension = "prom" if metrics_format == "prometheus" else "json"
+            process_metrics.export(os.path.join(output_dir, f"metrics_worker_{worker_id}.{extension}"), metrics_format)
+    return path
+
+
+def merge_shards(output_dir, shard_paths):
+    """
+    Merge the result shards into results.jsonl and write a summary.json of the tournament.
+
+    -- returns:
+        the summary of the tournament
+    """
+    results = []
+    with open(os.path.join(output_dir, "results.jsonl"), "w") as merged:
+        for path in shard_paths:
+            with open(path) as shard:
+                for line in shard:
+                    merged.write(line)
+                    results.append(json.loads(line))
+
+    finished = [r for r in results if "error" not in r]
+    summary = {
+        "games": len(results),
+        "failed": len(results) - len(finished),
+        "wins": sum(r["win"] for r in finished),
+        "win_rate": sum(r["win"] for r in finished) / len(finished) if finished else 0.0,
+        "avg_turns": sum(r["turns"] for r in finished) / len(finished) if finished else 0.0,
+        "avg_llm_calls": sum(r["llm_calls"] for r in finished) / len(finished) if finished else 0.0,
+        "avg_wall_time": sum(r["wall_time"] for r in finished) / len(finished) if finished else 0.0,
+        "avg_setup_time": sum(r["setup_time"] for r in finished) / len(finished) if finished else 0.0,
+        "node_order_violations": sum(r.get("node_order_violations", 0) for r in finished),
+        "games_with_violations": sum(1 for r in finished if r.get("node_order_violations")),
+        "resumed_games": sum(1 for r in results if r.get("resumed")),
+        "distinct_topics": len({r["topic"].strip().lower() for r in results if r.get("topic")}),
+    }
+    metrics = ProcessMetrics()
+    for r in results:
+        if r.get("metrics"):
+            metrics.record_game(r["game_id"], r["metrics"])
+    summary["metrics"] = metrics.snapshot()
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_tournament(num_workers, games_per_worker, prompts_path="system_prompts.yaml", output_dir=None, max_concurrency=8,
+                   game_options=None, answer_cache_path=None, batch_size=1, batch_wait=0.01, metrics_format="json",
+                   seed=None, cassette_dir=None, cassette_mode="record", checkpoint=False, topic_pool=None):
+    """
+    Run num_workers * games_per_worker games across a process pool and merge their result shards.
+    The arguments are saved to tournament.json in the output directory for resume_tournament.
+    With checkpoint, the games are saved to checkpoints.sqlite in the output directory.
+    With topic_pool, the games play the topics of the pool (see run_worker) instead of generating them.
+    """
+    output_dir = output_dir or os.path.join("results", datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "tournament.json"), "w") as f:
+        json.dump({
+            "num_workers": num_workers, "games_per_worker": games_per_worker, "prompts_path": prompts_path,
+            "max_concurrency": max_concurrency, "game_options": game_options, "answer_cache_path": answer_cache_path,
+            "batch_size": batch_size, "batch_wait": batch_wait, "metrics_format": metrics_format, "seed": seed,
+            "cassette_dir": cassette_dir, "cassette_mode": cassette_mode, "checkpoint": checkpoint,
+            "topic_pool": topic_pool,
+        }, f, indent=2)
+    checkpoint_path = os.path.join(output_dir, "checkpoints.sqlite") if checkpoint else None
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = [
+            pool.submit(run_worker, worker_id, games_per_worker, prompts_path, output_dir, max_concurrency, game_options,
+                        answer_cache_path, batch_size, batch_wait, metrics_format, seed, cassette_dir, cassette_mode,
+                        checkpoint_path, topic_pool)
+            for worker_id in range(num_workers)
+        ]
+        shard_paths = [future.result() for future in futures]
+
+    return merge_shards(output_dir, shard_paths)
+
+
+def resume_tournament(output_dir):
+    """
+    Continue a tournament run with checkpoint in output_dir, with its saved arguments: finished games
+    are skipped, unfinished games continue from their last saved step and the others are played.
+    """
+    with open(os.path.join(output_dir, "tournament.json")) as f:
+        arguments = json.load(f)
+    if not arguments["checkpoint"]:
+        raise ValueError(f"The tournament in {output_dir} was run without checkpoint, it can't be resumed")
+    return run_tournament(output_dir=output_dir, **arguments)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a tournament of 20 questions games across a process pool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--games-per-worker", type=int, default=10, help="number of games played by each worker")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum number of games in flight per worker")
+    parser.add_argument("--prompts", default="system_prompts.yaml", help="path to the system prompts")
+    parser.add_argument("--output-dir", default=None, help="directory of the result shards, results/<timestamp> by default")
+    parser.add_argument("--host-mode", choices=["llm", "direct"], default="llm",
+                        help="let the host LLM pick its tool, or build the host's tool call directly from the game state")
+    parser.add_argument("--player-mode", choices=["tools", "fused"], default="tools",
+                        help="let the player pick a tool that writes the text, or do both in one structured-output call")
+    parser.add_argument("--player-speculation", action="store_true",
+                        help="with --player-mode fused, generate the player's next action for both answers while the host answers")
+    parser.add_argument("--player-knowledge", default=None, metavar="PATH",
+                        help="knowledge base (.json table or CSV with question columns) picking the player's questions and guesses")
+    parser.add_argument("--player-context", choices=["full", "digest"], default="full",
+                        help="send the player the whole chat history, or a digest of the game plus the last few messages")
+    parser.add_argument("--context-window", type=int, default=4, help="number of raw messages kept in the digest context")
+    parser.add_argument("--digest-questions", type=int, default=20, help="number of most recent questions kept in the digest")
+    parser.add_argument("--answer-cache", default=None, help="path of the SQLite cache of the host's answers, disabled by default")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="send the tools' LLM calls of concurrent games in batches of up to this size, 1 disables batching")
+    parser.add_argument("--batch-wait", type=float, default=10, help="maximum time in ms a call waits for its batch to fill")
+    parser.add_argument("--log-level", choices=["debug", "info", "warning", "error"], default="info",
+                        help="minimum level of the game logs")
+    parser.add_argument("--log-format", choices=["text", "jsonl"], default="text", help="format of the game logs")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json",
+                        help="format of the per-worker metrics files")
+    parser.add_argument("--seed", default=None, help="seed of the games, the same seed plays the same games from a cassette")
+    parser.add_argument("--cassette", default=None, help="directory of the cassettes recording the LLM traffic of the games")
+    parser.add_argument("--cassette-mode", choices=["record", "replay"], default="record",
+                        help="record the LLM traffic to the cassettes, or replay it from them without calling the LLM")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="save the games after every step, so that the tournament can be resumed after a crash")
+    parser.add_argument("--topic-pool", default=None, metavar="PATH",
+                        help="play the topics of a pool built with `python -m utils.topics`, dealt without repeats from --seed")
+    parser.add_argument("--resume", default=None, metavar="OUTPUT_DIR",
+                        help="continue the tournament in OUTPUT_DIR with its saved arguments, the other arguments are ignored")
+    args = parser.parse_args()
+    if args.resume:
+        print(json.dumps(resume_tournament(args.resume), indent=2))
+        raise SystemExit
+    if args.cassette and args.seed is None:
+        parser.error("--cassette needs a --seed, the games are replayed by their seeds")
+    if args.cassette and args.batch_size > 1:
+        parser.error("--cassette can't be combined with --batch-size, batched calls lose the seed of their game")
+    if args.player_speculation and args.player_mode != "fused":
+        parser.error("--player-speculation needs --player-mode fused")
+    if args.player_knowledge:
+        from utils.knowledge import load_knowledge_base
+        try:
+            load_knowledge_base(args.player_knowledge)
+        except (OSError, ValueError) as e:
+            parser.error(f"--player-knowledge: {e}")
+
+    game_options = {
+        "host_mode": args.host_mode,
+        "player_mode": args.player_mode,
+        "player_speculation": args.player_speculation,
+        "player_knowledge": args.player_knowledge,
+        "player_context": args.player_context,
+        "context_window": args.context_window,
+        "digest_questions": args.digest_questions,
+        "log_level": args.log_level,
+        "log_format": args.log_format,
+    }
+    summary = run_tournament(args.workers, args.games_per_worker, args.prompts, args.output_dir, args.concurrency,
+                             game_options, args.answer_cache, args.batch_size, args.batch_wait / 1000,
+                             args.metrics_format, args.seed, args.cassette, args.cassette_mode, args.checkpoint,
+                             args.topic_pool)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,264 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter
+from langchain_core.runnables.config import ensure_config
+import asyncio
+import queue
+import threading
+import time
+
+# put in a collector's queue to stop it after the requests before it
+_CLOSE = object()
+
+
+class BatchingExecutor:
+    """Collect concurrent calls to a chat model and send them through its batch/abatch.
+
+    Requests are collected until max_batch_size requests are waiting or max_wait seconds have passed
+    since the first one, then sent as one batch. Every request keeps its own run config, so callbacks
+    of each game still see their own LLM calls. Sync callers are served by a collector thread and async
+    callers by a collector task on their event loop. aclose stops the collector task of the running loop
+    and close stops all of them, once the requests already waiting are sent.
+
+    Args:
+        llm: The chat model
+        max_batch_size (int): Maximum number of requests in a batch
+        max_wait (float): Maximum time in seconds a request waits for the batch to fill
+    """
+
+    def __init__(self, llm, max_batch_size=16, max_wait=0.01):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.requests = 0
+        self.batches = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+        self._stats_lock = threading.Lock()
+
+        self._queue = None
+        self._queue_lock = threading.Lock()
+        self._collector = None
+        self._pool = None
+        # event loop -> (queue, collector task, batch tasks in flight), removed when the collector task ends.
+        # The task holds its loop, so the entry is what lets a finished loop be freed: asyncio.run cancels
+        # the collector when its loop shuts down
+        self._async_collectors = {}
+        self._closed = False
+
+    def _enqueued(self):
+        with self._stats_lock:
+            self.requests += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _dequeued(self, batch_size):
+        with self._stats_lock:
+            self.batches += 1
+            self.queue_depth -= batch_size
+            self.batch_sizes[batch_size] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            }
+
+    def invoke(self, prompt_value, config=None):
+        """Send the prompt with the next batch and wait for its response."""
+        with self._queue_lock:
+            if self._closed:
+                raise RuntimeError("The batching executor is closed")
+            if self._collector is None:
+                self._queue = queue.Queue()
+                self._pool = ThreadPoolExecutor(thread_name_prefix="llm-batch")
+                self._collector = threading.Thread(target=self._collect, name="llm-batch-collector", daemon=True)
+                self._collector.start()
+
+        future = Future()
+        self._enqueued()
+        self._queue.put((prompt_value, ensure_config(config), future))
+        return future.result()
+
+    def _collect(self):
+        closing = False
+        while not closing:
+            request = self._queue.get()
+            if request is _CLOSE:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is _CLOSE:
+                    closing = True
+                    break
+                batch.append(request)
+            self._dequeued(len(batch))
+            # keep collecting while the batch is in flight
+            self._pool.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        inputs, configs, futures = zip(*batch)
+        try:
+            results = self.llm.batch(list(inputs), list(configs), return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+        for future, result in zip(futures, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def ainvoke(self, prompt_value, config=None):
+        """Send the prompt with the next batch of the running event loop and await its response."""
+        if self._closed:
+            raise RuntimeError("The batching executor is closed")
+        loop = asyncio.get_running_loop()
+        collector = self._async_collectors.get(loop)
+        if collector is None:
+            batch_queue, batches = asyncio.Queue(), set()
+            task = loop.create_task(self._acollect(batch_queue, batches))
+            collector = self._async_collectors[loop] = (batch_queue, task, batches)
+            task.add_done_callback(lambda _: self._forget_collector(loop, collector))
+        batch_queue = collector[0]
+
+        future = loop.create_future()
+        self._enqueued()
+        batch_queue.put_nowait((prompt_value, ensure_config(config), future))
+        return await future
+
+    def _forget_collector(self, loop, collector):
+        if self._async_collectors.get(loop) is collector:
+            del self._async_collectors[loop]
+
+    async def _acollect(self, batch_queue, batches):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            request = await batch_queue.get()
+            if request is _CLOSE:
+                return
+            batch = [request]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(batch_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if request is _CLOSE:
+                    closing = True
+                    break
+                batch.append(request)
+            self._dequeued(len(batch))
+            task = loop.create_task(self._arun_batch(batch))
+            batches.add(task)
+            task.add_done_callback(batches.discard)
+
+    async def _arun_batch(self, batch):
+        inputs, configs, futures = zip(*batch)
+        try:
+            results = await self.llm.abatch(list(inputs), list(configs), return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def aclose(self):
+        """Stop the collector task of the running event loop and wait for its batches in flight."""
+        collector = self._async_collectors.pop(asyncio.get_running_loop(), None)
+        if collector is None:
+            return
+        batch_queue, task, batches = collector
+        batch_queue.put_nowait(_CLOSE)
+        await task
+        await asyncio.gather(*batches)
+
+    def close(self):
+        """Stop the collectors once the waiting requests are sent; further calls raise a RuntimeError.
+
+        The collector thread is joined and the batches it sent are waited for. The collector tasks still
+        running on other event loops are stopped without waiting, await aclose on a loop to wait for it.
+        """
+        with self._queue_lock:
+            self._closed = True
+            collector, self._collector = self._collector, None
+        if collector is not None:
+            self._queue.put(_CLOSE)
+            collector.join()
+            self._pool.shutdown(wait=True)
+        for loop, (batch_queue, _, _) in list(self._async_collectors.items()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(batch_queue.put_nowait, _CLOSE)
+        self._async_collectors.clear()
+
+
+# Batching executors by id of the chat model, empty until enable_batching is called
+batching_executors = {}
+
+
+def enable_batching(llms, max_batch_size=16, max_wait=0.01):
+    """Send the calls the tools make to the given chat models through batching executors.
+
+    Args:
+        llms (list): The chat models to batch
+        max_batch_size (int): Maximum number of requests in a batch
+        max_wait (float): Maximum time in seconds a request waits for the batch to fill
+
+    Returns:
+        list: the batching executors, in the order of llms
+    """
+    executors = []
+    for llm in llms:
+        if id(llm) not in batching_executors:
+            batching_executors[id(llm)] = BatchingExecutor(llm, max_batch_size, max_wait)
+        executors.append(batching_executors[id(llm)])
+    return executors
+
+
+def disable_batching():
+    """Close the batching executors and send the calls straight to the chat models again."""
+    for executor in batching_executors.values():
+        executor.close()
+    batching_executors.clear()
+
+
+async def aclose_batching():
+    """Stop the collector tasks of the batching executors on the running event loop."""
+    for executor in list(batching_executors.values()):
+        await executor.aclose()
+
+
+def invoke_chain(chain, inputs):
+    """Invoke a `prompt | llm` chain, through the batching executor of the llm if there is one."""
+    executor = batching_executors.get(id(chain.last))
+    if executor is None:
+        return chain.invoke(inputs)
+    return executor.invoke(chain.first.invoke(inputs))
+
+
+async def ainvoke_chain(chain, inputs):
+    """Async version of invoke_chain."""
+    executor = batching_executors.get(id(chain.last))
+    if executor is None:
+        return await chain.ainvoke(inputs)
+    return await executor.ainvoke(await chain.first.ainvoke(inputs))
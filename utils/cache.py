@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_question(text: str):
+    """Normalize a question so trivially different phrasings share a cache entry.
+
+    Lowercase, collapse whitespace and drop surrounding quotes and trailing punctuation:
+    "  Is it a  living thing? " -> "is it a living thing"
+    """
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.strip("\"'").rstrip("?.! ")
+
+
+class AnswerCache:
+    """Cache of host answers keyed by topic and normalized question.
+
+    An in-memory LRU sits in front of an on-disk SQLite store. The SQLite file can be shared by
+    threads and processes: every thread opens its own connection and the database runs in WAL mode.
+    Keys are versioned by a namespace (e.g. model name and prompt hash), so changing the model or
+    the prompt never serves stale answers.
+
+    Args:
+        path (str): Path to the SQLite file, or None for an in-memory cache only
+        namespace (str): Version of the cached answers, part of every key
+        max_entries (int): Size of the in-memory LRU
+        max_disk_entries (int): Size of the on-disk store, the least recently written entries are evicted.
+            The size is checked every `min(1000, max_disk_entries)` writes, not on every write.
+    """
+
+    def __init__(self, path=None, namespace="", max_entries=10_000, max_disk_entries=1_000_000):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._evict_every = max(1, min(1000, max_disk_entries))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, answer TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS answers_updated_at ON answers (updated_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, topic: str, question: str):
+        raw = "\x00".join([self.namespace, topic.strip().lower(), normalize_question(question)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, topic: str, question: str):
+        """Return the cached answer, or None on a miss."""
+        key = self.key(topic, question)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        answer = None
+        if self.path:
+            row = self._connection().execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            answer = row[0] if row else None
+
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, answer)
+        return answer
+
+    def put(self, topic: str, question: str, answer: str):
+        key = self.key(topic, question)
+        with self._lock:
+            self._remember(key, answer)
+            self._puts += 1
+            evict = self._puts % self._evict_every == 0
+
+        if self.path:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, updated_at) VALUES (?, ?, ?)",
+                    (key, answer, time.time()),
+                )
+                if evict:
+                    self._evict_disk(conn)
+
+    def _remember(self, key, answer):
+        self._memory[key] = answer
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_disk_entries:
+            conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY updated_at LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
@@ -0,0 +1,142 @@
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables.config import var_child_runnable_config
+from collections import Counter, defaultdict
+import glob
+import hashlib
+import json
+import os
+import threading
+
+
+class CassetteMiss(LookupError):
+    """ A replayed run made an LLM request which is not on the cassette """
+
+
+class Cassette(BaseCache):
+    """
+    Record/replay of the LLM traffic of games, installed as langchain's global LLM cache so that every
+    chat model call goes through it, the agents' calls as well as the calls made inside the tools.
+
+    Requests are keyed by a hash of the prompt and the model parameters, including the bound tools,
+    and of the "seed" of the game making the request. Concurrent games send identical prompts, e.g. the
+    host's first call, and the seed keeps every game on its own recorded responses. The seed is read from
+    the run config of the calling context, which the batching executors don't keep, so don't record
+    with batching. A cassette is a JSONL file with one line per request: the key and the response messages.
+
+    - "record": every request goes to the model and its response is appended to the cassette
+    - "replay": responses are served from the cassette, a request not on it raises CassetteMiss.
+      A request recorded several times, e.g. the same prompt in two games, is answered with its
+      recorded responses in order.
+
+    -- arguments:
+        path: the cassette file; for replay also a directory, whose *.jsonl cassettes are all loaded
+        mode: "record" or "replay"
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.requests = 0
+        self._entries = defaultdict(list)
+        self._cursors = Counter()
+        self._lock = threading.Lock()
+        self._file = None
+
+        if mode == "replay":
+            paths = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+            for cassette_path in paths:
+                with open(cassette_path) as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry["generations"])
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def key(prompt, llm_string, seed=None):
+        return hashlib.sha256(f"{seed}\x00{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    @staticmethod
+    def _seed():
+        config = var_child_runnable_config.get() or {}
+        return config.get("configurable", {}).get("seed")
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def lookup(self, prompt, llm_string):
+        if self.mode == "record":
+            return None
+
+        key = self.key(prompt, llm_string, self._seed())
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"LLM request {key[:12]} is not on the cassette {self.path}")
+            index = min(self._cursors[key], len(entries) - 1)
+            self._cursors[key] += 1
+            self.requests += 1
+        # new objects for every hit, the caller may modify the messages
+        return [
+            ChatGeneration(message=messages_from_dict([g["message"]])[0], generation_info=g.get("generation_info"))
+            for g in entries[index]
+        ]
+
+    def update(self, prompt, llm_string, return_val):
+        if self.mode != "record":
+            return
+        line = json.dumps({
+            "key": self.key(prompt, llm_string, self._seed()),
+            "generations": [
+                {"message": message_to_dict(g.message), "generation_info": g.generation_info}
+                for g in return_val
+            ],
+        }, default=str)
+        with self._lock:
+            self.requests += 1
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    # the cassette never blocks, so the async calls don't need an executor
+    async def alookup(self, prompt, llm_string):
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+            self._cursors.clear()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def use_cassette(path, mode="replay"):
+    """
+    Record or replay the LLM traffic of the process from now on.
+
+    -- returns:
+        the Cassette
+    """
+    cassette = Cassette(path, mode)
+    set_llm_cache(cassette)
+    return cassette
+
+
+def stop_cassette():
+    """ Stop recording or replaying and close the cassette """
+    cassette = get_llm_cache()
+    if isinstance(cassette, Cassette):
+        cassette.close()
+        set_llm_cache(None)
@@ -0,0 +1,355 @@
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    Durable checkpoints of the games in a local SQLite file, so that games interrupted by a crash or a
+    provider outage continue from their last super-step instead of starting over.
+
+    Only the latest checkpoint of a game is kept, with the pending writes of its super-step, and the
+    checkpoints of a finished game are deleted. Writes are batched: put only keeps the checkpoint in
+    memory, and a background thread serializes the changed checkpoints and writes them in one
+    transaction every flush_interval seconds, or as soon as flush_size of them are waiting. A game
+    that finishes between two flushes is never written at all, and a crash loses at most the last
+    flush_interval seconds of every game.
+
+    The games table records the status of every game, "running", "failed", "abandoned" or "finished"
+    with its result, so a resumed tournament skips the games that finished and continues the others.
+
+    Like AnswerCache, the file can be shared by threads and processes: every thread opens its own
+    connection and the database runs in WAL mode.
+
+    -- arguments:
+        path: the SQLite file
+        flush_interval: maximum time in seconds a checkpoint waits in memory
+        flush_size: number of waiting checkpoints and game updates which triggers a flush
+    """
+
+    # the game history keeps its older messages as TurnRecords (utils/state.py)
+    allowed_msgpack_modules = [("utils.state", "TurnRecord")]
+
+    def __init__(self, path, flush_interval=1.0, flush_size=256):
+        super().__init__(serde=JsonPlusSerializer(allowed_msgpack_modules=self.allowed_msgpack_modules))
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.flushes = 0
+
+        # (thread_id, checkpoint_ns) -> [checkpoint, metadata, parent checkpoint_id, {(task_path, task_id, idx): write}]
+        # of the games running in this process, the dirty ones are written with the next flush
+        self._latest = {}
+        self._dirty = set()
+        # game_id -> (status, seed, result) waiting to be written, and those of the flush being written
+        self._pending_games = {}
+        self._flushing_games = {}
+        # threads whose stored checkpoints are deleted with the next flush
+        self._finished_threads = set()
+        self._lock = threading.Lock()
+        # flushes are written one at a time, so an older snapshot never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT, "
+                "checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+                "PRIMARY KEY (thread_id, checkpoint_ns))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_path TEXT, task_id TEXT, idx INTEGER, "
+                "channel TEXT, value_type TEXT, value BLOB, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_path, task_id, idx))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS games ("
+                "game_id TEXT PRIMARY KEY, status TEXT NOT NULL, seed TEXT, result TEXT, updated_at REAL NOT NULL)"
+            )
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+        self._flusher.start()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _changed(self):
+        """ Called with the lock held after a change, wakes the flusher when enough changes are waiting """
+        if len(self._dirty) + len(self._pending_games) >= self.flush_size:
+            self._wakeup.set()
+
+    # ---- games
+
+    def start_game(self, game_id, seed=None):
+        with self._lock:
+            self._pending_games[game_id] = ("running", seed, None)
+            self._changed()
+
+    def finish_game(self, game_id, result):
+        """ Record the result of the game and drop its checkpoints """
+        with self._lock:
+            self._drop_thread(game_id)
+            self._pending_games[game_id] = ("finished", result.get("seed"), result)
+            self._changed()
+
+    def fail_game(self, game_id, error):
+        """ Mark the game as failed and write its last checkpoint now, so that it can be resumed """
+        with self._lock:
+            self._pending_games[game_id] = ("failed", None, {"error": error})
+        self.unload([game_id])
+
+    def abandon_game(self, game_id, reason):
+        """ Mark the game as abandoned, e.g. a human left it, and drop its checkpoints: it is not continued """
+        with self._lock:
+            self._drop_thread(game_id)
+            self._pending_games[game_id] = ("abandoned", None, {"error": reason})
+            self._changed()
+
+    def unload(self, thread_ids):
+        """
+        Write the latest checkpoints of the threads now and drop them from memory, e.g. of games waiting for
+        a human player. A thread's checkpoint is loaded from the file again when its game continues.
+        """
+        thread_ids = set(thread_ids)
+        self.flush()
+        with self._lock:
+            # a checkpoint put since the flush stays in memory until the next one
+            for key in [key for key in self._latest if key[0] in thread_ids and key not in self._dirty]:
+                del self._latest[key]
+
+    def _drop_thread(self, thread_id):
+        for key in [key for key in self._latest if key[0] == thread_id]:
+            del self._latest[key]
+            self._dirty.discard(key)
+        self._finished_threads.add(thread_id)
+
+    def game_status(self, game_id):
+        """
+        -- returns:
+            (status, result) of the game, the result only for a finished game; (None, None) for an unknown game
+        """
+        with self._lock:
+            # a flush's games are read from its snapshot until its transaction commits
+            pending = self._pending_games.get(game_id) or self._flushing_games.get(game_id)
+            if pending is not None:
+                status, _, result = pending
+                return status, result if status == "finished" else None
+        row = self._connection().execute("SELECT status, result FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None, None
+        status, result = row
+        return status, json.loads(result) if status == "finished" and result else None
+
+    def games(self, status=None):
+        """ The ids of the recorded games, only those with the given status if not None """
+        self.flush()
+        query, args = "SELECT game_id FROM games", ()
+        if status is not None:
+            query, args = query + " WHERE status = ?", (status,)
+        return [row[0] for row in self._connection().execute(query, args)]
+
+    # ---- checkpoints
+
+    def _load(self, thread_id, checkpoint_ns):
+        """ The stored checkpoint of the thread, as an entry of _latest, or None """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchone()
+        if row is None:
+            return None
+        checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = {
+            (task_path, task_id, idx): (task_id, channel, self.serde.loads_typed((value_type, value)))
+            for task_path, task_id, idx, channel, value_type, value in conn.execute(
+                "SELECT task_path, task_id, idx, channel, value_type, value FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        }
+        return [self.serde.loads_typed((checkpoint_type, checkpoint)),
+                self.serde.loads_typed((metadata_type, metadata)), parent_id, writes]
+
+    def _entry(self, thread_id, checkpoint_ns):
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            entry = self._latest.get(key)
+        if entry is None:
+            entry = self._load(thread_id, checkpoint_ns)
+            if entry is not None:
+                with self._lock:
+                    entry = self._latest.setdefault(key, entry)
+        return entry
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        entry = self._entry(thread_id, checkpoint_ns)
+        if entry is None:
+            return None
+        checkpoint, metadata, parent_id, writes = entry
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id and checkpoint_id != checkpoint["id"]:
+            return None
+
+        def thread_config(checkpoint_id):
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+        with self._lock:
+            # in writes_sort_key order
+            pending_writes = [writes[key] for key in sorted(writes)]
+        return CheckpointTuple(
+            config=thread_config(checkpoint["id"]),
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config=thread_config(parent_id) if parent_id else None,
+            pending_writes=pending_writes,
+        )
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """ Only the latest checkpoint of a thread is kept, so at most one checkpoint is listed """
+        if config is None or limit == 0:
+            return
+        checkpoint_tuple = self.get_tuple(config)
+        if checkpoint_tuple is None:
+            return
+        if filter and any(checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()):
+            return
+        if before and get_checkpoint_id(before) and checkpoint_tuple.checkpoint["id"] >= get_checkpoint_id(before):
+            return
+        yield checkpoint_tuple
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        entry = [checkpoint.copy(), get_checkpoint_metadata(config, metadata), config["configurable"].get("checkpoint_id"), {}]
+        with self._lock:
+            self._latest[(thread_id, checkpoint_ns)] = entry
+            self._dirty.add((thread_id, checkpoint_ns))
+            self._changed()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        entry = self._entry(thread_id, checkpoint_ns)
+        # only the writes of the latest checkpoint are kept
+        if entry is None or entry[0]["id"] != config["configurable"]["checkpoint_id"]:
+            return
+        with self._lock:
+            pending_writes = entry[3]
+            for idx, (channel, value) in enumerate(writes):
+                key = (task_path, task_id, WRITES_IDX_MAP.get(channel, idx))
+                if key[2] >= 0 and key in pending_writes:
+                    continue
+                pending_writes[key] = (task_id, channel, value)
+            self._dirty.add((thread_id, checkpoint_ns))
+            self._changed()
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._drop_thread(thread_id)
+        self.flush()
+
+    # put only touches memory, so the async versions don't need an executor
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in self.list(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        self.delete_thread(thread_id)
+
+    # ---- flushing
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """ Write the changed checkpoints and games in one transaction """
+        with self._flush_lock:
+            with self._lock:
+                dirty = [(key, self._latest[key]) for key in self._dirty]
+                dirty = [(key, entry[:3], dict(entry[3])) for key, entry in dirty]
+                games, finished = self._pending_games, self._finished_threads
+                self._dirty, self._pending_games, self._finished_threads = set(), {}, set()
+                self._flushing_games = games
+            if not (dirty or games or finished):
+                return
+            try:
+                self._write(dirty, games, finished)
+            finally:
+                with self._lock:
+                    self._flushing_games = {}
+            self.flushes += 1
+
+    def _write(self, dirty, games, finished):
+        """ Serialize a flush's snapshot and write it in one transaction """
+        # serialize without the lock, the games keep running meanwhile
+        checkpoints, writes = [], []
+        for (thread_id, checkpoint_ns), (checkpoint, metadata, parent_id), pending_writes in dirty:
+            checkpoints.append((thread_id, checkpoint_ns, checkpoint["id"], parent_id,
+                                *self.serde.dumps_typed(checkpoint), *self.serde.dumps_typed(metadata)))
+            for (task_path, _, idx), (task_id, channel, value) in pending_writes.items():
+                writes.append((thread_id, checkpoint_ns, checkpoint["id"], task_path, task_id, idx,
+                               channel, *self.serde.dumps_typed(value)))
+
+        now = time.time()
+        with self._connection() as conn:
+            for thread_id in finished:
+                conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            conn.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ?",
+                             [(key[0], key[1]) for key, _, _ in dirty])
+            conn.executemany("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)", checkpoints)
+            conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", writes)
+            conn.executemany(
+                "INSERT INTO games (game_id, status, seed, result, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (game_id) DO UPDATE SET status = excluded.status, "
+                "seed = COALESCE(excluded.seed, games.seed), result = excluded.result, updated_at = excluded.updated_at",
+                [(game_id, status, seed, None if result is None else json.dumps(result), now)
+                 for game_id, (status, seed, result) in games.items()],
+            )
+
+    def close(self):
+        """ Stop the background thread and write what is waiting """
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
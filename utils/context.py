@@ -0,0 +1,71 @@
+class TranscriptDigest:
+    """
+    Compact, locally computed summary of a game for the player: the questions asked with the host's
+    YES/NO answers and the wrong guesses made so far. Like ChatHistoryProjection it is updated
+    with the messages appended since the previous update only.
+    """
+    __slots__ = ("num_messages", "questions", "wrong_guesses", "_pending_question", "_pending_guess")
+
+    def __init__(self):
+        self.num_messages = 0
+        self.questions = []
+        self.wrong_guesses = []
+        self._pending_question = None
+        self._pending_guess = None
+
+    def update(self, messages):
+        if self.num_messages > len(messages):
+            self.__init__()
+
+        for m in messages[self.num_messages:]:
+            if m.type != "tool":
+                continue
+            if m.name == "generate_question":
+                self._pending_question = m.content
+            elif m.name == "answer_question" and self._pending_question is not None:
+                self.questions.append((self._pending_question, m.content.strip()))
+                self._pending_question = None
+            elif m.name == "make_guess":
+                self._pending_guess = m.content
+            elif m.name == "check_guess" and self._pending_guess is not None:
+                if not m.content.startswith("Congratulations"):
+                    self.wrong_guesses.append(self._pending_guess)
+                self._pending_guess = None
+
+        self.num_messages = len(messages)
+
+    def render(self, max_questions=None):
+        """ Render the digest, keeping only the last max_questions questions if given """
+        questions = self.questions
+        first = 1
+        if max_questions is not None and len(questions) > max_questions:
+            first = len(questions) - max_questions + 1
+            questions = questions[-max_questions:] if max_questions > 0 else []
+
+        lines = ["Questions asked so far and the host's answers:"]
+        if first > 1:
+            lines.append(f"({first - 1} earlier questions omitted)")
+        if questions:
+            lines += [f"{i}. {question} - {answer}" for i, (question, answer) in enumerate(questions, start=first)]
+        elif first == 1:
+            lines.append("none yet")
+        lines.append(f"Wrong guesses so far: {', '.join(self.wrong_guesses) if self.wrong_guesses else 'none'}")
+        return "\n".join(lines)
+
+
+def bounded_chat_history(digest, chat_history, context_window, digest_questions=None):
+    """
+    The player's context in the "digest" mode: the digest as the first message followed by
+    the last context_window messages of the chat history.
+
+    -- arguments:
+        digest: the TranscriptDigest of the game
+        chat_history: the (ai/human, content) history of the player
+        context_window: the number of raw messages kept
+        digest_questions: the number of most recent questions kept in the digest, all if None
+
+    -- returns:
+        the bounded chat history
+    """
+    recent = chat_history[-context_window:] if context_window > 0 else []
+    return [("human", digest.render(digest_questions))] + recent
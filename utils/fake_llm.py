@@ -0,0 +1,259 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+# Scripted knowledge of the fake backend: the questions the player asks, keyed by an attribute,
+# and the attributes which are true for each topic. Topic names must not appear in the prompts.
+DEFAULT_KNOWLEDGE = {
+    "questions": {
+        "alive": "Is it alive?",
+        "animal": "Is it an animal?",
+        "mammal": "Is it a mammal?",
+        "pet": "Is it commonly kept as a pet?",
+        "barks": "Does it bark?",
+        "flies": "Can it fly?",
+        "water": "Does it live in water?",
+        "ridden": "Can you ride it?",
+        "edible": "Do people eat it?",
+        "flower": "Is it a flower?",
+        "metal": "Is it made of metal?",
+        "music": "Is it used to make music?",
+        "place": "Is it a place?",
+    },
+    "topics": {
+        "dog": ["alive", "animal", "mammal", "pet", "barks"],
+        "cat": ["alive", "animal", "mammal", "pet"],
+        "horse": ["alive", "animal", "mammal", "ridden"],
+        "eagle": ["alive", "animal", "flies"],
+        "salmon": ["alive", "animal", "water", "edible"],
+        "oak tree": ["alive"],
+        "rose": ["alive", "flower"],
+        "banana": ["alive", "edible"],
+        "hammer": ["metal"],
+        "bicycle": ["metal", "ridden"],
+        "piano": ["music"],
+        "Paris": ["place"],
+    },
+}
+
+_ANSWER = re.compile(r"\b(YES|NO)\b")
+_ANSWER_PROMPT = re.compile(r"secret topic given as (.*?)\.\s*\n.*?The question is given as (.*?)\.?\s*\n", re.DOTALL)
+_GUESS_PROMPT = re.compile(r"The secret topic is (.*?)\.\s*\n.*?The player guessed (.*?)\.?\s*\n", re.DOTALL)
+
+
+def load_knowledge(path):
+    """ Load a knowledge table in the format of DEFAULT_KNOWLEDGE from a JSON file """
+    with open(path) as f:
+        return json.load(f)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model playing both roles of the game, for benchmarks and tests
+    without network. It supports bind_tools and with_structured_output, so it is a drop-in
+    replacement of ChatOpenAI in the agents and the tools' chains:
+
+    - bound to the host tools it calls the tool of the task given in the prompt
+    - bound to the player tools (or PlayerAction) it asks the next scripted question which splits
+      the topics still consistent with the host's answers, or guesses the only one left
+    - the tools' prompts are recognized by their wording: it answers the question from the
+      knowledge table, writes the scripted question or guess, or picks a topic of the table
+
+    -- arguments:
+        knowledge: the knowledge table, DEFAULT_KNOWLEDGE by default
+        latency: seconds slept by every call, to model the round-trip of a real provider
+        latency_jitter: extra random latency of up to this many seconds
+        token_latency: seconds between the streamed chunks, after latency (the time to the first token)
+        seed: seed of the topic choice and the jitter
+    """
+    model_name: str = "fake"
+    temperature: float = 0.0
+    knowledge: dict = Field(default_factory=lambda: DEFAULT_KNOWLEDGE)
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    token_latency: float = 0.0
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _attributes: dict = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+        self._attributes = {q.lower(): attr for attr, q in self.knowledge["questions"].items()}
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name, "temperature": self.temperature, "seed": self.seed}
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _delay(self):
+        if not self.latency and not self.latency_jitter:
+            return 0.0
+        return self.latency + self.latency_jitter * self._random()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self._respond(messages, kwargs.get("tools"))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(messages, kwargs.get("tools"))
+
+    def _chunks(self, messages, tools=None):
+        """ The response split into streamed chunks: one per word, or a single chunk with the whole tool call """
+        message = self._respond(messages, tools).generations[0].message
+        if message.tool_calls:
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)])]
+        else:
+            chunks = [AIMessageChunk(content=word) for word in re.findall(r"\s*\S+", message.content) or [""]]
+        # the usage is summed when the chunks are merged, so only the last chunk carries it
+        chunks[-1].usage_metadata = message.usage_metadata
+        return [ChatGenerationChunk(message=chunk) for chunk in chunks]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        for i, chunk in enumerate(self._chunks(messages, kwargs.get("tools"))):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        for i, chunk in enumerate(self._chunks(messages, kwargs.get("tools"))):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
+
+    # the player
+
+    def _player_action(self, text, action=None):
+        """
+        The player's next (action, content) given the text of the conversation. The tools' prompts
+        force the action the player agent already chose.
+        """
+        questions = self.knowledge["questions"]
+        answers = {}
+        for attr, question in questions.items():
+            i = text.rfind(question)
+            if i >= 0:
+                answer = _ANSWER.search(text, i + len(question))
+                if answer:
+                    answers[attr] = answer.group(1) == "YES"
+
+        candidates = [
+            topic for topic, attrs in self.knowledge["topics"].items()
+            if all((attr in attrs) == answer for attr, answer in answers.items())
+            and not re.search(rf"\b{re.escape(topic)}\b", text)
+        ]
+        if action != "make_guess":
+            unasked = [attr for attr in questions if attr not in answers]
+            for attr in unasked:
+                has_attr = sum(attr in self.knowledge["topics"][topic] for topic in candidates)
+                if 0 < has_attr < len(candidates):
+                    return "generate_question", questions[attr]
+            if action == "generate_question" or (len(candidates) > 1 and unasked):
+                return "generate_question", questions[unasked[0]] if unasked else "Is it something else?"
+        return "make_guess", candidates[0] if candidates else "I don't know"
+
+    # the host
+
+    def _answer(self, text):
+        match = _ANSWER_PROMPT.search(text)
+        if not match:
+            return "NO"
+        topic, question = match.group(1).strip(), match.group(2).strip()
+        attr = self._attributes.get(question.lower())
+        attrs = self.knowledge["topics"].get(topic, ())
+        return "YES" if attr in attrs else "NO"
+
+    def _judge(self, text):
+        # the old rule of check_guess: the guess names the topic if it contains it
+        match = _GUESS_PROMPT.search(text)
+        if not match:
+            return "NO"
+        from utils.matching import normalize_guess
+        topic, guess = normalize_guess(match.group(1)), normalize_guess(match.group(2))
+        return "YES" if topic and f" {topic} " in f" {guess} " else "NO"
+
+    def _topic(self):
+        topics = list(self.knowledge["topics"])
+        return topics[int(self._random() * len(topics))]
+
+    def _host_tool_call(self, messages):
+        # the host prompt ends with the topic, the task and the guess
+        topic, task, guess = (str(m.content) for m in messages[-3:])
+        if task == "answer_question":
+            question = next((str(m.content) for m in reversed(messages[:-3]) if str(m.content).endswith("?")), "")
+            return task, {"topic": topic, "question": question, "task_for_host": task}
+        if task == "check_guess":
+            return task, {"topic": topic, "guess": guess, "task_for_host": task}
+        return "generate_topic", {"task_for_host": "generate_topic"}
+
+    def _respond(self, messages, tools=None):
+        text = "\n".join(str(m.content) for m in messages if not isinstance(m, SystemMessage))
+        tool_names = [t["function"]["name"] for t in tools or []]
+
+        tool_call = None
+        content = ""
+        if "PlayerAction" in tool_names:
+            action, action_content = self._player_action(text)
+            tool_call = ("PlayerAction", {"action": action, "content": action_content})
+        elif "generate_topic" in tool_names:
+            tool_call = self._host_tool_call(messages)
+        elif "generate_question" in tool_names:
+            tool_call = (self._player_action(text)[0], {"messages": text})
+        elif "Generate a unique" in text:
+            content = self._topic()
+        elif "The player guessed" in text:
+            content = self._judge(text)
+        elif "You are a host of 20 questions" in text:
+            content = self._answer(text)
+        elif "Your task is to make a guess" in text:
+            content = self._player_action(text, "make_guess")[1]
+        else:
+            content = self._player_action(text, "generate_question")[1]
+
+        if tool_call:
+            name, args = tool_call
+            call_id = "call_" + hashlib.sha1(f"{name}{text}".encode()).hexdigest()[:12]
+            message = AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+        else:
+            message = AIMessage(content=content)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = max(1, (len(content) + (len(json.dumps(tool_call[1])) if tool_call else 0)) // 4)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,304 @@
+from utils.cache import normalize_question
+from collections import OrderedDict
+import numpy as np
+import functools
+import asyncio
+import threading
+import csv
+import json
+import os
+import re
+
+_ANSWER = re.compile(r"\b(YES|NO)\b", re.IGNORECASE)
+
+
+def parse_answer(answer):
+    """ The host's answer as "YES" or "NO", e.g. "Yes." or "No, it isn't", None if it is neither """
+    match = _ANSWER.search(answer)
+    return match.group(1).upper() if match else None
+
+
+class KnowledgeBase:
+    """
+    The concepts the player knows and their answers to a fixed set of YES/NO questions, stored as
+    bitsets: row i of the matrix has the bit of concept j set when the answer to question i is YES
+    for concept j. A set of candidate concepts is a mask of the same width, so splitting it by every
+    question is one AND and one popcount over the words of the mask.
+
+    The player's policy is deterministic, so games with the same answers ask the same questions: the next
+    action is kept for the last max_cached_paths answer paths and most turns skip the scoring altogether.
+
+    -- arguments:
+        concepts: the names of the concepts
+        questions: the YES/NO questions
+        yes: for each question, the indices of the concepts answering YES
+    """
+    # number of answer paths whose next action is kept
+    max_cached_paths = 65536
+    # guesses don't count as questions, so the candidates no question splits are only guessed one by one if
+    # there are at most this many
+    max_blind_guesses = 4
+
+    def __init__(self, concepts, questions, yes):
+        self.concepts = list(concepts)
+        self.questions = list(questions)
+        self._concept_index = {c.lower(): j for j, c in reversed(list(enumerate(self.concepts)))}
+        self._question_index = {normalize_question(q): i for i, q in enumerate(self.questions)}
+
+        num_bits = -(-len(self.concepts) // 64) * 64
+        bits = np.zeros((len(self.questions), num_bits), dtype=bool)
+        for i, indices in enumerate(yes):
+            bits[i, np.asarray(indices, dtype=np.intp)] = True
+        self.matrix = self._pack(bits)
+        everything = np.zeros(num_bits, dtype=bool)
+        everything[:len(self.concepts)] = True
+        self.everything = self._pack(everything)
+
+        self._actions = OrderedDict()
+        self._actions_lock = threading.Lock()
+
+    @staticmethod
+    def _pack(bits):
+        # bit j of word w is concept 64 * w + j
+        return np.ascontiguousarray(np.packbits(bits, axis=-1, bitorder="little").view("<u8"))
+
+    @classmethod
+    def from_table(cls, table):
+        """ Build the knowledge base from a table in the format of utils.fake_llm.DEFAULT_KNOWLEDGE """
+        attributes = list(table["questions"])
+        concepts = list(table["topics"])
+        yes = [[j for j, c in enumerate(concepts) if attr in table["topics"][c]] for attr in attributes]
+        return cls(concepts, [table["questions"][attr] for attr in attributes], yes)
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Build the knowledge base from a CSV in the layout of data/reference_things.csv: an index column,
+        the concept, then one column per question, headed by the question, with 1 for YES and 0 for NO
+        """
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = list(reader)
+        questions = header[2:]
+        if not questions:
+            # e.g. data/reference_things.csv itself: without answers the player would always defer to the LLM
+            raise ValueError(f"{path} has no question columns, fill them with python -m utils.knowledge")
+        yes = [[j for j, row in enumerate(rows) if row[i + 2].strip() == "1"] for i in range(len(questions))]
+        return cls([row[1] for row in rows], questions, yes)
+
+    def __len__(self):
+        return len(self.concepts)
+
+    def question_index(self, question):
+        return self._question_index.get(normalize_question(question))
+
+    def concept_index(self, concept):
+        return self._concept_index.get(concept.strip().lower())
+
+    def count(self, mask):
+        return int(np.bitwise_count(mask).sum())
+
+    def split_counts(self, mask):
+        """ The number of candidates of mask answering YES to each question """
+        words = np.flatnonzero(mask)
+        # gathering the columns only pays off once most words are empty
+        if len(words) < len(mask) // 4:
+            rows = self.matrix[:, words] & mask[words]
+        else:
+            rows = self.matrix & mask
+        return np.bitwise_count(rows).sum(axis=1, dtype=np.uint32)
+
+    def information_gains(self, mask):
+        """
+        The expected information gain in bits of every question on the candidates of mask, with all the
+        candidates equally likely: the entropy of the YES/NO split, since the answers are deterministic
+        """
+        n = self.count(mask)
+        if not n or not self.questions:
+            return np.zeros(len(self.questions))
+        p = self.split_counts(mask) / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gains = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+        return np.nan_to_num(gains, nan=0.0)
+
+    def next_action(self, mask):
+        """
+        The next (action, content) on the candidates of mask: the question with the highest information
+        gain, or a guess of the first candidate once no question splits them. None without candidates or
+        with more than max_blind_guesses candidates no question splits.
+        """
+        n = self.count(mask)
+        if not n:
+            return None
+        if n > 1:
+            gains = self.information_gains(mask)
+            best = int(np.argmax(gains)) if len(gains) else None
+            if best is not None and gains[best] > 0:
+                return "generate_question", self.questions[best]
+            if n > self.max_blind_guesses:
+                return None
+        first_word = int(np.flatnonzero(mask)[0])
+        word = int(mask[first_word])
+        return "make_guess", self.concepts[first_word * 64 + (word & -word).bit_length() - 1]
+
+    def cached_next_action(self, path, mask):
+        """ next_action of mask, kept by the answer path which led to it """
+        with self._actions_lock:
+            if path in self._actions:
+                self._actions.move_to_end(path)
+                return self._actions[path]
+        action = self.next_action(mask)
+        with self._actions_lock:
+            self._actions[path] = action
+            if len(self._actions) > self.max_cached_paths:
+                self._actions.popitem(last=False)
+        return action
+
+    def candidates(self):
+        return CandidateSet(self)
+
+
+class CandidateSet:
+    """
+    The concepts of a knowledge base still consistent with one game: the host's answers to the questions
+    the knowledge base knows and the wrong guesses. Like TranscriptDigest it is updated with the messages
+    appended since the previous update only. Questions the knowledge base does not know are ignored.
+    """
+    __slots__ = ("knowledge", "mask", "path", "num_messages", "_pending_question", "_pending_guess")
+
+    def __init__(self, knowledge):
+        self.knowledge = knowledge
+        self.mask = knowledge.everything.copy()
+        # the answers (question index, YES) and the excluded concepts (None, concept index) so far
+        self.path = ()
+        self.num_messages = 0
+        self._pending_question = None
+        self._pending_guess = None
+
+    def update(self, messages):
+        if self.num_messages > len(messages):
+            self.__init__(self.knowledge)
+
+        for m in messages[self.num_messages:]:
+            if m.type != "tool":
+                continue
+            if m.name == "generate_question":
+                self._pending_question = m.content
+            elif m.name == "answer_question" and self._pending_question is not None:
+                self.answer(self._pending_question, m.content)
+                self._pending_question = None
+            elif m.name == "make_guess":
+                self._pending_guess = m.content
+            elif m.name == "check_guess" and self._pending_guess is not None:
+                if not m.content.startswith("Congratulations"):
+                    self.exclude(self._pending_guess)
+                self._pending_guess = None
+
+        self.num_messages = len(messages)
+
+    def answer(self, question, answer):
+        """ Keep the candidates agreeing with the host's answer to question """
+        i = self.knowledge.question_index(question)
+        answer = parse_answer(answer)
+        if i is None or answer is None:
+            return
+        yes = answer == "YES"
+        row = self.knowledge.matrix[i]
+        self.mask &= row if yes else ~row
+        self.path += ((i, yes),)
+
+    def branch(self, question, answer):
+        """ A copy of the set after the host answers question with answer, the set itself is not changed """
+        other = CandidateSet.__new__(CandidateSet)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.mask = self.mask.copy()
+        other.answer(question, answer)
+        return other
+
+    def exclude(self, concept):
+        j = self.knowledge.concept_index(concept)
+        if j is not None:
+            self.mask[j // 64] &= ~np.uint64(1 << (j % 64))
+            self.path += ((None, j),)
+
+    def __len__(self):
+        return self.knowledge.count(self.mask)
+
+    def names(self):
+        bits = np.unpackbits(self.mask.view(np.uint8), bitorder="little")
+        return [self.knowledge.concepts[j] for j in np.flatnonzero(bits)]
+
+    def next_action(self):
+        """ The player's next (action, content), see KnowledgeBase.next_action """
+        return self.knowledge.cached_next_action(self.path, self.mask)
+
+
+@functools.lru_cache(maxsize=None)
+def load_knowledge_base(path):
+    """
+    Load a knowledge base once per process: a .json table in the format of utils.fake_llm.DEFAULT_KNOWLEDGE,
+    or a CSV in the layout of data/reference_things.csv with question columns
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            return KnowledgeBase.from_table(json.load(f))
+    return KnowledgeBase.from_csv(path)
+
+
+def load_concepts(path):
+    """ The concepts of a CSV in the layout of data/reference_things.csv """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [row[1] for row in reader if len(row) > 1 and row[1].strip()]
+
+
+async def abuild_knowledge_csv(concepts, questions, output_path, max_concurrency=16):
+    """
+    Fill the question columns of a knowledge base with the host's answers (answer_question) and write them
+    to output_path in the layout read by KnowledgeBase.from_csv. Every (concept, question) pair is one LLM
+    call: enable the answer cache (utils.tools.enable_answer_cache) to resume an interrupted build.
+
+    -- returns:
+        the number of answers which were neither YES nor NO, written as NO
+    """
+    from utils.tools import aanswer_question
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer(concept, question):
+        async with semaphore:
+            return parse_answer(await aanswer_question(concept, question, "answer_question"))
+
+    answers = await asyncio.gather(*[answer(concept, question) for concept in concepts for question in questions])
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["", "concept", *questions])
+        for j, concept in enumerate(concepts):
+            row = answers[j * len(questions):(j + 1) * len(questions)]
+            writer.writerow([j, concept, *("1" if answer == "YES" else "0" for answer in row)])
+    return sum(answer is None for answer in answers)
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.tools import enable_answer_cache
+
+    parser = argparse.ArgumentParser(description="Build the knowledge base of the player with the host LLM's answers")
+    parser.add_argument("--concepts", default="data/reference_things.csv", help="CSV of the concepts")
+    parser.add_argument("--questions", default="data/knowledge_questions.txt", help="the YES/NO questions, one per line")
+    parser.add_argument("--output", default="data/reference_knowledge.csv", help="path of the knowledge base CSV")
+    parser.add_argument("--answer-cache", default="cache/answers.sqlite",
+                        help="SQLite cache of the answers, a rerun only asks the questions not answered yet")
+    parser.add_argument("--concurrency", type=int, default=16, help="maximum number of LLM calls in flight")
+    args = parser.parse_args()
+
+    with open(args.questions) as f:
+        questions = [line.strip() for line in f if line.strip()]
+    concepts = load_concepts(args.concepts)
+    if args.answer_cache:
+        os.makedirs(os.path.dirname(args.answer_cache) or ".", exist_ok=True)
+        enable_answer_cache(args.answer_cache)
+    unclear = asyncio.run(abuild_knowledge_csv(concepts, questions, args.output, args.concurrency))
+    print(f"{len(concepts)} concepts x {len(questions)} questions written to {args.output}, {unclear} unclear answers as NO")
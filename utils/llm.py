@@ -1,9 +1,168 @@
-from langchain_openai import ChatOpenAI
+"""
+The chat models of the host and the player. The module is cheap to import: the environment (.env) is read,
+and the clients and their provider SDK are imported and created, the first time the models are used, through
+get_llms() or the module attributes host_llm and player_llm.
+"""
 from dotenv import load_dotenv
+import threading
 import os
-load_dotenv()
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
 
-host_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=openai_api_key)
-player_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.5, openai_api_key=openai_api_key)
\ No newline at end of file
+def _env_float(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def create_http_clients(limiter=None, max_connections=100, max_keepalive_connections=20,
+                        max_retries=2, retry_base_delay=0.5, timeout=60.0):
+    """Create the pooled keep-alive sync and async HTTP clients shared by the chat models.
+
+    Args:
+        limiter (RateLimiter): Client-side rate limiter applied to every request, none if None
+        max_connections (int): Maximum number of open connections per client
+        max_keepalive_connections (int): Maximum number of idle connections kept alive per client
+        max_retries (int): Retries of a request answered with 429/5xx or failing to connect
+        retry_base_delay (float): Base delay in seconds of the jittered exponential backoff
+        timeout (float): Request timeout in seconds
+
+    Returns:
+        tuple: (httpx.Client, httpx.AsyncClient)
+    """
+    import httpx
+    from utils.ratelimit import RateLimitedTransport, AsyncRateLimitedTransport
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+    http_client = httpx.Client(
+        transport=RateLimitedTransport(httpx.HTTPTransport(limits=limits), limiter, max_retries, retry_base_delay),
+        timeout=timeout,
+    )
+    http_async_client = httpx.AsyncClient(
+        transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=limits), limiter, max_retries, retry_base_delay),
+        timeout=timeout,
+    )
+    return http_client, http_async_client
+
+
+def create_fake_llms(knowledge_path=None, latency=0.0, latency_jitter=0.0, seed=0, token_latency=0.0):
+    """Create offline host and player chat models answering from a scripted knowledge table.
+
+    Args:
+        knowledge_path (str): JSON knowledge table, the built-in table if None
+        latency (float): Seconds slept by every call
+        latency_jitter (float): Extra random latency of up to this many seconds
+        seed (int): Seed of the host's topic choice
+        token_latency (float): Seconds between the chunks of a streamed call
+
+    Returns:
+        tuple: (host_llm, player_llm)
+    """
+    from utils.fake_llm import FakeChatModel, DEFAULT_KNOWLEDGE, load_knowledge
+
+    knowledge = load_knowledge(knowledge_path) if knowledge_path else DEFAULT_KNOWLEDGE
+    common = dict(knowledge=knowledge, latency=latency, latency_jitter=latency_jitter, token_latency=token_latency)
+    host_llm = FakeChatModel(temperature=0, seed=seed, **common)
+    player_llm = FakeChatModel(temperature=0.5, seed=seed + 1, **common)
+    return host_llm, player_llm
+
+
+def create_llms(model="gpt-4o-mini", api_key=None, base_url=None, requests_per_minute=None, tokens_per_minute=None,
+                max_connections=100, max_keepalive_connections=20, max_retries=2, retry_base_delay=0.5, timeout=60.0):
+    """Create the host and player chat models on one shared connection pool and rate limiter.
+
+    Retries are done by the HTTP transport, which backs off for all concurrent games at once when the
+    provider answers 429, so the OpenAI client's own retries are turned off.
+
+    Args:
+        model (str): The model of both roles
+        api_key (str): The API key, OPENAI_API_KEY if None
+        base_url (str): The API base url, the OpenAI API if None
+        requests_per_minute (float): Request budget shared by both roles, unlimited if None
+        tokens_per_minute (float): Token budget shared by both roles, unlimited if None
+        max_connections, max_keepalive_connections, max_retries, retry_base_delay, timeout: see create_http_clients
+
+    Returns:
+        tuple: (host_llm, player_llm)
+    """
+    from langchain_openai import ChatOpenAI
+    from utils.ratelimit import RateLimiter
+
+    limiter = None
+    if requests_per_minute or tokens_per_minute:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    http_client, http_async_client = create_http_clients(
+        limiter, max_connections, max_keepalive_connections, max_retries, retry_base_delay, timeout
+    )
+
+    common = dict(
+        model=model,
+        openai_api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        base_url=base_url,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=0,
+        # streamed calls (Game's stream_sink) still report their token usage to the metrics
+        stream_usage=True,
+    )
+    host_llm = ChatOpenAI(temperature=0, **common)
+    player_llm = ChatOpenAI(temperature=0.5, **common)
+    return host_llm, player_llm
+
+
+_llms = None
+_llms_lock = threading.Lock()
+
+
+def _create_llms_from_env():
+    load_dotenv()
+    # LLM_BACKEND=fake plays every game offline, without changes to the agents or the tools
+    if os.getenv("LLM_BACKEND", "openai") == "fake":
+        llms = create_fake_llms(
+            knowledge_path=os.getenv("FAKE_LLM_KNOWLEDGE"),
+            latency=_env_float("FAKE_LLM_LATENCY") or 0.0,
+            latency_jitter=_env_float("FAKE_LLM_LATENCY_JITTER") or 0.0,
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            token_latency=_env_float("FAKE_LLM_TOKEN_LATENCY") or 0.0,
+        )
+    else:
+        llms = create_llms(
+            model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+            # a replay never calls the provider, so it doesn't need a real key
+            api_key="replay" if os.getenv("LLM_CASSETTE_MODE") == "replay" and not os.getenv("OPENAI_API_KEY") else None,
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            requests_per_minute=_env_float("LLM_REQUESTS_PER_MINUTE"),
+            tokens_per_minute=_env_float("LLM_TOKENS_PER_MINUTE"),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        )
+
+    # LLM_CASSETTE records the LLM traffic of the process to a cassette, or replays it with LLM_CASSETTE_MODE=replay
+    if os.getenv("LLM_CASSETTE"):
+        from utils.cassette import use_cassette
+        use_cassette(os.getenv("LLM_CASSETTE"), os.getenv("LLM_CASSETTE_MODE", "record"))
+    return llms
+
+
+def get_llms():
+    """Return the host and player chat models of the process, creating them from the environment on first use.
+
+    Returns:
+        tuple: (host_llm, player_llm)
+    """
+    global _llms
+    if _llms is None:
+        with _llms_lock:
+            if _llms is None:
+                _llms = _create_llms_from_env()
+    return _llms
+
+
+def __getattr__(name):
+    # `from utils.llm import host_llm` keeps working, the models are created when they are first imported
+    if name == "host_llm":
+        return get_llms()[0]
+    if name == "player_llm":
+        return get_llms()[1]
+    if name == "openai_api_key":
+        load_dotenv()
+        return os.getenv("OPENAI_API_KEY")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
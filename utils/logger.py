@@ -1,65 +1,209 @@
+import atexit
+import json
 import logging
-from datetime import datetime
+import logging.handlers
 import os
+import queue
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+
+class _GameFileHandler(logging.Handler):
+    """
+    Writes the records of every game to the game's own file from the listener thread.
+
+    Files are kept open in a small LRU, so the number of open file descriptors stays bounded
+    however many games a process runs, and are closed as soon as their game closes its logger.
+    """
+    text_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def __init__(self, max_open_files=32):
+        super().__init__()
+        self.max_open_files = max_open_files
+        self.files = OrderedDict()
+
+    def _file(self, path):
+        f = self.files.pop(path, None)
+        if f is None:
+            if len(self.files) >= self.max_open_files:
+                _, oldest = self.files.popitem(last=False)
+                oldest.close()
+            f = open(path, "a", encoding="utf-8")
+        self.files[path] = f
+        return f
+
+    def format(self, record):
+        if record.log_format != "jsonl":
+            return self.text_formatter.format(record)
+        event = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "game_id": record.game_id,
+            "level": record.levelname,
+        }
+        if record.event is not None:
+            event["event"] = record.event
+            event.update(record.fields)
+        else:
+            event["message"] = record.getMessage()
+        return json.dumps(event, default=str)
+
+    def emit(self, record):
+        try:
+            if getattr(record, "close_file", False):
+                f = self.files.pop(record.log_file, None)
+                if f is not None:
+                    f.close()
+                return
+            f = self._file(record.log_file)
+            f.write(self.format(record) + "\n")
+            f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        super().close()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # the queue never leaves the process, so the record goes as it is: the %-args are merged
+        # and the line is formatted by the writer thread, not by the game
+        return record
+
+
+_listener = None
+_listener_pid = None
+_queue_logger = None
+_listener_lock = threading.Lock()
+
+
+def _get_queue_logger():
+    """ The process-wide logger feeding the background writer, started on first use """
+    global _listener, _listener_pid, _queue_logger
+    with _listener_lock:
+        # a forked worker inherits the queue but not the writer thread
+        if _listener is None or _listener_pid != os.getpid():
+            log_queue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(log_queue, _GameFileHandler())
+            _listener.start()
+            _listener_pid = os.getpid()
+
+            _queue_logger = logging.Logger("ExperimentLogger", logging.DEBUG)
+            _queue_logger.propagate = False
+            _queue_logger.addHandler(_QueueHandler(log_queue))
+        return _queue_logger
+
+
+def shutdown():
+    """
+    Write out the queued records and close the game files. Call it before a worker process exits;
+    the writer is restarted by the next ExperimentLogger.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
+
 
 class ExperimentLogger:
-    def __init__(self, log_dir='logs', game_id=None):
+    """
+    Per-game logger. Records go through a queue to a single background writer thread shared by
+    all games of the process, so logging never blocks a game on file I/O.
+
+    Messages take %-style arguments which are merged by the writer thread, and only when the level
+    is enabled, so the arguments must not be changed after they are logged:
+
+        logger.log("update node: %s and update: %s", node, values)
+
+    -- arguments:
+        log_dir: the root folder of the logs
+        game_id: the game, the file is game_<game_id>.log (.jsonl) if given
+        level: the minimum level written, "debug", "info", ...
+        log_format: "text" or "jsonl" for one JSON event per line
+    """
+
+    def __init__(self, log_dir='logs', game_id=None, level='info', log_format='text'):
         self.log_dir = log_dir
         self.timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.game_id = game_id
-        
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.log_format = log_format
+        self.closed = False
+
         # Create timestamp-based subfolder with exist_ok=True
         self.timestamp_dir = os.path.join(log_dir, self.timestamp)
         os.makedirs(self.timestamp_dir, exist_ok=True)
-        
+
         self.log_file = self._create_log_file()
-        
-        # Configure the logger
-        self.logger = logging.getLogger(f"Experiment_{self.timestamp}_{self.game_id}")
-        self.logger.setLevel(logging.INFO)
-        
-        # Create file handler
-        file_handler = logging.FileHandler(self.log_file)
-        file_handler.setLevel(logging.INFO)
-        
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        
-        # Add only the file handler to logger
-        self.logger.addHandler(file_handler)
+        self.name = f"Experiment_{self.timestamp}_{self.game_id}"
+        self.logger = _get_queue_logger()
 
     def _create_log_file(self):
+        extension = "jsonl" if self.log_format == "jsonl" else "log"
         if self.game_id:
-            return os.path.join(self.timestamp_dir, f"game_{self.game_id}.log")
-        return os.path.join(self.timestamp_dir, "experiment.log")
-
-    def log(self, message, level='info'):
-        if level == 'debug':
-            self.logger.debug(message)
-        elif level == 'info':
-            self.logger.info(message)
-        elif level == 'warning':
-            self.logger.warning(message)
-        elif level == 'error':
-            self.logger.error(message)
-        elif level == 'critical':
-            self.logger.critical(message)
-
-    def validate_updated_nodes(self, updated_nodes):
-        """
-        Validate that the updated nodes follow the state pattern:
+            return os.path.join(self.timestamp_dir, f"game_{self.game_id}.{extension}")
+        return os.path.join(self.timestamp_dir, f"experiment.{extension}")
+
+    def _extra(self, event=None, fields=None):
+        return {
+            "log_file": self.log_file,
+            "log_format": self.log_format,
+            "game_id": None if self.game_id is None else str(self.game_id),
+            "event": event,
+            "fields": fields or {},
+        }
+
+    def is_enabled(self, level='info'):
+        return not self.closed and LEVELS[level] >= self.level
 
-        [host, call_tool, host, player, call_tool, player, ...]
+    def log(self, message, *args, level='info'):
+        if not self.is_enabled(level):
+            return
+        # the record name is the game's, the records go through the shared queue logger
+        record = self.logger.makeRecord(self.name, LEVELS[level], "", 0, message, args, None, extra=self._extra())
+        self.logger.handle(record)
 
+    def event(self, event, level='info', **fields):
         """
-        pattern = ["host", "call_tool", "host", "player", "call_tool", "player"]
-        for idx, node in enumerate(updated_nodes):
-            expected_node = pattern[idx % len(pattern)]
-            if node != expected_node:
-                self.log(f"Invalid node order: {node} at index {idx} for updated_nodes: {updated_nodes}", level="error")
-        
-        self.log(f"Updated nodes are valid: {updated_nodes}", level="info")
-
-# Remove the global instance
-# experiment_logger = ExperimentLogger()
\ No newline at end of file
+        Log a structured event. In the jsonl format the fields are written as keys of the event,
+        in the text format as "event: key=value, ...".
+        """
+        if not self.is_enabled(level):
+            return
+        message = f"{event}: " + ", ".join(f"{k}={v}" for k, v in fields.items())
+        record = self.logger.makeRecord(self.name, LEVELS[level], "", 0, message, None, None,
+                                        extra=self._extra(event, fields))
+        self.logger.handle(record)
+
+    def close(self):
+        """ Close the game's file once the queued records are written """
+        if self.closed:
+            return
+        self.closed = True
+        record = self.logger.makeRecord(self.name, logging.INFO, "", 0, "", None, None, extra=self._extra())
+        record.close_file = True
+        self.logger.handle(record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,200 @@
+"""
+Matching the player's guess with the topic. Guesses are normalized (case, accents, punctuation, articles,
+lead-ins such as "is it", plurals) and scored by the overlap of their character 3-grams with the topic and
+with every name of the topic vocabulary: the reference topics, plus the topic pools a run plays. A topic
+the host generates is told by its own spelling, the vocabulary of the process is not changed per game.
+
+A guess is decided locally when it clearly names the topic, e.g. "Dogs" or "strawbery", or shares next to
+no 3-gram with the topic and with every name of the vocabulary. Another thing of the vocabulary, e.g.
+"catfish" for cat or "puppy" for dog, may still be a synonym of the topic: these guesses, and the ones the
+scores can't tell, are left to the host LLM, once per topic and guess.
+"""
+from collections import OrderedDict
+import functools
+import re
+import threading
+import unicodedata
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_LEAD_IN = re.compile(r"^(?:(?:i think|i guess|my guess is|the answer is|is it|it is|it s|it must be|maybe|a|an|the)\s+)+")
+# singular words the plural rules of _singular would cut
+_ENDS_IN_S = frozenset((
+    "lens", "gas", "atlas", "canvas", "bias", "chaos", "cosmos", "species", "series", "news", "rhinoceros",
+    "pancreas", "christmas", "mathematics", "physics", "measles", "diabetes", "mumps", "billiards",
+))
+
+
+def _singular(word):
+    if word in _ENDS_IN_S:
+        return word
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_guess(text):
+    """ Lowercase, drop accents, punctuation, lead-ins and articles, and make the last word singular """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = " ".join(_NON_WORD.sub(" ", text.replace("_", " ")).split())
+    words = _LEAD_IN.sub("", text).split()
+    if words:
+        words[-1] = _singular(words[-1])
+    return " ".join(words)
+
+
+@functools.lru_cache(maxsize=65536)
+def _grams(name, n=3):
+    """ The character n-grams of a normalized name, with its boundaries """
+    padded = f" {name} "
+    return frozenset(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+class _Index:
+    """ The 3-gram postings of the names of a vocabulary, built once and never changed """
+    __slots__ = ("concepts", "names", "gram_ids", "rows", "offsets", "row_sizes", "row_concepts")
+
+    def __init__(self, concepts):
+        names = list(concepts)
+        gram_ids = {}
+        postings = []
+        for row, name in enumerate(names):
+            for gram in _grams(name):
+                postings.append((gram_ids.setdefault(gram, len(gram_ids)), row))
+        postings.sort()
+        grams = np.array([g for g, _ in postings], dtype=np.intp)
+
+        # normalized name -> concept, the aliases of a concept share it
+        self.concepts = concepts
+        self.names = names
+        self.gram_ids = gram_ids
+        self.rows = np.array([row for _, row in postings], dtype=np.intp)
+        self.offsets = np.searchsorted(grams, np.arange(len(gram_ids) + 1))
+        self.row_sizes = np.array([len(_grams(name)) for name in names], dtype=np.float64)
+        self.row_concepts = np.array([concepts[name] for name in names], dtype=np.intp)
+
+    def scores(self, guess_name):
+        grams = _grams(guess_name)
+        ids = [self.gram_ids[g] for g in grams if g in self.gram_ids]
+        if not ids:
+            return np.zeros(len(self.names))
+        rows = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+        overlap = np.bincount(rows, minlength=len(self.names))
+        return 2 * overlap / (self.row_sizes + len(grams))
+
+
+class GuessMatcher:
+    """
+    Decide whether a guess names the topic. The names of the vocabulary are indexed by their 3-grams, so
+    scoring a guess against all of them is one bincount over the postings of the guess's 3-grams.
+
+    The verdicts of the host LLM on the guesses the scores can't tell are kept for the last max_verdicts
+    (topic, guess) pairs, see remember.
+
+    add builds a new index and swaps it in, so the games matching guesses meanwhile never see half of one.
+
+    -- arguments:
+        vocabulary: the topics the guesses are told apart from
+        aliases: optional {topic: [other names of the topic]}
+    """
+    # a guess scoring at least accept against a name, and margin more than against any other, names it
+    accept = 0.75
+    margin = 0.1
+    # a guess outside the vocabulary scoring less than reject against the topic does not name it
+    reject = 0.2
+    max_verdicts = 65536
+
+    def __init__(self, vocabulary=(), aliases=None):
+        self._index = _Index({})
+        self._verdicts = OrderedDict()
+        self._lock = threading.Lock()
+        self.add(vocabulary, aliases)
+
+    def __len__(self):
+        return len(set(self._index.concepts.values()))
+
+    def add(self, topics, aliases=None):
+        """ Add topics, e.g. of a topic pool, and their aliases to the vocabulary """
+        with self._lock:
+            concepts = dict(self._index.concepts)
+            for topic in topics:
+                name = normalize_guess(topic)
+                if name:
+                    concepts.setdefault(name, len(concepts))
+            for topic, names in (aliases or {}).items():
+                concept = concepts.setdefault(normalize_guess(topic), len(concepts))
+                for alias in names:
+                    concepts[normalize_guess(alias)] = concept
+            if concepts != self._index.concepts:
+                self._index = _Index(concepts)
+
+    def scores(self, guess_name):
+        """ The 3-gram Dice similarity of a normalized guess with every name of the vocabulary """
+        return self._index.scores(guess_name)
+
+    def match(self, topic, guess):
+        """
+        True if the guess names the topic, False if it is far from the topic and from every name of the
+        vocabulary, None if the host has to tell, e.g. for another thing of the vocabulary
+        """
+        topic_name, guess_name = normalize_guess(topic), normalize_guess(guess)
+        if not guess_name:
+            return False
+        if guess_name == topic_name:
+            return True
+
+        index = self._index
+        topic_concept = index.concepts.get(topic_name)
+        guess_concept = index.concepts.get(guess_name)
+        if guess_concept is not None and guess_concept == topic_concept:
+            # an alias of the topic
+            return True
+
+        topic_score = _dice(_grams(guess_name), _grams(topic_name))
+        other_score = 0.0
+        if guess_concept is None:
+            # the topic and its aliases, against the other names of the vocabulary
+            scores = index.scores(guess_name)
+            is_topic = index.row_concepts == (-1 if topic_concept is None else topic_concept)
+            topic_score = max(topic_score, scores[is_topic].max(initial=0.0))
+            other_score = scores[~is_topic].max(initial=0.0)
+        if topic_score >= self.accept and topic_score >= other_score + self.margin:
+            return True
+        if guess_concept is None and other_score < self.accept and topic_score < self.reject:
+            return False
+        # another thing of the vocabulary, or a spelling variant of one, may be a synonym of the topic
+        return None
+
+    def verdict(self, topic, guess):
+        """ match, or the host LLM's verdict remembered for the guesses match can't tell """
+        verdict = self.match(topic, guess)
+        if verdict is None:
+            key = (normalize_guess(topic), normalize_guess(guess))
+            with self._lock:
+                verdict = self._verdicts.get(key)
+        return verdict
+
+    def remember(self, topic, guess, verdict):
+        key = (normalize_guess(topic), normalize_guess(guess))
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            if len(self._verdicts) > self.max_verdicts:
+                self._verdicts.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=None)
+def get_matcher():
+    """ The matcher of the process, built on first use over the reference topics """
+    from utils.tools import reference_topics
+    return GuessMatcher(reference_topics())
@@ -0,0 +1,284 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.callbacks.manager import dispatch_custom_event
+from collections import Counter, defaultdict
+import json
+import os
+import threading
+import time
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """
+    Count the LLM calls made during a game, including the calls made inside the tools.
+
+    Pass it in the callbacks of the run config; nested chains inherit the callbacks of the graph.
+    """
+
+    # counting is cheap, so run the handler inline instead of in an executor for async runs
+    run_inline = True
+
+    def __init__(self):
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._count()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._count()
+
+
+def emit_metric(name, **data):
+    """
+    Report an event (e.g. a cache hit or a corrected tool call) to the metrics callbacks of the
+    current run. Outside of a run, e.g. when a tool is called directly, the event is dropped.
+    """
+    try:
+        dispatch_custom_event(name, data)
+    except RuntimeError:
+        pass
+
+
+class GameMetrics(LLMCallCounter):
+    """
+    Metrics of a game collected from the callbacks of its run:
+
+    - wall time and number of runs of every graph node (host, player, call_tool)
+    - LLM calls and prompt/completion tokens by source: the tool which made the call,
+      or the node for the agents' own calls, or the "metrics_source" of the run's metadata
+    - counts of the events reported with emit_metric, e.g. answer_cache_hit, tool_call_correction
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.node_seconds = defaultdict(float)
+        self.node_runs = Counter()
+        self.llm_calls_by_source = Counter()
+        self.prompt_tokens = Counter()
+        self.completion_tokens = Counter()
+        self.events = Counter()
+
+        self._roots = set()
+        # run_id -> (parent run_id, node or tool name or None)
+        self._runs = {}
+        self._node_starts = {}
+        self._llm_sources = {}
+
+    def _start_run(self, run_id, parent_run_id, label=None):
+        with self._lock:
+            if parent_run_id is None:
+                self._roots.add(run_id)
+            self._runs[run_id] = (parent_run_id, label)
+
+    def _source(self, parent_run_id):
+        """ The nearest tool or node the run belongs to """
+        run_id = parent_run_id
+        while run_id is not None:
+            parent, label = self._runs.get(run_id, (None, None))
+            if label is not None:
+                return label
+            run_id = parent
+        return "other"
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        # a node's run is a direct child of the graph's run
+        if node is not None and parent_run_id in self._roots:
+            self._start_run(run_id, parent_run_id, node)
+            self._node_starts[run_id] = (node, time.perf_counter())
+        else:
+            # runs can name their own source with a "metrics_source" in their metadata, e.g. speculative calls
+            self._start_run(run_id, parent_run_id, metadata.get("metrics_source"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+            self._roots.discard(run_id)
+            start = self._node_starts.pop(run_id, None)
+            if start is not None:
+                node, started = start
+                self.node_seconds[node] += time.perf_counter() - started
+                self.node_runs[node] += 1
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start_run(run_id, parent_run_id, name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.on_tool_end(None, run_id=run_id)
+
+    def _llm_start(self, run_id, parent_run_id):
+        with self._lock:
+            self.llm_calls += 1
+            source = self._source(parent_run_id)
+            self.llm_calls_by_source[source] += 1
+            self._llm_sources[run_id] = source
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._llm_start(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._llm_start(run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = None
+        generations = response.generations[0] if response.generations else []
+        message = getattr(generations[0], "message", None) if generations else None
+        if message is not None and getattr(message, "usage_metadata", None):
+            usage = message.usage_metadata
+            prompt, completion = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        elif response.llm_output and response.llm_output.get("token_usage"):
+            usage = response.llm_output["token_usage"]
+            prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+        with self._lock:
+            source = self._llm_sources.pop(run_id, "other")
+            if usage is not None:
+                self.prompt_tokens[source] += prompt
+                self.completion_tokens[source] += completion
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._llm_sources.pop(run_id, None)
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        with self._lock:
+            self.events[name] += (data or {}).get("count", 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "node_seconds": dict(self.node_seconds),
+                "node_runs": dict(self.node_runs),
+                "llm_calls": dict(self.llm_calls_by_source),
+                "prompt_tokens": dict(self.prompt_tokens),
+                "completion_tokens": dict(self.completion_tokens),
+                "events": dict(self.events),
+            }
+
+
+class ProcessMetrics:
+    """
+    Totals of the metrics of all games played by the process. Hooks added with add_hook are called
+    with the game id and the game's snapshot whenever a game finishes.
+
+    The stats of the process's batching executors (utils/batching.py), set with record_batching, are
+    exported with the totals.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.totals = defaultdict(Counter)
+        self.batching = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def record_game(self, game_id, snapshot):
+        with self._lock:
+            self.games += 1
+            for metric, values in snapshot.items():
+                self.totals[metric].update(values)
+        for hook in list(self.hooks):
+            hook(game_id, snapshot)
+
+    def record_batching(self, stats):
+        """ Set the stats of the batching executors, {llm: BatchingExecutor.stats()} """
+        with self._lock:
+            self.batching = dict(stats)
+
+    def reset(self):
+        with self._lock:
+            self.games = 0
+            self.totals.clear()
+            self.batching = {}
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {"games": self.games, **{metric: dict(values) for metric, values in self.totals.items()}}
+            if self.batching:
+                snapshot["batching"] = {llm: dict(stats) for llm, stats in self.batching.items()}
+            return snapshot
+
+    def to_prometheus(self):
+        """ The totals in the Prometheus text exposition format """
+        labels = {
+            "node_seconds": ("games_agent_node_seconds_total", "node", "Wall time spent in each graph node"),
+            "node_runs": ("games_agent_node_runs_total", "node", "Runs of each graph node"),
+            "llm_calls": ("games_agent_llm_calls_total", "source", "LLM calls by the tool or node making them"),
+            "prompt_tokens": ("games_agent_prompt_tokens_total", "source", "Prompt tokens by the tool or node"),
+            "completion_tokens": ("games_agent_completion_tokens_total", "source", "Completion tokens by the tool or node"),
+            "events": ("games_agent_events_total", "event", "Events reported by the game, e.g. cache hits"),
+        }
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP games_agent_games_total Games finished by the process",
+            "# TYPE games_agent_games_total counter",
+            f"games_agent_games_total {snapshot['games']}",
+        ]
+        for metric, (name, label, help_text) in labels.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for key, value in sorted(snapshot.get(metric, {}).items()):
+                lines.append(f'{name}{{{label}="{key}"}} {value}')
+        lines += self._batching_lines(snapshot.get("batching", {}))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _batching_lines(batching):
+        if not batching:
+            return []
+        lines = []
+        for stat, name, kind, help_text in [
+            ("requests", "games_agent_batch_requests_total", "counter", "Requests sent through the batching executor"),
+            ("batches", "games_agent_batches_total", "counter", "Batches sent by the batching executor"),
+            ("queue_depth", "games_agent_batch_queue_depth", "gauge", "Requests waiting for their batch"),
+            ("max_queue_depth", "games_agent_batch_max_queue_depth", "gauge", "Most requests waiting for their batch"),
+        ]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{llm="{llm}"}} {stats[stat]}' for llm, stats in sorted(batching.items())]
+
+        name = "games_agent_batch_size"
+        lines += [f"# HELP {name} Requests per batch", f"# TYPE {name} histogram"]
+        for llm, stats in sorted(batching.items()):
+            sizes = sorted((int(size), n) for size, n in stats["batch_sizes"].items())
+            # power of two buckets, up to the largest batch
+            bound = 1
+            while True:
+                lines.append(f'{name}_bucket{{llm="{llm}",le="{bound}"}} {sum(n for size, n in sizes if size <= bound)}')
+                if not sizes or bound >= sizes[-1][0]:
+                    break
+                bound *= 2
+            count = sum(n for _, n in sizes)
+            lines.append(f'{name}_bucket{{llm="{llm}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{llm="{llm}"}} {sum(size * n for size, n in sizes)}')
+            lines.append(f'{name}_count{{llm="{llm}"}} {count}')
+        return lines
+
+    def export(self, path, fmt="json"):
+        """ Write the totals to path, "json" or "prometheus" text, replacing the file atomically """
+        content = self.to_prometheus() if fmt == "prometheus" else json.dumps(self.snapshot(), indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# The metrics of all games of the process
+process_metrics = ProcessMetrics()
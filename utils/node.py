@@ -1,10 +1,89 @@
 from langchain_core.messages import ToolMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.callbacks import BaseCallbackManager
+from langgraph.types import interrupt
+from utils.context import TranscriptDigest, bounded_chat_history
+from utils.knowledge import load_knowledge_base, parse_answer
+from utils.metrics import emit_metric
+from pydantic import BaseModel, Field
 from typing import Literal
-import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+
+
+# the host's message once the topic is set, the topic itself is deliberately not in the messages
+TOPIC_SET_MESSAGE = "I have a secret topic for you to guess. Let's start the game."
+
+
+class PlayerAction(BaseModel):
+    """ The player's next action together with its content, returned by one structured-output call """
+    action: Literal["generate_question", "make_guess"] = Field(
+        description="generate_question to ask a YES-or-NO question, make_guess to guess the topic"
+    )
+    content: str = Field(
+        description="the YES-or-NO question to ask, or only the name of the topic you guess"
+    )
+
+
+class ChatHistoryProjection:
+    """
+    The chat history of one game as seen by one role. Messages are only ever appended to the game,
+    so each update projects just the messages added since the previous update.
+    """
+    __slots__ = ("role", "num_messages", "history")
+
+    def __init__(self, role):
+        self.role = role
+        self.num_messages = 0
+        self.history = []
+
+    def update(self, messages):
+        """ Project the new messages and return them """
+        if self.num_messages > len(messages):
+            # not the transcript this projection was built from, start over
+            self.num_messages = 0
+            self.history = []
+
+        new_messages = []
+        for m in messages[self.num_messages:]:
+            if m.type != "tool" and m.content != "":
+                if m.name == self.role:
+                    new_messages.append(("ai", m.content))
+                else:
+                    new_messages.append(("human", m.content))
+
+        self.num_messages = len(messages)
+        self.history.extend(new_messages)
+        return new_messages
+
+
+class Speculation:
+    """
+    The player's next action generated ahead of time for one possible answer of the host.
+    The task is a concurrent.futures.Future for sync games and an asyncio.Task for async games.
+
+    Only the async games really cancel a speculation: the task stops at its next await. A Future that
+    has started can't be stopped, its LLM call runs to the end and is paid for, so a sync game pays for
+    both branches of every answer. The Futures run on a pool of the node, shut down by GameRuntime.close.
+    """
+    __slots__ = ("answer", "agent_input", "task")
+
+    def __init__(self, answer, agent_input, task):
+        self.answer = answer
+        self.agent_input = agent_input
+        self.task = task
+
+    def cancel(self):
+        self.task.cancel()
 
 
 class GameAgentNode:
+    # number of in-flight games whose views of the transcript are kept by a node
+    max_cached_games = 4096
+
     def __init__(self, llm, tools, 
                  system_prompt: str, 
                  role: Literal["host", "player"], 
@@ -16,6 +95,12 @@ class GameAgentNode:
         self.role = role
         self.logger = logger
 
+        self._game_views = OrderedDict()
+        self._game_views_lock = threading.Lock()
+        # game_id -> the speculations of the player's next action
+        self._speculations = {}
+        self._speculation_pool = None
+
     def create_agent(self):
         """ Create an agent with a given llm, tools, and system prompt """
         prompt_settings = [
@@ -36,19 +121,45 @@ class GameAgentNode:
         prompt = ChatPromptTemplate.from_messages(prompt_settings)
         prompt = prompt.partial(role=self.role)
         prompt = prompt.partial(system_message=self.system_prompt)
-        prompt = prompt.partial(tool_names=self.tools)
+        prompt = prompt.partial(tool_names=", ".join(tool.name for tool in self.tools))
 
         return prompt | self.llm.bind_tools(self.tools, tool_choice="required")
 
-    def handle_tool_message(self, tool_message, state):
+    def create_fused_agent(self):
+        """ Create a player agent choosing its action and writing the question or guess in a single call """
+        prompt = ChatPromptTemplate.from_messages([
+                (
+                    "system",
+                    "You are part of a game of 20 questions. Your role is {role}.\n"
+                    "Role-specific instructions: {system_message}\n"
+                    "Instead of calling a tool, return the tool you would use as the action, and its output as the content: "
+                    "for generate_question the ONE YES-or-NO question to ask, for make_guess only the name of the topic you guess. "
+                    "Do not ask the same question twice and do not make the same guess twice."
+                ),
+                MessagesPlaceholder(variable_name="messages"),
+            ])
+        prompt = prompt.partial(role=self.role)
+        prompt = prompt.partial(system_message=self.system_prompt)
+
+        return prompt | self.llm.with_structured_output(PlayerAction)
+
+    def _get_configurable(self, config, key, default=None):
+        """ Games sharing this node pass their own settings through the run config """
+        if config:
+            return config.get("configurable", {}).get(key, default)
+        return default
+
+    def _get_logger(self, config):
+        return self._get_configurable(config, "logger", self.logger)
+
+    def handle_tool_message(self, tool_message, state, config=None):
 
         def handle_generate_topic(result, tool_message):
             result["topic"] = tool_message.content
             result["task_for_host"] = "answer_question"
 
             # Deliberate not including the topic in the messages
-            result["messages"] = [AIMessage(content="I have a secret topic for you to guess. Let's start the game.", 
-                                            name=self.role)]
+            result["messages"] = [AIMessage(content=TOPIC_SET_MESSAGE, name=self.role)]
             return result
     
         def handle_answer_question(result, state):
@@ -70,14 +181,19 @@ class GameAgentNode:
             # no action needed for check_guess
             return result
         
-        if self.logger:
-            self.logger.log(f"call tools: {tool_message.name} with tool content: {tool_message.content}")
+        logger = self._get_logger(config)
+        if logger:
+            logger.log("call tools: %s with tool content: %s", tool_message.name, tool_message.content)
 
         result = {
             "messages": [AIMessage(content=tool_message.content, name=self.role)],
             "sender": self.role,
         }
 
+        # the precomputed question or guess of the fused player mode is used up by the tool call
+        if state.get("player_response"):
+            result["player_response"] = ""
+
         tool_handlers = {
             "generate_topic": lambda: handle_generate_topic(result, tool_message),
             "answer_question": lambda: handle_answer_question(result, state),
@@ -92,65 +208,438 @@ class GameAgentNode:
             
         return handler()
 
-    def format_chat_history(self, messages):
-        """ Filter out tool messages from a list of messages """
-        filtered_messages = []
-        for m in messages:
-            if not isinstance(m, ToolMessage) and m.content != "":
-                if m.name == self.role:
-                    filtered_messages.append(("ai", m.content))
-                else:
-                    filtered_messages.append(("human", m.content))
-        if self.logger:
-            self.logger.log("get_chat_history messages:")
-            for i, msg in enumerate(filtered_messages):
-                self.logger.log(f"filtered_message {i}: {msg}")
-        return filtered_messages
+    def _new_game_view(self, kind, config=None):
+        if kind == "history":
+            return ChatHistoryProjection(self.role)
+        if kind == "candidates":
+            return load_knowledge_base(self._get_configurable(config, "player_knowledge")).candidates()
+        return TranscriptDigest()
+
+    def _get_game_view(self, config, kind):
+        """
+        Return the view of the game's transcript kept between calls, "history", "digest" or "candidates".
+        Without a game_id in the run config the view is built from scratch.
+        """
+        game_id = self._get_configurable(config, "game_id")
+        if game_id is None:
+            return self._new_game_view(kind, config)
+
+        with self._game_views_lock:
+            views = self._game_views.get(game_id)
+            if views is None:
+                views = self._game_views[game_id] = {}
+                if len(self._game_views) > self.max_cached_games:
+                    self._game_views.popitem(last=False)
+            else:
+                self._game_views.move_to_end(game_id)
+            if kind not in views:
+                views[kind] = self._new_game_view(kind, config)
+            return views[kind]
+
+    def release(self, game_id):
+        """ Drop the views and speculations of a finished game """
+        with self._game_views_lock:
+            self._game_views.pop(game_id, None)
+            speculations = self._speculations.pop(game_id, [])
+        for speculation in speculations:
+            speculation.cancel()
+
+    def close(self):
+        """ Drop the views and speculations of every game and shut the speculation pool down """
+        with self._game_views_lock:
+            self._game_views.clear()
+            speculations = [s for game_speculations in self._speculations.values() for s in game_speculations]
+            self._speculations.clear()
+            pool, self._speculation_pool = self._speculation_pool, None
+        for speculation in speculations:
+            speculation.cancel()
+        if pool is not None:
+            # the speculations still queued are dropped, the running ones can't be stopped
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def format_chat_history(self, messages, config=None):
+        """
+        Filter out tool messages from a list of messages.
+
+        With a game_id in the run config the projection of the game is kept between calls,
+        so only the messages appended since the last call are filtered and logged.
+        """
+        logger = self._get_logger(config)
+        projection = self._get_game_view(config, "history")
+
+        new_messages = projection.update(messages)
+        if logger:
+            logger.log("get_chat_history new messages:")
+            first_index = len(projection.history) - len(new_messages)
+            for i, msg in enumerate(new_messages, start=first_index):
+                logger.log("filtered_message %s: %s", i, msg)
+        # a copy, the projection keeps growing while the returned history may be stored in a tool call
+        return list(projection.history)
     
-    def handle_regular_message(self, state):
-        
-        if self.role == "player":
-            player_state = {"messages": self.format_chat_history(state["messages"])}
-            result = self.agent.invoke(player_state)
+    def _is_digest_context(self, config):
+        return self.role == "player" and self._get_configurable(config, "player_context", "full") == "digest"
 
-        else:
-            host_state = {
-                "messages": self.format_chat_history(state["messages"]),
-                "topic": [state.get("topic", "")],
-                "task_for_host": [state.get("task_for_host", "")],
-            }
-            if state.get("guess") is not None:
-                host_state["guess"] = [state.get("guess")]
+    def bounded_chat_history(self, state, chat_history, config=None):
+        """
+        Replace the player's full chat history by the digest of the game and the last few raw messages,
+        so the prompt stays about the same size however long the game runs.
+        """
+        digest = self._get_game_view(config, "digest")
+        digest.update(state["messages"])
+        context_window = self._get_configurable(config, "context_window", 4)
+        digest_questions = self._get_configurable(config, "digest_questions", 20)
+        bounded_history = bounded_chat_history(digest, chat_history, context_window, digest_questions)
 
-            result = self.agent.invoke(host_state)
+        logger = self._get_logger(config)
+        if logger:
+            logger.log(
+                "player context: %s questions, %s wrong guesses, %s recent messages, %s chars (full history: %s messages)",
+                len(digest.questions), len(digest.wrong_guesses), len(bounded_history) - 1,
+                sum(len(c) for _, c in bounded_history), len(chat_history)
+            )
+        return bounded_history
 
+    def _agent_input(self, state, config):
+        """ Build the prompt input of the agent from the game state """
+        if self.role == "player":
+            chat_history = self.format_chat_history(state["messages"], config)
+            if self._is_digest_context(config):
+                chat_history = self.bounded_chat_history(state, chat_history, config)
+            return {"messages": chat_history}
+
+        host_state = {
+            "messages": self.format_chat_history(state["messages"], config),
+            "topic": [state.get("topic", "")],
+            "task_for_host": [state.get("task_for_host", "")],
+        }
+        if state.get("guess") is not None:
+            host_state["guess"] = [state.get("guess")]
+        return host_state
+
+    def _agent_output(self, result, agent_input, config):
+        """ Wrap the agent response as a message of this role """
         result = AIMessage(**result.model_dump(exclude={"type", "name"}), name=self.role)
 
-        if self.logger:
-            self.logger.log(f"agent {self.role} returns: {result}")
+        # the player's tools get the same bounded context as the player, not the history the LLM copied
+        if self._is_digest_context(config):
+            for tool_call in result.tool_calls:
+                tool_call["args"]["messages"] = agent_input["messages"]
+
+        return self._node_output(result, self._get_logger(config))
+
+    def _node_output(self, result, logger):
+        if logger:
+            logger.log("agent %s returns: %s", self.role, result)
         
         return {
             "messages": [result],
             "sender": self.role,
         }
 
-    def call_agent(self, state):
-        if self.logger:
-            self.logger.log(
-                f"call agent: {self.role} with input state topic: {state['topic']}, "
-                f"num_questions_answered: {state['num_questions_answered']}, "
-                f"num_questions_asked: {state['num_questions_asked']}, "
-                f"task_for_host: {state['task_for_host']}, "
-                f"guess: {state['guess']}"
+    def dispatch_host_tool(self, state, config=None):
+        """
+        Build the host's tool call directly from task_for_host instead of asking the LLM to pick it.
+        The tool and its arguments are fully determined by the state, so the call is exact by construction.
+        """
+        logger = self._get_logger(config)
+        task_for_host = state["task_for_host"]
+
+        args = {"task_for_host": task_for_host}
+        if task_for_host == "answer_question":
+            args["topic"] = state["topic"]
+            args["question"] = state["most_recent_question"]
+        elif task_for_host == "check_guess":
+            args["topic"] = state["topic"]
+            args["guess"] = state["guess"]
+
+        tool_call = {
+            "name": task_for_host,
+            "args": args,
+            "id": f"call_{self.role}_{len(state['messages'])}",
+            "type": "tool_call",
+        }
+        result = AIMessage(content="", tool_calls=[tool_call], name=self.role)
+        return self._node_output(result, logger)
+
+    def _fused_output(self, state, chat_history, action, logger):
+        """
+        Emit the fused player's action as a regular tool call. The content rides in the state,
+        so the tool returns it without another LLM call and the ToolMessage and state updates stay the same.
+        """
+        tool_call = {
+            "name": action.action,
+            "args": {"messages": chat_history},
+            "id": f"call_{self.role}_{len(state['messages'])}",
+            "type": "tool_call",
+        }
+        result = AIMessage(content="", tool_calls=[tool_call], name=self.role)
+        output = self._node_output(result, logger)
+        output["player_response"] = action.content
+        return output
+
+    def _is_human(self, config):
+        return self.role == "player" and self._get_configurable(config, "player_mode", "tools") == "human"
+
+    def handle_human_message(self, state, config=None):
+        """
+        The player's action comes from outside the graph, e.g. a person playing through server.py: the run is
+        interrupted with the player's turn and resumed with the move {"action": ..., "content": ...} of PlayerAction.
+        """
+        move = interrupt({
+            "questions_asked": state["num_questions_asked"],
+            "questions_left": self._get_configurable(config, "max_questions", 20) - state["num_questions_asked"],
+            "last_message": state["messages"][-1].content,
+        })
+        action = PlayerAction.model_validate(move)
+        # the tools return the move as it is, so they need no chat history
+        return self._fused_output(state, [], action, self._get_logger(config))
+
+    def _uses_knowledge(self, config):
+        return self.role == "player" and bool(self._get_configurable(config, "player_knowledge"))
+
+    def _knowledge_action(self, state, config):
+        """
+        The player's next action picked by the knowledge base of the game (utils/knowledge.py): the question
+        splitting the concepts still consistent with the host's answers best, or the guess of the last one.
+        None once the answers rule out every concept of the knowledge base or none of its questions splits
+        the candidates, the LLM takes over then.
+        """
+        candidates = self._get_game_view(config, "candidates")
+        candidates.update(state["messages"])
+        action = candidates.next_action()
+        logger = self._get_logger(config)
+        if logger:
+            logger.log("knowledge base: %s candidates, next action %s", len(candidates), action)
+        emit_metric("knowledge_action" if action else "knowledge_exhausted")
+        return PlayerAction(action=action[0], content=action[1]) if action else None
+
+    def handle_knowledge_message(self, state, config=None):
+        """ Play the knowledge base's action without an LLM call, None if it has none """
+        action = self._knowledge_action(state, config)
+        if action is None:
+            return None
+        agent_input = self._agent_input(state, config)
+        return self._fused_output(state, agent_input["messages"], action, self._get_logger(config))
+
+    def handle_fused_message(self, state, config=None):
+        agent_input = self._agent_input(state, config)
+        action = None
+        if self._is_speculative(config):
+            action = self._wait_speculation(self._take_speculation(agent_input, config))
+        if action is None:
+            action = self.fused_agent.invoke(agent_input)
+        return self._fused_output(state, agent_input["messages"], action, self._get_logger(config))
+
+    async def ahandle_fused_message(self, state, config=None):
+        agent_input = self._agent_input(state, config)
+        action = None
+        if self._is_speculative(config):
+            action = await self._await_speculation(self._take_speculation(agent_input, config))
+        if action is None:
+            action = await self.fused_agent.ainvoke(agent_input)
+        return self._fused_output(state, agent_input["messages"], action, self._get_logger(config))
+
+    def _wait_speculation(self, hit):
+        """ The action of the speculation, None if there is none or it failed """
+        if hit is None:
+            return None
+        try:
+            action = hit.task.result()
+        except Exception:
+            emit_metric("speculation_miss")
+            return None
+        emit_metric("speculation_hit")
+        return action
+
+    async def _await_speculation(self, hit):
+        """ Async version of _wait_speculation """
+        if hit is None:
+            return None
+        try:
+            action = await hit.task
+        except Exception:
+            emit_metric("speculation_miss")
+            return None
+        emit_metric("speculation_hit")
+        return action
+
+    # the answers of the host the player's next action is speculated for
+    SPECULATED_ANSWERS = ("YES", "NO")
+
+    def _is_speculative(self, config):
+        return self._is_fused(config) and self._get_configurable(config, "player_speculation", False)
+
+    def _speculation_inputs(self, state, question, config):
+        """
+        The player's agent inputs after the host answers question with each of SPECULATED_ANSWERS.
+        They are built from scratch, the views of the game only ever see the real transcript.
+        """
+        configurable = {k: v for k, v in config["configurable"].items() if k not in ("game_id", "logger")}
+        hypothetical_config = {**config, "configurable": configurable}
+        inputs = []
+        for answer in self.SPECULATED_ANSWERS:
+            messages = list(state["messages"]) + [AIMessage(content=question, name=self.role), AIMessage(content=answer, name="host")]
+            inputs.append((answer, self._agent_input({**state, "messages": messages}, hypothetical_config)))
+        return inputs
+
+    def _speculation_config(self, config):
+        """
+        A root run of its own for the speculative calls, whose calls are counted under their own source in the
+        game's metrics. The speculation outlives the node run it starts in, so it gets the game's callback
+        handlers instead of that run's callback manager, and none of the node's metadata.
+        """
+        callbacks = config.get("callbacks")
+        if isinstance(callbacks, BaseCallbackManager):
+            callbacks = list(callbacks.inheritable_handlers)
+        config = {k: v for k, v in config.items() if k != "run_id"}
+        metadata = {k: v for k, v in config.get("metadata", {}).items() if not k.startswith(("langgraph_", "checkpoint_"))}
+        return {**config, "callbacks": callbacks, "run_name": "speculation", "metadata": {**metadata, "metrics_source": "speculation"}}
+
+    def _store_speculations(self, config, speculations):
+        game_id = self._get_configurable(config, "game_id")
+        with self._game_views_lock:
+            previous = self._speculations.pop(game_id, [])
+            self._speculations[game_id] = speculations
+        for speculation in previous:
+            speculation.cancel()
+        emit_metric("speculation_started", count=len(speculations))
+
+    def _should_speculate(self, state, question, config):
+        """
+        Whether the LLM plays the player's next action after one of the SPECULATED_ANSWERS to question:
+        the knowledge base picks the next action without an LLM call while it has candidates.
+        """
+        if not self._is_speculative(config):
+            return False
+        if not self._uses_knowledge(config):
+            return True
+        candidates = self._get_game_view(config, "candidates")
+        candidates.update(state["messages"])
+        return any(candidates.branch(question, answer).next_action() is None for answer in self.SPECULATED_ANSWERS)
+
+    def speculate(self, state, question, config):
+        """ Start generating the player's next action for every answer the host may give to question """
+        if self._speculation_pool is None:
+            with self._game_views_lock:
+                if self._speculation_pool is None:
+                    self._speculation_pool = ThreadPoolExecutor(thread_name_prefix="speculation")
+        speculation_config = self._speculation_config(config)
+        self._store_speculations(config, [
+            Speculation(answer, agent_input, self._speculation_pool.submit(self.fused_agent.invoke, agent_input, speculation_config))
+            for answer, agent_input in self._speculation_inputs(state, question, config)
+        ])
+
+    def aspeculate(self, state, question, config):
+        """ Async version of speculate, the speculations run as tasks of the game's event loop """
+        loop = asyncio.get_running_loop()
+        speculation_config = self._speculation_config(config)
+        speculations = []
+        for answer, agent_input in self._speculation_inputs(state, question, config):
+            task = loop.create_task(self.fused_agent.ainvoke(agent_input, speculation_config))
+            # the error of a discarded speculation is not an error of the game
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            speculations.append(Speculation(answer, agent_input, task))
+        self._store_speculations(config, speculations)
+
+    def _take_speculation(self, agent_input, config):
+        """
+        Pop the game's speculations and return the one made for agent_input, i.e. for the answer the host
+        actually gave, or None. The others are cancelled. The host's answer is read as YES or NO, so "Yes."
+        plays the branch speculated for "YES", the rest of the player's input has to be the same.
+        """
+        game_id = self._get_configurable(config, "game_id")
+        with self._game_views_lock:
+            speculations = self._speculations.pop(game_id, [])
+        if not speculations:
+            return None
+
+        messages = agent_input["messages"]
+        answer = parse_answer(messages[-1][1]) if messages and messages[-1][0] == "human" else None
+        hit = None
+        for speculation in speculations:
+            if hit is None and speculation.answer == answer and speculation.agent_input["messages"][:-1] == messages[:-1]:
+                hit = speculation
+            else:
+                speculation.cancel()
+        emit_metric("speculation_cancelled", count=len(speculations) - (hit is not None))
+        if hit is None:
+            emit_metric("speculation_miss")
+        logger = self._get_logger(config)
+        if logger:
+            logger.log("speculation %s for the answer %s", "hit" if hit else "miss", agent_input["messages"][-1:])
+        return hit
+
+    def _is_fused(self, config):
+        return self.role == "player" and self._get_configurable(config, "player_mode", "tools") == "fused"
+
+    def _is_direct_dispatch(self, config):
+        return self.role == "host" and self._get_configurable(config, "host_mode", "llm") == "direct"
+
+    def handle_regular_message(self, state, config=None):
+        agent_input = self._agent_input(state, config)
+        result = self.agent.invoke(agent_input)
+        return self._agent_output(result, agent_input, config)
+
+    async def ahandle_regular_message(self, state, config=None):
+        agent_input = self._agent_input(state, config)
+        result = await self.agent.ainvoke(agent_input)
+        return self._agent_output(result, agent_input, config)
+
+    def _log_call(self, state, logger):
+        if logger:
+            logger.log(
+                "call agent: %s with input state topic: %s, num_questions_answered: %s, "
+                "num_questions_asked: %s, task_for_host: %s, guess: %s",
+                self.role, state['topic'], state['num_questions_answered'],
+                state['num_questions_asked'], state['task_for_host'], state['guess']
             )
+
+    def call_agent(self, state, config=None):
+        self._log_call(state, self._get_logger(config))
         
         last_message = state["messages"][-1]
         if isinstance(last_message, ToolMessage):
-            return self.handle_tool_message(last_message, state)
+            if last_message.name == "generate_question" and self._should_speculate(state, last_message.content, config):
+                self.speculate(state, last_message.content, config)
+            return self.handle_tool_message(last_message, state, config)
+        elif self._is_direct_dispatch(config):
+            return self.dispatch_host_tool(state, config)
+        elif self._is_human(config):
+            return self.handle_human_message(state, config)
+
+        output = self.handle_knowledge_message(state, config) if self._uses_knowledge(config) else None
+        if output is not None:
+            return output
+        elif self._is_fused(config):
+            return self.handle_fused_message(state, config)
         else:
-            return self.handle_regular_message(state)
+            return self.handle_regular_message(state, config)
 
-    def create_node(self):
+    async def acall_agent(self, state, config=None):
+        self._log_call(state, self._get_logger(config))
+
+        last_message = state["messages"][-1]
+        if isinstance(last_message, ToolMessage):
+            if last_message.name == "generate_question" and self._should_speculate(state, last_message.content, config):
+                self.aspeculate(state, last_message.content, config)
+            return self.handle_tool_message(last_message, state, config)
+        elif self._is_direct_dispatch(config):
+            return self.dispatch_host_tool(state, config)
+        elif self._is_human(config):
+            return self.handle_human_message(state, config)
+
+        output = self.handle_knowledge_message(state, config) if self._uses_knowledge(config) else None
+        if output is not None:
+            return output
+        elif self._is_fused(config):
+            return await self.ahandle_fused_message(state, config)
+        else:
+            return await self.ahandle_regular_message(state, config)
+
+    def create_runnable(self):
+        """ Create the node as a runnable with both sync and async entry points,
+        so the same graph can be driven by stream or astream """
         self.agent = self.create_agent()
-        return functools.partial(self.call_agent)
-        
+        if self.role == "player":
+            self.fused_agent = self.create_fused_agent()
+        return RunnableLambda(self.call_agent, afunc=self.acall_agent, name=self.role)
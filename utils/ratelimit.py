@@ -0,0 +1,177 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import httpx
+
+
+class TokenBucket:
+    """Token bucket shared by threads and async tasks.
+
+    Callers reserve tokens under a lock and then sleep outside of it (time.sleep for threads,
+    asyncio.sleep for tasks), so both kinds of callers draw from the same budget.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum burst size
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount):
+        """Take the tokens now and return how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        """Hold back every caller for the given time, e.g. after the provider answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """Client-side limit on requests and tokens per minute, shared by all LLM clients of the process.
+
+    Args:
+        requests_per_minute (float): Request budget, unlimited if None
+        tokens_per_minute (float): Token budget, unlimited if None. Tokens of a request are estimated
+            from the size of its body (about 4 bytes per token).
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60)) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60) if tokens_per_minute else None
+
+    @staticmethod
+    def estimate_tokens(request):
+        return max(1, len(request.content) // 4)
+
+    def acquire(self, request):
+        if self.requests:
+            self.requests.acquire()
+        if self.tokens:
+            self.tokens.acquire(min(self.estimate_tokens(request), self.tokens.capacity))
+
+    async def aacquire(self, request):
+        if self.requests:
+            await self.requests.aacquire()
+        if self.tokens:
+            await self.tokens.aacquire(min(self.estimate_tokens(request), self.tokens.capacity))
+
+    def pause(self, seconds):
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.pause(seconds)
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _retry_after(response):
+    """Seconds to wait from the Retry-After header of the response, or None."""
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time())
+
+
+class _RetryPolicy:
+    def __init__(self, limiter=None, max_retries=2, base_delay=0.5, max_delay=30.0):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, at least as long as the provider's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        # a 429 means the whole process is over its quota, not just this request
+        if response is not None and response.status_code == 429 and self.limiter:
+            self.limiter.pause(delay)
+        return delay
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport applying the rate limiter and retrying 429/5xx and connection errors with jittered backoff."""
+
+    def __init__(self, transport, limiter=None, max_retries=2, base_delay=0.5, max_delay=30.0):
+        self.transport = transport
+        self.policy = _RetryPolicy(limiter, max_retries, base_delay, max_delay)
+
+    def handle_request(self, request):
+        for attempt in range(self.policy.max_retries + 1):
+            if self.policy.limiter:
+                self.policy.limiter.acquire(request)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt == self.policy.max_retries:
+                    raise
+                time.sleep(self.policy.delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.policy.max_retries:
+                return response
+            response.close()
+            time.sleep(self.policy.delay(attempt, response))
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async version of RateLimitedTransport."""
+
+    def __init__(self, transport, limiter=None, max_retries=2, base_delay=0.5, max_delay=30.0):
+        self.transport = transport
+        self.policy = _RetryPolicy(limiter, max_retries, base_delay, max_delay)
+
+    async def handle_async_request(self, request):
+        for attempt in range(self.policy.max_retries + 1):
+            if self.policy.limiter:
+                await self.policy.limiter.aacquire(request)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt == self.policy.max_retries:
+                    raise
+                await asyncio.sleep(self.policy.delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.policy.max_retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(self.policy.delay(attempt, response))
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,262 @@
+from utils.metrics import emit_metric
+import threading
+import time
+
+
+def is_correct_guess(guess, topic):
+    """
+    The game is won when the player's guess names the topic: by the guess matcher, or by the host LLM's
+    verdict remembered when the host checked the guess. It never calls the LLM itself
+    """
+    if not guess or not topic:
+        return False
+    from utils.matching import get_matcher
+    return get_matcher().verdict(topic, guess) is True
+
+
+class GameRuntime:
+    """
+    The compiled graph of the game together with its agent nodes and LLM clients.
+
+    A runtime holds no per-game state, so one runtime can be reused by many games, from any thread.
+    Each game passes its own logger and question limit through the run config:
+
+        config = {"configurable": {"game_id": game_id, "logger": logger, "max_questions": 20}}
+
+    Call release_game when a game is over to drop what the nodes keep for it.
+
+    Use GameRuntime.get to share one runtime per set of system prompts within the process.
+    """
+
+    _runtimes = {}
+    _runtimes_lock = threading.Lock()
+
+    def __init__(self, system_prompt):
+        self.host_system_prompt = system_prompt["host"]
+        self.player_system_prompt = system_prompt["player"]
+
+        start = time.perf_counter()
+        self.app = self._create_app()
+        self.build_time = time.perf_counter() - start
+        self._checkpointed_apps = {}
+
+    @classmethod
+    def get(cls, system_prompt):
+        """
+        Return the runtime shared by all games using the given system prompts, building it on first use.
+
+        -- arguments:
+            system_prompt: the system prompts of the host and the player
+        """
+        key = (system_prompt["host"], system_prompt["player"])
+        with cls._runtimes_lock:
+            if key not in cls._runtimes:
+                cls._runtimes[key] = cls(system_prompt)
+            return cls._runtimes[key]
+
+    def checkpointed_app(self, checkpointer):
+        """ The graph with checkpointer attached, shared by all games using the same checkpointer """
+        with self._runtimes_lock:
+            app = self._checkpointed_apps.get(id(checkpointer))
+            if app is None or app.checkpointer is not checkpointer:
+                app = self._checkpointed_apps[id(checkpointer)] = self.app.copy({"checkpointer": checkpointer})
+            return app
+
+    def release_game(self, game_id):
+        """ Drop the per-game chat history projections kept by the agent nodes """
+        self.host_agent.release(game_id)
+        self.player_agent.release(game_id)
+
+    def close(self):
+        """
+        Drop what the agent nodes keep for the games in flight and shut down their speculation pools.
+        The runtime can still play games afterwards, the nodes start over.
+        """
+        self.host_agent.close()
+        self.player_agent.close()
+
+    def draw_graph(self, output_file_path="agent.png"):
+        """
+        Render the graph as a mermaid png. This calls the mermaid.ink API by default, so it is opt-in.
+        """
+        self.app.get_graph().draw_mermaid_png(output_file_path=output_file_path)
+
+    def _create_app(self):
+        # langgraph, the tools and the LLM clients are loaded by the first runtime, not when the module is imported
+        from langgraph.graph import StateGraph, START, END
+        from langchain_core.runnables import RunnableLambda
+        from utils.state import AgentState
+        from utils.tools import tool_node, host_tools, player_tools
+        from utils.node import GameAgentNode
+        from utils.llm import get_llms
+
+        host_llm, player_llm = get_llms()
+
+        # create agent node
+        self.host_agent = GameAgentNode(
+            llm=host_llm,
+            tools=host_tools,
+            role="host",
+            system_prompt=self.host_system_prompt,
+        )
+        host_node = self.host_agent.create_runnable()
+
+        self.player_agent = GameAgentNode(
+            llm=player_llm,
+            tools=player_tools,
+            role="player",
+            system_prompt=self.player_system_prompt,
+        )
+        player_node = self.player_agent.create_runnable()
+
+        # Create the graph
+        workflow = StateGraph(AgentState)
+
+        # Add nodes to the graph
+        workflow.add_node("host", host_node)
+        workflow.add_node("player", player_node)
+        self.tool_node = tool_node
+        workflow.add_node("call_tool", RunnableLambda(self._call_tool, afunc=self._acall_tool, name="call_tool"))
+
+        # add conditional edges for host, player and call_tool
+        workflow.add_conditional_edges(
+            "host",
+            self._router,
+            {"continue": "player", "call_tool": "call_tool", "end": END}
+        )
+
+        workflow.add_conditional_edges(
+            "player",
+            self._router,
+            {"continue": "host", "call_tool": "call_tool", "end": END}
+        )
+
+        workflow.add_conditional_edges(
+            "call_tool",
+            lambda x: x["sender"],
+            {
+                "host": "host",
+                "player": "player",
+                },
+            )
+
+        # Set the entry point: a game given its topic starts with the player's turn
+        workflow.add_conditional_edges(START, self._entry, {"host": "host", "player": "player"})
+
+        # Compile the graph
+        return workflow.compile()
+
+    @staticmethod
+    def _entry(state):
+        return "player" if state.get("topic") else "host"
+
+    def _correct_tool_call(self, state, logger):
+        """
+        This function is used to call the correct tool with the correct arguments.
+        It returns a copy of the last message with the fixed tool call, or None if the call is right. The
+        message in the state is not changed: the copy has its id, so it replaces the message in the history
+        (see compact_messages) with the update of the tool node.
+
+        -- arguments:
+            state: the state of the agent
+            logger: the logger of the game
+
+        """
+        message = state["messages"][-1]
+        tool_calls = message.tool_calls
+
+        # if there are multiple tool calls, only keep the first one
+        if len(tool_calls) > 1:
+            logger.log("multiple tool calls: %s", tool_calls)
+            emit_metric("tool_call_correction")
+            tool_calls = tool_calls[:1]
+
+        # fix host tool call
+        last_tool_call = tool_calls[0]
+        args = last_tool_call["args"]
+        task_for_host = state["task_for_host"]
+        fixed_args = None
+
+        # fix the host's tool call if the host called the wrong tool for "answer_question" and "check_guess"
+        if last_tool_call["name"] == "check_guess" and \
+                task_for_host == "answer_question":
+
+            tool_calls = [{**last_tool_call, "name": task_for_host, "args": {
+                "topic": state["topic"],
+                "question": state["most_recent_question"],
+                "task_for_host": task_for_host,
+            }}]
+            logger.log("fixed tool call: %s", tool_calls[0])
+            emit_metric("tool_call_correction")
+
+        # fix the host's tool call if the host uses the wrong argument for "check_guess"
+        elif last_tool_call["name"] == "check_guess" and \
+                task_for_host == "check_guess":
+            if args.get("topic") != state["topic"] or args.get("guess") != state["guess"]:
+                fixed_args = {**args, "topic": state["topic"], "guess": state["guess"]}
+
+        # fix the host's tool call if the host uses the wrong argument for "answer_question"
+        elif last_tool_call["name"] == "answer_question":
+            if args.get("topic") != state["topic"]:
+                fixed_args = {**args, "topic": state["topic"]}
+
+        if fixed_args is not None:
+            tool_calls = [{**last_tool_call, "args": fixed_args}]
+            logger.log("fixed tool call args from %s to %s for %s", args, fixed_args, last_tool_call["name"])
+            emit_metric("tool_call_correction")
+
+        if tool_calls is message.tool_calls:
+            return None
+        return message.model_copy(update={"tool_calls": tool_calls})
+
+    def _tool_input(self, state, config):
+        """ The state the tool node runs on, and the fixed tool call message to put in the history """
+        fixed = self._correct_tool_call(state, config["configurable"]["logger"])
+        if fixed is None:
+            return state, None
+        return {**state, "messages": [*state["messages"][:-1], fixed]}, fixed
+
+    @staticmethod
+    def _tool_output(result, fixed):
+        if fixed is None:
+            return result
+        return {**result, "messages": [fixed, *result["messages"]]}
+
+    def _call_tool(self, state, config):
+        tool_input, fixed = self._tool_input(state, config)
+        return self._tool_output(self.tool_node.invoke(tool_input, config), fixed)
+
+    async def _acall_tool(self, state, config):
+        tool_input, fixed = self._tool_input(state, config)
+        return self._tool_output(await self.tool_node.ainvoke(tool_input, config), fixed)
+
+    def _router(self, state, config):
+        """
+        The router function is used to route the state to the correct agent node and tool node.
+
+        -- arguments:
+            state: the state of the agent
+            config: the run config carrying the logger and max_questions of the game
+        """
+        logger = config["configurable"]["logger"]
+        max_questions = config["configurable"]["max_questions"]
+
+        # if the player has asked 20 questions and the host has answered 20 questions, go to end
+        if state["num_questions_asked"] >= max_questions and state["num_questions_answered"] >= max_questions:
+            logger.log("="*100)
+            logger.log("Questions asked and answered: %s and game ends for topic: %s", max_questions, state['topic'])
+            return "end"
+
+        # if there is a tool call, the tool node corrects the tool name and arguments before calling the tool
+        last_message = state["messages"][-1]
+        if last_message.tool_calls:
+            logger.log("tool call: %s", last_message.tool_calls)
+            return "call_tool"
+
+        # if the player's guess matches the topic, go to end
+        if is_correct_guess(state["guess"], state["topic"]):
+            logger.log("="*100)
+            logger.log("Guess matches topic: %s and game ends", state['topic'])
+            return "end"
+
+        return "continue"
@@ -1,13 +1,83 @@
-import operator
+import os
 from langchain_core.messages import BaseMessage
 from typing import TypedDict, Annotated, Sequence
 
+# keep the whole LLM message (tool-call payloads, response metadata) in the game history, for tracing
+trace_messages = os.getenv("GAME_TRACE_MESSAGES", "").lower() in ("1", "true") or \
+    os.getenv("LANGSMITH_TRACING", os.getenv("LANGCHAIN_TRACING_V2", "")).lower() == "true"
+
+
+class TurnRecord:
+    """
+    Compact record of a message of the game history. It reads like the message for the agents' views of the
+    transcript: type is "system", "ai" or "tool", name is the role for the agents' messages and the tool for
+    the tools' results, and content is the text. role is the agent who sent the message or called the tool.
+    The message itself is only kept as payload when trace_messages is on.
+    """
+    __slots__ = ("role", "type", "name", "content", "payload")
+
+    def __init__(self, role, type, name, content, payload=None):
+        self.role = role
+        self.type = type
+        self.name = name
+        self.content = content
+        self.payload = payload
+
+    @classmethod
+    def from_message(cls, message, previous=None):
+        """
+        -- arguments:
+            message: the message
+            previous: the record before it, whose role called the tool of a tool message
+        """
+        if isinstance(message, TurnRecord):
+            return message
+        if message.type == "tool":
+            role = previous.role if previous is not None else None
+        else:
+            role = message.name or message.type
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        return cls(role, message.type, message.name, content, message if trace_messages else None)
+
+    def _asdict(self):
+        # the checkpointers' serializer stores the record as its constructor's arguments
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, TurnRecord) and self._asdict() == other._asdict()
+
+    def __repr__(self):
+        return f"TurnRecord(role={self.role!r}, type={self.type!r}, name={self.name!r}, content={self.content!r})"
+
+
+def compact_messages(left, right):
+    """
+    Reducer of the messages: append the new messages and turn all but the last message into TurnRecords.
+    The last message is kept whole, the router and the tool node read its tool calls, so a game keeps a small
+    constant per message instead of every tool-call payload (e.g. the player's whole chat history) and metadata.
+    A new message with the id of the last message replaces it, e.g. the tool call fixed by the tool node.
+    """
+    if not right:
+        return left
+    right = list(right)
+    new_id = getattr(right[0], "id", None)
+    if left and new_id is not None and new_id == getattr(left[-1], "id", None):
+        left = left[:-1]
+    messages = list(left) + right
+    start = len(left) - 1 if left else 0
+    for i in range(start, len(messages) - 1):
+        messages[i] = TurnRecord.from_message(messages[i], messages[i - 1] if i else None)
+    return messages
+
+
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    messages: Annotated[Sequence[BaseMessage], compact_messages]
     sender: str
     topic: str
     num_questions_asked: int
     num_questions_answered: int
     guess: str
     task_for_host: str
-    most_recent_question: str
\ No newline at end of file
+    most_recent_question: str
+    # text of the player's next question or guess when it is produced without the tool's LLM call
+    player_response: str
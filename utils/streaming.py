@@ -0,0 +1,81 @@
+"""
+Sinks of a game's text while it is generated, for interactive play: Game(stream_sink=...) streams the
+tokens of the agents' and the tools' LLM calls to the sink as they arrive, instead of printing each
+message once its node has finished.
+"""
+import sys
+
+# tools whose output is not shown to the player, their tokens are never streamed
+SECRET_TOOLS = ("generate_topic",)
+
+
+class StreamSink:
+    """
+    Receives the text of a game. token is called with every streamed chunk of text and message with every
+    message of the host and the player, once its node has finished, whether it was streamed or not.
+    """
+
+    def token(self, role, source, text):
+        """
+        -- arguments:
+            role: "host" or "player"
+            source: the tool whose LLM call wrote the text, or the node of the agent
+            text: the chunk
+        """
+
+    def message(self, role, content):
+        """
+        -- arguments:
+            role: "host" or "player"
+            content: the whole text of the message
+        """
+
+
+class ConsoleSink(StreamSink):
+    """ Print the tokens as they arrive, and the messages which were not streamed, one line per message """
+
+    def __init__(self, file=None):
+        self.file = file or sys.stdout
+        # role and text of the line being streamed
+        self._line = None
+
+    def token(self, role, source, text):
+        if self._line is None or self._line[0] != role:
+            self._end_line()
+            self.file.write(f"{role}: ")
+            self._line = [role, ""]
+        self._line[1] += text
+        self.file.write(text)
+        self.file.flush()
+
+    def message(self, role, content):
+        streamed = self._line is not None and self._line[0] == role and self._line[1].strip() == content.strip()
+        self._end_line()
+        if not streamed:
+            print(f"{role}: {content}", file=self.file, flush=True)
+
+    def _end_line(self):
+        if self._line is not None:
+            self.file.write("\n")
+            self._line = None
+
+
+class CallbackSink(StreamSink):
+    """
+    Call functions with the tokens and the messages, e.g. to push them to a websocket
+
+    -- arguments:
+        on_token: called with (role, source, text)
+        on_message: called with (role, content), optional
+    """
+
+    def __init__(self, on_token, on_message=None):
+        self.on_token = on_token
+        self.on_message = on_message
+
+    def token(self, role, source, text):
+        self.on_token(role, source, text)
+
+    def message(self, role, content):
+        if self.on_message is not None:
+            self.on_message(role, content)
@@ -1,10 +1,17 @@
 from langchain_core.prompts import PromptTemplate
-from utils.llm import player_llm, host_llm
+from utils.llm import get_llms
+from utils.cache import AnswerCache
+from utils.batching import invoke_chain, ainvoke_chain
+from utils.metrics import emit_metric
 import random
+import hashlib
 import csv
+import functools
 import os
-from langgraph.prebuilt import ToolNode
-from langchain_core.tools import tool
+from typing import Annotated
+from langgraph.prebuilt import ToolNode, InjectedState
+from langchain_core.tools import StructuredTool
+from langchain_core.runnables import RunnableConfig
 
 def load_reference_topics(filepath: str):
     """Load reference topics from a CSV file.
@@ -26,16 +33,37 @@ def load_reference_topics(filepath: str):
         print(f"Error loading reference topics: {e}")
         return []
 
-# Load reference topics for few-shot prompting applied in topic generation
-REFERENCE_TOPICS_FILEPATH = os.path.join('data', 'reference_things.csv')
-all_reference_topics = load_reference_topics(REFERENCE_TOPICS_FILEPATH)
+# Reference topics for few-shot prompting applied in topic generation, next to the package rather than the working directory
+REFERENCE_TOPICS_FILEPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reference_things.csv')
 
-@tool
-def generate_question(messages):
-    """For player to generate a YES-or-NO type question to ask the host to help guess the topic. 
-    It takes the conversation history to help formulate the question."""
+@functools.lru_cache(maxsize=None)
+def reference_topics():
+    """Load the reference topics on first use and keep them as a tuple.
+
+    Returns:
+        tuple: the reference topics
+    """
+    # the first row is the header of the CSV
+    return tuple(load_reference_topics(REFERENCE_TOPICS_FILEPATH)[1:])
+
+def tool_with_coroutine(coroutine):
+    """Create a tool from a sync function and its async counterpart.
+
+    The sync function provides the name, description and argument schema like `@tool` does,
+    while `ainvoke` awaits the coroutine instead of running the sync function in a thread.
     
-    PROMPT = """You are a player of 20 questions game. The host has generated a topic for the game. 
+    Args:
+        coroutine: async implementation with the same signature as the decorated function
+
+    Returns:
+        decorator creating a StructuredTool
+    """
+    def decorator(func):
+        return StructuredTool.from_function(func=func, coroutine=coroutine)
+    return decorator
+
+
+GENERATE_QUESTION_PROMPT = PromptTemplate.from_template("""You are a player of 20 questions game. The host has generated a topic for the game. 
             Your task is to ask a YES-or-NO type question that will help you guess the topic.
             Please only return ONE question, not any additional text. 
 
@@ -43,19 +71,9 @@ def generate_question(messages):
             1. You can only ask a YES-or-NO type question that will help you narrow down the topic.
             2. Only return the question, not any additional text.
             3. You should observe the conversation history as {messages} to formulate your question. Please do not ask the same question twice! 
-            For example, if the chat history contains "Is it a living thing?", you should not ask the same question again. """
-
-    query_prompt = PromptTemplate.from_template(PROMPT)
-    chain = query_prompt | player_llm
-    response = chain.invoke({"messages": messages})
-    return response.content
+            For example, if the chat history contains "Is it a living thing?", you should not ask the same question again. """)
 
-@tool
-def make_guess(messages):
-    """For the player to make a guess of the topic if the player feels confident about the guessing topic.
-    It takes the conversation history to help make the guess."""
-
-    PROMPT = """You are a player of 20 questions game. The host has generated a secret topic for the game. 
+MAKE_GUESS_PROMPT = PromptTemplate.from_template("""You are a player of 20 questions game. The host has generated a secret topic for the game. 
             Your task is to make a guess of the topic based on the answer from the host.
             You should observe the conversation history as {messages} and the answer from the host to make a guess.
             If you found you made a guess in the past, you should not make the same guess again.
@@ -65,37 +83,190 @@ def make_guess(messages):
             2. Please only return the name of the topic you guess, not any additional text. For example, you think the topic is "apple", you should return "apple". 
             Don't return "I think the topic is apple" or 'Is the topic apple?' or anything like that.
             3. You should not make the same guess twice! If you found you make a guess in the past, you should not make the same guess again.
-            """
+            """)
+
+GENERATE_TOPIC_PROMPT = PromptTemplate.from_template("""Generate a unique and commonly recognized name for a game of 20 questions. 
+            The topic should be a single object or living thing from any of the following categories: 
+            animals, plants, places, daily-life items, or famous individuals or characters from movies, TV shows, books, or history. 
+            Please provide just one name randomly selected from these categories, without any additional text or explanation.
+
+            You can also reference or be inspired by the following list of topics to help you generate a topic:
+            {sample_reference_topics}""")
+
+ANSWER_QUESTION_PROMPT = PromptTemplate.from_template("""You are a host of 20 questions game. You already come up with a secret topic given as {topic}. 
+            The player will ask a YES-or-NO type question to guess the topic. 
+            The question is given as {question}.
+
+            Your task is to simply answer with "YES" or "NO" regrading to the question in terms of the topic. 
+            Please only return "YES" or "NO", not any additional text! 
+            """)
+
+CHECK_GUESS_PROMPT = PromptTemplate.from_template("""You are a host of 20 questions game. The secret topic is {topic}. 
+            The player guessed {guess}.
+
+            Your task is to tell if the guess names the same thing as the topic, e.g. a synonym or another common name of it. 
+            Please only return "YES" or "NO", not any additional text! 
+            """)
+
+
+# The prompt templates and chains are built once and shared by all games. The chains are built when a tool
+# first runs, so that importing the tools doesn't create the LLM clients.
+CHAIN_PROMPTS = {
+    "generate_question_chain": (GENERATE_QUESTION_PROMPT, "player"),
+    "make_guess_chain": (MAKE_GUESS_PROMPT, "player"),
+    "generate_topic_chain": (GENERATE_TOPIC_PROMPT, "host"),
+    "answer_question_chain": (ANSWER_QUESTION_PROMPT, "host"),
+    "check_guess_chain": (CHECK_GUESS_PROMPT, "host"),
+}
+_chains = {}
+
+def get_chain(name):
+    """Return the chain of a tool's prompt and the LLM of its role, building it on first use.
+
+    Args:
+        name (str): One of CHAIN_PROMPTS
+
+    Returns:
+        the chain
+    """
+    chain = _chains.get(name)
+    if chain is None:
+        prompt, role = CHAIN_PROMPTS[name]
+        host_llm, player_llm = get_llms()
+        chain = _chains[name] = prompt | (host_llm if role == "host" else player_llm)
+    return chain
+
+def __getattr__(name):
+    # the chains and the reference topics stay available as module attributes
+    if name in CHAIN_PROMPTS:
+        return get_chain(name)
+    if name == "all_reference_topics":
+        return list(reference_topics())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# The player's question or guess is already written when the player node produced it in a single
+# structured-output call (fused player mode). It is injected from the state and is not visible to the LLM.
+PlayerResponse = Annotated[str, InjectedState("player_response")]
+
+
+async def agenerate_question(messages, player_response: PlayerResponse = ""):
+    if player_response:
+        return player_response
+    response = await ainvoke_chain(get_chain("generate_question_chain"), {"messages": messages})
+    return response.content
+
+@tool_with_coroutine(agenerate_question)
+def generate_question(messages, player_response: PlayerResponse = ""):
+    """For player to generate a YES-or-NO type question to ask the host to help guess the topic. 
+    It takes the conversation history to help formulate the question."""
     
-    query_prompt = PromptTemplate.from_template(PROMPT)
-    chain = query_prompt | player_llm
-    response = chain.invoke({"messages": messages})
+    if player_response:
+        return player_response
+    response = invoke_chain(get_chain("generate_question_chain"), {"messages": messages})
+    return response.content
+
+
+async def amake_guess(messages, player_response: PlayerResponse = ""):
+    if player_response:
+        return player_response
+    response = await ainvoke_chain(get_chain("make_guess_chain"), {"messages": messages})
+    return response.content
+
+@tool_with_coroutine(amake_guess)
+def make_guess(messages, player_response: PlayerResponse = ""):
+    """For the player to make a guess of the topic if the player feels confident about the guessing topic.
+    It takes the conversation history to help make the guess."""
+
+    if player_response:
+        return player_response
+    response = invoke_chain(get_chain("make_guess_chain"), {"messages": messages})
     return response.content
 
 
-@tool
-def generate_topic(task_for_host: str):
+def sample_reference_topics(config=None, k=5):
+    """Sample the reference topics shown to the host when it generates a topic.
+
+    The sample is drawn from a generator seeded by the game's "seed" when the run config has one,
+    so that a seeded game sends the same prompts every time it is played (see utils/cassette.py).
+
+    Args:
+        config (RunnableConfig): Config of the run, or None
+        k (int): Number of reference topics
+
+    Returns:
+        list: the sampled reference topics
+    """
+    seed = (config or {}).get("configurable", {}).get("seed")
+    rng = random if seed is None else random.Random(seed)
+    return rng.sample(reference_topics(), k)
+
+
+async def agenerate_topic(task_for_host: str, config: RunnableConfig):
+    if task_for_host != "generate_topic":
+        raise ValueError("This tool should only be used when the task is to generate a topic.")
+
+    response = await ainvoke_chain(get_chain("generate_topic_chain"), {"sample_reference_topics": sample_reference_topics(config)})
+    return response.content
+
+@tool_with_coroutine(agenerate_topic)
+def generate_topic(task_for_host: str, config: RunnableConfig):
     """For the host to come up with a topic for the player to guess only when the topic is not generated yet. 
     If the task_for_host is not "generate_topic", you should not use this tool."""
 
     if task_for_host != "generate_topic":
         raise ValueError("This tool should only be used when the task is to generate a topic.")
+
+    response = invoke_chain(get_chain("generate_topic_chain"), {"sample_reference_topics": sample_reference_topics(config)})
+    return response.content
+
+
+# The cache of answer_question, disabled until enable_answer_cache is called
+answer_cache = None
+
+def enable_answer_cache(path=None, max_entries=10_000, max_disk_entries=1_000_000):
+    """Cache the host's answers by topic and normalized question.
+
+    The host answers at temperature 0, so the answer to a (topic, question) pair is effectively deterministic.
+    The cache is versioned by the host model and the answer prompt.
     
-    PROMPT = """Generate a unique and commonly recognized name for a game of 20 questions. 
-            The topic should be a single object or living thing from any of the following categories: 
-            animals, plants, places, daily-life items, or famous individuals or characters from movies, TV shows, books, or history. 
-            Please provide just one name randomly selected from these categories, without any additional text or explanation.
+    Args:
+        path (str): Path to the SQLite file shared by threads and processes, or None for memory only
+        max_entries (int): Size of the in-memory LRU
+        max_disk_entries (int): Size of the on-disk store
 
-            You can also reference or be inspired by the following list of topics to help you generate a topic:
-            {sample_reference_topics}"""
+    Returns:
+        AnswerCache: the enabled cache
+    """
+    global answer_cache
+    prompt_hash = hashlib.sha256(ANSWER_QUESTION_PROMPT.template.encode()).hexdigest()[:16]
+    namespace = f"{get_llms()[0].model_name}:{prompt_hash}"
+    answer_cache = AnswerCache(path, namespace, max_entries, max_disk_entries)
+    return answer_cache
 
-    query_prompt = PromptTemplate.from_template(PROMPT)
-    sample_reference_topics = random.sample(all_reference_topics, 5)
-    chain = query_prompt | host_llm
-    response = chain.invoke({"sample_reference_topics": sample_reference_topics})
+def disable_answer_cache():
+    global answer_cache
+    answer_cache = None
+
+
+async def aanswer_question(topic: str, question: str, task_for_host: str):
+    if task_for_host != "answer_question":
+        raise ValueError("This tool should only be used when the task is to answer a question.")
+
+    cache = answer_cache
+    if cache:
+        answer = cache.get(topic, question)
+        if answer is not None:
+            emit_metric("answer_cache_hit")
+            return answer
+        emit_metric("answer_cache_miss")
+
+    response = await ainvoke_chain(get_chain("answer_question_chain"), {"topic": topic, "question": question})
+    if cache:
+        cache.put(topic, question, response.content)
     return response.content
 
-@tool
+@tool_with_coroutine(aanswer_question)
 def answer_question(topic: str, question: str, task_for_host: str):
     """For the host to answer the YES-or-NO type question from the player.
     It takes the topic and the question to answer the question.
@@ -104,33 +275,64 @@ def answer_question(topic: str, question: str, task_for_host: str):
     if task_for_host != "answer_question":
         raise ValueError("This tool should only be used when the task is to answer a question.")
     
-    PROMPT = """You are a host of 20 questions game. You already come up with a secret topic given as {topic}. 
-            The player will ask a YES-or-NO type question to guess the topic. 
-            The question is given as {question}.
+    cache = answer_cache
+    if cache:
+        answer = cache.get(topic, question)
+        if answer is not None:
+            emit_metric("answer_cache_hit")
+            return answer
+        emit_metric("answer_cache_miss")
 
-            Your task is to simply answer with "YES" or "NO" regrading to the question in terms of the topic. 
-            Please only return "YES" or "NO", not any additional text! 
-            """
-    
-    query_prompt = PromptTemplate.from_template(PROMPT)
-    chain = query_prompt | host_llm
-    response = chain.invoke({"topic": topic, "question": question})
+    response = invoke_chain(get_chain("answer_question_chain"), {"topic": topic, "question": question})
+    if cache:
+        cache.put(topic, question, response.content)
     return response.content
 
-@tool
+
+def _guess_reply(correct):
+    if correct:
+        return "Congratulations, you are right!"
+    else:
+        return "Sorry, you are wrong. Please ask another question."
+
+def _llm_verdict(matcher, topic, guess, response):
+    emit_metric("guess_llm_check")
+    verdict = response.content.strip().upper().startswith("YES")
+    matcher.remember(topic, guess, verdict)
+    return verdict
+
+def _check_guess(topic: str, guess: str, task_for_host: str):
+    if task_for_host != "check_guess":
+        raise ValueError("This tool should only be used when the task is to check a guess.")
+
+    # the matcher tells most guesses apart, the host LLM only judges the guesses it can't tell
+    from utils.matching import get_matcher
+    matcher = get_matcher()
+    verdict = matcher.verdict(topic, guess)
+    if verdict is None:
+        response = invoke_chain(get_chain("check_guess_chain"), {"topic": topic, "guess": guess})
+        verdict = _llm_verdict(matcher, topic, guess, response)
+    return _guess_reply(verdict)
+
+async def acheck_guess(topic: str, guess: str, task_for_host: str):
+    if task_for_host != "check_guess":
+        raise ValueError("This tool should only be used when the task is to check a guess.")
+
+    from utils.matching import get_matcher
+    matcher = get_matcher()
+    verdict = matcher.verdict(topic, guess)
+    if verdict is None:
+        response = await ainvoke_chain(get_chain("check_guess_chain"), {"topic": topic, "guess": guess})
+        verdict = _llm_verdict(matcher, topic, guess, response)
+    return _guess_reply(verdict)
+
+@tool_with_coroutine(acheck_guess)
 def check_guess(topic: str, guess: str, task_for_host: str):
     """For the host to check if the player's guess is correct. 
     Only use this tool if the player has made a guess in a declarative statement.
     If the task_for_host is not "check_guess", you should not use this tool."""
 
-    if task_for_host != "check_guess":
-        raise ValueError("This tool should only be used when the task is to check a guess.")
-
-    # Alternative: use LLM approach to check if the guess is correct (NOT IMPLEMENTED YET)
-    if topic.lower() in guess.lower():
-        return "Congratulations, you are right!"
-    else:
-        return "Sorry, you are wrong. Please ask another question."
+    return _check_guess(topic, guess, task_for_host)
 
 
 host_tools = [
@@ -0,0 +1,220 @@
+"""
+Topic pools and the scheduler handing their topics out to the games of a tournament.
+
+A pool is built once, offline, from the reference topics CSV or by batched LLM calls, and stored as JSON:
+
+    python -m utils.topics --source csv --output topics/things.json
+    python -m utils.topics --source llm --size 200 --output topics/llm.json
+
+Games given a topic from the pool skip the host's generate_topic call and start with the player's turn.
+"""
+import json
+import os
+import random
+import re
+import threading
+
+# the categories of GENERATE_TOPIC_PROMPT, the strata of the pools generated by the LLM
+TOPIC_CATEGORIES = ("animals", "plants", "places", "daily-life items", "famous individuals or characters")
+
+POOL_TOPIC_PROMPT = """Generate a unique and commonly recognized name for a game of 20 questions.
+            The topic should be a single object or living thing from the following category: {category}.
+            Please provide just one name, without any additional text or explanation.
+
+            You can also reference or be inspired by the following list of topics to help you generate a topic:
+            {sample_reference_topics}"""
+
+
+def normalize_topic(topic):
+    """ Lowercase, collapse whitespace and drop surrounding quotes and trailing punctuation, to find duplicates """
+    topic = re.sub(r"\s+", " ", topic.strip().lower())
+    return topic.strip("\"'").rstrip(".! ")
+
+
+def deduplicate(entries):
+    """ Keep the first of the entries whose topics are the same after normalize_topic, and drop empty topics """
+    seen = set()
+    unique = []
+    for entry in entries:
+        key = normalize_topic(entry["topic"])
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(entry)
+    return unique
+
+
+def pool_from_csv(path=None, default_category="things"):
+    """
+    Build a pool from a CSV in the layout of data/reference_things.csv. A "category" column, if there
+    is one, gives the strata of the pool, otherwise every topic is in default_category.
+
+    -- arguments:
+        path: the CSV, the reference topics of the tools by default
+        default_category: the category of the topics without one
+    """
+    import csv
+    if path is None:
+        from utils.tools import REFERENCE_TOPICS_FILEPATH
+        path = REFERENCE_TOPICS_FILEPATH
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        category = header.index("category") if "category" in header else None
+        entries = [{"topic": row[1].strip(), "category": row[category] if category is not None else default_category}
+                   for row in reader]
+    return {"source": "csv", "topics": deduplicate(entries)}
+
+
+def generate_topic_pool(size, llm=None, categories=TOPIC_CATEGORIES, batch_size=16, seed=0, max_rounds=None):
+    """
+    Build a pool of about size topics with batched LLM calls, the same number for every category. Each
+    call shows a different seeded sample of reference topics, so that the answers differ. Generation stops
+    after max_rounds batches even if duplicates kept the pool short.
+
+    -- arguments:
+        size: the number of topics
+        llm: the chat model, the host's by default
+        categories: the categories, the strata of the pool
+        batch_size: the number of calls sent in one batch
+        seed: the seed of the reference samples
+        max_rounds: the maximum number of batches, 4 * size / batch_size by default
+    """
+    from langchain_core.prompts import PromptTemplate
+    from utils.llm import get_llms
+    from utils.tools import reference_topics
+
+    chain = PromptTemplate.from_template(POOL_TOPIC_PROMPT) | (llm or get_llms()[0])
+    rng = random.Random(seed)
+    per_category = -(-size // len(categories))
+    max_rounds = max_rounds or max(1, 4 * -(-size // batch_size))
+
+    entries = []
+    counts = dict.fromkeys(categories, 0)
+    for _ in range(max_rounds):
+        missing = [c for c in categories if counts[c] < per_category]
+        if not missing:
+            break
+        batch = [missing[i % len(missing)] for i in range(batch_size)]
+        inputs = [{"category": c, "sample_reference_topics": rng.sample(reference_topics(), 5)} for c in batch]
+        responses = chain.batch(inputs, config={"max_concurrency": batch_size})
+        for category, response in zip(batch, responses):
+            entries.append({"topic": response.content.strip(), "category": category})
+        entries = deduplicate(entries)
+        counts = dict.fromkeys(categories, 0)
+        for entry in entries:
+            counts[entry["category"]] += 1
+
+    kept = []
+    counts = dict.fromkeys(categories, 0)
+    for entry in entries:
+        if counts[entry["category"]] < per_category:
+            counts[entry["category"]] += 1
+            kept.append(entry)
+    return {"source": "llm", "topics": kept}
+
+
+def save_topic_pool(pool, path):
+    """ Write the pool to a JSON file, atomically so that workers never read half a pool """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(pool, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_topic_pool(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class TopicScheduler:
+    """
+    Hand out the topics of a pool to games. The topics are dealt in cycles: within a cycle every topic is
+    used once, in an order which is shuffled within each category and interleaves the categories in
+    proportion to their sizes, so any run of games covers the categories evenly. The next cycle is shuffled
+    anew.
+
+    The topic of a game only depends on the seed and the game's index, so processes need no coordination:
+    each gives its games indices of its own (see tournament.run_worker) and the coverage of a run is
+    reproducible from its seed. next_topic hands out the indices of one process from a thread-safe counter.
+
+    -- arguments:
+        pool: the pool, see load_topic_pool
+        seed: the seed of the order
+    """
+
+    def __init__(self, pool, seed=0):
+        entries = deduplicate(pool["topics"])
+        if not entries:
+            raise ValueError("The topic pool is empty")
+        self.seed = seed
+        self.strata = {}
+        for entry in entries:
+            self.strata.setdefault(entry.get("category") or "", []).append(entry["topic"])
+        self.size = len(entries)
+        self._next_index = 0
+        self._cycles = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _cycle(self, cycle):
+        """ The order of the topics in a cycle, kept for the last cycles used """
+        with self._lock:
+            order = self._cycles.get(cycle)
+        if order is None:
+            order = self._shuffle(cycle)
+            with self._lock:
+                self._cycles[cycle] = order
+                if len(self._cycles) > 4:
+                    self._cycles.pop(min(self._cycles))
+        return order
+
+    def _shuffle(self, cycle):
+        shuffled = {}
+        for category, topics in sorted(self.strata.items()):
+            topics = list(topics)
+            random.Random(f"{self.seed}-{cycle}-{category}").shuffle(topics)
+            shuffled[category] = topics
+
+        # the next topic comes from the category furthest behind its share of the cycle
+        order = []
+        taken = dict.fromkeys(shuffled, 0)
+        for position in range(1, self.size + 1):
+            category = max(shuffled, key=lambda c: position * len(shuffled[c]) / self.size - taken[c])
+            order.append(shuffled[category][taken[category]])
+            taken[category] += 1
+        return tuple(order)
+
+    def topic(self, index):
+        """ The topic of the game with the given index """
+        cycle, position = divmod(index, self.size)
+        return self._cycle(cycle)[position]
+
+    def next_topic(self):
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+        return self.topic(index)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a deduplicated topic pool for tournaments")
+    parser.add_argument("--source", choices=["csv", "llm"], default="csv",
+                        help="take the topics from the reference CSV, or generate them with the host LLM")
+    parser.add_argument("--csv", default=None, help="the CSV of --source csv, data/reference_things.csv by default")
+    parser.add_argument("--size", type=int, default=100, help="number of topics generated with --source llm")
+    parser.add_argument("--batch-size", type=int, default=16, help="number of LLM calls sent in one batch")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the reference samples shown to the LLM")
+    parser.add_argument("--output", required=True, help="the JSON file of the pool")
+    args = parser.parse_args()
+
+    if args.source == "csv":
+        pool = pool_from_csv(args.csv)
+    else:
+        pool = generate_topic_pool(args.size, batch_size=args.batch_size, seed=args.seed)
+    save_topic_pool(pool, args.output)
+    print(f"{len(pool['topics'])} topics written to {args.output}")
@@ -0,0 +1,74 @@
+class NodeOrderValidator:
+    """
+    Streaming check of the order in which the graph updates its nodes. Every turn follows
+
+        host -> call_tool -> host -> player -> call_tool -> player -> host ...
+
+    i.e. an agent picks a tool, the tool runs and the same agent handles the tool's result, then the
+    other agent takes its turn. Only the new transition is checked for each update, so a game costs
+    O(1) per node, and only violations are logged, plus one summary at the end of the game.
+
+    After a violation the validator resynchronizes on the observed node: it keeps every state the
+    node could have led to, so one out-of-order update is counted once instead of for every
+    following node.
+
+    -- arguments:
+        logger: the ExperimentLogger of the game, nothing is logged if None
+    """
+
+    # state -> {node: next state}, the states tell which agent acts and in which step of its turn
+    TRANSITIONS = {
+        "start": {"host": "host_called"},
+        "host_called": {"call_tool": "host_tool_done"},
+        "host_tool_done": {"host": "host_done"},
+        "host_done": {"player": "player_called"},
+        "player_called": {"call_tool": "player_tool_done"},
+        "player_tool_done": {"player": "player_done"},
+        "player_done": {"host": "host_called"},
+    }
+    # a game ends after an agent has handled the result of its tool
+    END_STATES = ("host_done", "player_done")
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.states = ("start",)
+        self.num_updates = 0
+        self.violations = 0
+
+    def update(self, node):
+        """ Check the transition to node, returns True if it is legal """
+        states = tuple(self.TRANSITIONS[s][node] for s in self.states if node in self.TRANSITIONS[s])
+        legal = bool(states)
+        if not legal:
+            self.violations += 1
+            if self.logger:
+                expected = sorted({n for s in self.states for n in self.TRANSITIONS[s]})
+                self.logger.log(
+                    "Invalid node order: %s at index %s after state %s, expected one of %s",
+                    node, self.num_updates, "/".join(self.states), expected, level="error"
+                )
+            states = tuple(t[node] for t in self.TRANSITIONS.values() if node in t)
+
+        self.states = states
+        self.num_updates += 1
+        return legal
+
+    def resume(self, next_node):
+        """ Continue a resumed game whose next update is next_node, without checking the updates before it """
+        self.states = tuple(s for s, transitions in self.TRANSITIONS.items() if next_node in transitions)
+
+    def summary(self):
+        return {
+            "node_updates": self.num_updates,
+            "node_order_violations": self.violations,
+            "final_state": "/".join(self.states),
+            "ended_after_turn": any(s in self.END_STATES for s in self.states),
+        }
+
+    def finish(self):
+        """ Log the summary of the game, at error level if anything went wrong """
+        summary = self.summary()
+        if self.logger:
+            clean = not self.violations and summary["ended_after_turn"]
+            self.logger.event("node_order", level="info" if clean else "error", **summary)
+        return summary